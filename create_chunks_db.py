@@ -1,4 +1,5 @@
 import os
+import sys
 import sqlite3
 import json
 
@@ -7,6 +8,9 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_FILE = os.path.join(BASE_DIR, "chunks.db")
 METADATA_FILE = os.path.join(BASE_DIR, "metadata.json")
 
+sys.path.insert(0, os.path.join(BASE_DIR, "scripts"))
+from chunk_store import create_chunk_store, insert_chunks
+
 # --- Load metadata ---
 with open(METADATA_FILE, "r", encoding="utf-8") as f:
     chunks = json.load(f)
@@ -17,13 +21,23 @@ c = conn.cursor()
 
 # --- Create FTS5 table ---
 # Avoid 'rank' since it's reserved; use 'rank_val' instead
-c.execute("CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING FTS5(pdf, text, rank_val UNINDEXED)")
+c.execute("DROP TABLE IF EXISTS chunks")
+c.execute("CREATE VIRTUAL TABLE chunks USING FTS5(pdf, text, rank_val UNINDEXED)")
+
+# --- Chunk metadata store (read by ask_api.py instead of metadata.json) ---
+c.execute("DROP TABLE IF EXISTS chunk_meta")
+create_chunk_store(conn)
+insert_chunks(conn, chunks)
+# Near-duplicate signatures kept by scripts/ingest.py describe the old rows; it re-signs on its next run
+c.execute("DROP TABLE IF EXISTS dedup_signatures")
+c.execute("DROP TABLE IF EXISTS dedup_buckets")
 
 # --- Insert chunks with unique numbered PDF-like names ---
 pdf_chunk_counters = {}  # track chunk numbers per PDF
 
-for i, chunk in enumerate(chunks):
-    rank_val = i + 1
+for chunk in chunks:
+    # rowid and rank_val both hold the chunk_id so FTS hits join back to FAISS/metadata
+    rank_val = chunk['chunk_id']
     pdf_name = chunk['pdf']
 
     # Initialize counter if first chunk for this PDF
@@ -36,8 +50,8 @@ for i, chunk in enumerate(chunks):
     numbered_pdf_name = f"{os.path.splitext(pdf_name)[0]}_chunk{pdf_chunk_counters[pdf_name]}.pdf"
 
     c.execute(
-        "INSERT INTO chunks (pdf, text, rank_val) VALUES (?, ?, ?)",
-        (numbered_pdf_name, chunk['text'], rank_val)
+        "INSERT INTO chunks (rowid, pdf, text, rank_val) VALUES (?, ?, ?, ?)",
+        (rank_val, numbered_pdf_name, chunk['text'], rank_val)
     )
 
 conn.commit()
@@ -0,0 +1,39 @@
+# gunicorn.conf.py - multi-worker serving with shared read-only memory
+#     gunicorn -c gunicorn.conf.py scripts.ask_api:app
+# The app is imported once in the parent (preload_app) with the FAISS index memory-mapped
+# and the model weights loaded, then forked: workers share those pages copy-on-write.
+# chunks.db is read through SQLite's mmap, so its pages are shared via the page cache.
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts"))
+from metrics import memory_usage
+
+os.environ.setdefault("FAISS_MMAP", "1")
+os.environ["PRELOAD"] = "1"
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.environ.get("WORKER_TIMEOUT", "120"))
+
+
+def report(label):
+    mem = memory_usage()
+    if mem:
+        print(f"[MEMORY] {label} pid {os.getpid()}: rss {mem['rss_mb']:.0f} MB = shared {mem['shared_mb']:.0f} MB"
+              f" + private {mem['private_mb']:.0f} MB (pss {mem['pss_mb']:.0f} MB)")
+
+
+def when_ready(server):
+    report("parent after preload")
+
+
+def post_fork(server, worker):
+    # One worker per core: keep each worker's torch / onnxruntime pools from using every core
+    threads = int(os.environ.get("WORKER_THREADS", str(max(1, (os.cpu_count() or 1) // workers))))
+    os.environ.setdefault("ONNX_THREADS", str(threads))
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+    # Per-worker shared vs private memory is printed by ask_api.warm_up() once the worker is ready
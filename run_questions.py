@@ -1,51 +1,287 @@
+# run_questions.py - async load generator for /ask (and the /ask/batch client)
+#     python run_questions.py                                   # closed loop, 4 users, one pass over questions x modes
+#     python run_questions.py --users 16 --rounds 20            # closed loop, 16 concurrent users
+#     python run_questions.py --load open --rate 50 --duration 60   # open loop, 50 req/s for a minute
+#     python run_questions.py --batch                           # one streamed /ask/batch request
+# Latency is measured from when a request was *scheduled* to go out, not when it did
+# (coordinated omission): in open loop every request has a fixed arrival time, so a
+# stalled server is charged for the requests that queued behind it; in closed loop the
+# same holds when --rate paces the users. Service time (send -> response) is reported too.
+# The first answer per question and mode is written to results.json in the usual format.
+import argparse
+import asyncio
+import itertools
 import json
-import requests
+import math
+import textwrap
 import time
 
+import httpx
+
 # --- Config ---
-API_URL = "http://127.0.0.1:8000/ask"
+API_URL = "http://127.0.0.1:8000"
 QUESTIONS_FILE = "questions.json"
 RESULTS_FILE = "results.json"
 K = 5                   # number of top chunks
 MODES = ["baseline", "hybrid", "learned"]  # all modes
-RETRY_DELAY = 2          # seconds to wait before retrying
+RETRY_DELAY = 2          # seconds to wait before retrying (unless the server sends Retry-After)
 MAX_RETRIES = 3
+TIMEOUT = 60             # seconds per request (between streamed lines for --batch)
+
+
+# --- Latency histogram ---
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram (HdrHistogram-style): bucket edges grow by `precision`
+    (1% by default) from min_ms, so percentiles are within that relative error and memory
+    stays constant however long the run.
+    """
+
+    def __init__(self, min_ms: float = 0.01, precision: float = 0.01):
+        self.min_ms = min_ms
+        self.log_base = math.log1p(precision)
+        self.counts = {}
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, ms: float) -> None:
+        bucket = max(0, int(math.log(max(ms, self.min_ms) / self.min_ms) / self.log_base))
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.n += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, p: float) -> float:
+        if not self.n:
+            return 0.0
+        rank, seen = p / 100.0 * self.n, 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(self.min_ms * math.exp((bucket + 1) * self.log_base), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {"n": self.n, "mean": self.total / self.n if self.n else 0.0,
+                **{f"p{p:g}": self.percentile(p) for p in (50, 90, 99, 99.9)}, "max": self.max}
+
+    def buckets(self) -> list:
+        """[[upper_edge_ms, count], ...] for the non-empty buckets."""
+        return [[self.min_ms * math.exp((b + 1) * self.log_base), self.counts[b]] for b in sorted(self.counts)]
+
+
+class ModeStats:
+    def __init__(self):
+        self.response = LatencyHistogram()  # scheduled time -> response (coordinated-omission corrected)
+        self.service = LatencyHistogram()   # actual send -> response
+        self.errors = 0
+        self.retries = 0
+
+    def summary(self, wall_s: float) -> dict:
+        return {"response_ms": self.response.summary(), "service_ms": self.service.summary(),
+                "errors": self.errors, "retries": self.retries,
+                "throughput_rps": self.response.n / wall_s if wall_s else 0.0,
+                "response_histogram": self.response.buckets()}
+
+
+def failed(question_text, error, modes=MODES):
+    results = {mode: {"answer": None, "contexts": [], "reranker_used": mode, "error": error} for mode in modes}
+    return {"question": question_text, "results": results}
+
 
-# --- Load questions ---
-with open(QUESTIONS_FILE, "r", encoding="utf-8") as f:
-    questions = json.load(f)
+def write_results(path, rows):
+    with open(path, "w", encoding="utf-8") as out:
+        out.write("[\n" + ",\n".join(textwrap.indent(json.dumps(row, indent=2, ensure_ascii=False), "  ")
+                                     for row in rows) + "\n]\n" if rows else "[]\n")
 
-results = []
 
-for q in questions:
-    question_text = q.get("q")
-    question_result = {"question": question_text, "results": {}}
+# --- /ask load ---
+class LoadRun:
+    def __init__(self, client, questions, modes, k):
+        self.client = client
+        self.questions = questions
+        self.modes = modes
+        self.k = k
+        self.stats = {mode: ModeStats() for mode in modes}
+        self.answers = {}  # (question, mode) -> first successful /ask response
+        self.last_error = {}
 
-    for mode in MODES:
-        attempt = 0
-        success = False
-        while attempt < MAX_RETRIES and not success:
+    async def ask(self, question, mode, scheduled):
+        """One /ask call, retried on 503 / connection errors; latency counted from `scheduled`."""
+        stats = self.stats[mode]
+        sent = time.perf_counter()
+        for attempt in range(MAX_RETRIES):
+            delay = RETRY_DELAY
             try:
-                resp = requests.post(API_URL, json={"q": question_text, "k": K, "mode": mode}, timeout=10)
-                resp.raise_for_status()
-                data = resp.json()
-                question_result["results"][mode] = data
-                print(f"Done: {question_text} ({mode})")
-                success = True
-            except requests.exceptions.RequestException as e:
+                resp = await self.client.post("/ask", json={"q": question, "k": self.k, "mode": mode})
+                if resp.status_code != 503:
+                    resp.raise_for_status()
+                    break
+                # Admission control rejected it: back off as the server asks, the clock keeps running
+                delay = float(resp.headers.get("Retry-After", RETRY_DELAY))
+                error = "503 Server busy"
+            except httpx.HTTPError as e:
+                error = f"{type(e).__name__}: {e}"
+            if attempt + 1 < MAX_RETRIES:
+                stats.retries += 1
+                await asyncio.sleep(delay)
+        else:
+            stats.errors += 1
+            self.last_error[(question, mode)] = error
+            return
+        done = time.perf_counter()
+        stats.response.record(1000.0 * (done - scheduled))
+        stats.service.record(1000.0 * (done - sent))
+        self.answers.setdefault((question, mode), resp.json())
+
+    def work(self, rounds, duration):
+        """(question, mode) pairs in order, `rounds` times, or repeated without end with --duration."""
+        pairs = [(q, m) for q in self.questions for m in self.modes]
+        return itertools.cycle(pairs) if duration else itertools.chain.from_iterable(itertools.repeat(pairs, rounds))
+
+    async def open_loop(self, rate, rounds, duration):
+        """Fixed arrival rate: request i is due at start + i/rate whether or not earlier ones returned."""
+        start = time.perf_counter()
+        tasks = []
+        for i, (question, mode) in enumerate(self.work(rounds, duration)):
+            scheduled = start + i / rate
+            if duration and scheduled - start >= duration:
+                break
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+            tasks.append(asyncio.create_task(self.ask(question, mode, scheduled)))
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - start
+
+    async def closed_loop(self, users, rate, rounds, duration):
+        """
+        `users` concurrent clients, each sending its next request when the previous one returns.
+        With a rate, request i is due at start + i/rate; a user that is late sends at once and
+        the lateness counts as latency. Without one, latency starts at the actual send.
+        """
+        start = time.perf_counter()
+        work = enumerate(self.work(rounds, duration))
+
+        async def user():
+            for i, (question, mode) in work:  # shared iterator: each item is taken by one user
+                now = time.perf_counter()
+                if duration and now - start >= duration:
+                    return
+                scheduled = start + i / rate if rate else now
+                if scheduled > now:
+                    await asyncio.sleep(scheduled - now)
+                await self.ask(question, mode, scheduled)
+
+        await asyncio.gather(*(user() for _ in range(users)))
+        return time.perf_counter() - start
+
+    def results(self):
+        rows = []
+        for question in self.questions:
+            results = {}
+            for mode in self.modes:
+                answer = self.answers.get((question, mode))
+                results[mode] = answer if answer is not None else \
+                    failed(question, self.last_error.get((question, mode), "not sent"), [mode])["results"][mode]
+            rows.append({"question": question, "results": results})
+        return rows
+
+
+def print_summary(summary):
+    print(f"\n{summary['load']} loop, {summary['wall_s']:.1f} s"
+          + (f", target {summary['rate']:g} req/s" if summary.get("rate") else "")
+          + (f", {summary['users']} users" if summary.get("users") else ""))
+    print(f"{'mode':<10}{'n':>7}{'err':>6}{'req/s':>8}{'p50':>9}{'p90':>9}{'p99':>9}{'p99.9':>9}{'max':>9}   (ms, response; service p50/p99)")
+    for mode, s in summary["modes"].items():
+        r, sv = s["response_ms"], s["service_ms"]
+        print(f"{mode:<10}{r['n']:>7}{s['errors']:>6}{s['throughput_rps']:>8.1f}{r['p50']:>9.1f}{r['p90']:>9.1f}"
+              f"{r['p99']:>9.1f}{r['p99.9']:>9.1f}{r['max']:>9.1f}   {sv['p50']:.1f}/{sv['p99']:.1f}")
+
+
+async def run_load(args, questions):
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    # pool=None: a request waiting for a free connection is queued (and timed), not failed
+    timeout = httpx.Timeout(TIMEOUT, pool=None)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=timeout) as client:
+        run = LoadRun(client, questions, args.modes, args.k)
+        if args.load == "open":
+            wall = await run.open_loop(args.rate, args.rounds, args.duration)
+        else:
+            wall = await run.closed_loop(args.users, args.rate, args.rounds, args.duration)
+    summary = {"load": args.load, "rate": args.rate, "users": args.users if args.load == "closed" else None,
+               "wall_s": wall, "modes": {mode: s.summary(wall) for mode, s in run.stats.items()}}
+    return run.results(), summary
+
+
+# --- /ask/batch: one streamed request, retrying only the questions that failed ---
+async def run_batch(args, questions):
+    rows = []
+    pending = list(questions)
+    attempt = 0
+    async with httpx.AsyncClient(base_url=args.url, timeout=TIMEOUT) as client:
+        while pending:
+            try:
+                async with client.stream("POST", "/ask/batch",
+                                         json={"queries": pending, "k": args.k, "modes": args.modes}) as resp:
+                    resp.raise_for_status()
+                    async for line in resp.aiter_lines():
+                        if not line:
+                            continue
+                        question_result = json.loads(line)
+                        if "error" in question_result:
+                            # Server-side failure for this question (e.g. overloaded); retried below
+                            print(f"Error with question '{question_result['question']}': {question_result['error']}")
+                            continue
+                        rows.append(question_result)
+                        pending.remove(question_result["question"])
+                        print(f"Done: {question_result['question']}")
+                if pending:
+                    raise httpx.HTTPError(f"{len(pending)} questions not answered")
+            except httpx.HTTPError as e:
                 attempt += 1
-                print(f"Error with question '{question_text}' ({mode}): {e}")
+                print(f"Error with batch of {len(pending)} questions: {e}")
                 if attempt < MAX_RETRIES:
                     print(f"Retrying in {RETRY_DELAY} seconds... (Attempt {attempt}/{MAX_RETRIES})")
-                    time.sleep(RETRY_DELAY)
+                    await asyncio.sleep(RETRY_DELAY)
                 else:
-                    question_result["results"][mode] = {"answer": None, "contexts": [], "reranker_used": mode, "error": str(e)}
-                    print(f"Skipped after {MAX_RETRIES} attempts: {question_text} ({mode})")
+                    for question_text in pending:
+                        rows.append(failed(question_text, str(e), args.modes))
+                        print(f"Skipped after {MAX_RETRIES} attempts: {question_text}")
+                    pending = []
+    return rows
+
 
-    results.append(question_result)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test /ask (or run /ask/batch) over questions.json")
+    parser.add_argument("--url", default=API_URL)
+    parser.add_argument("--questions", default=QUESTIONS_FILE)
+    parser.add_argument("--results", default=RESULTS_FILE)
+    parser.add_argument("--modes", nargs="+", default=MODES)
+    parser.add_argument("--k", type=int, default=K)
+    parser.add_argument("--load", choices=["closed", "open"], default="closed")
+    parser.add_argument("--users", type=int, default=4, help="closed loop: concurrent users")
+    parser.add_argument("--rate", type=float, default=None, help="req/s; required for open loop, paces closed loop")
+    parser.add_argument("--rounds", type=int, default=1, help="passes over questions x modes")
+    parser.add_argument("--duration", type=float, default=None, help="seconds; repeat the questions until then (overrides --rounds)")
+    parser.add_argument("--connections", type=int, default=64, help="HTTP connection pool size")
+    parser.add_argument("--summary", default=None, help="also write the percentile summary (with histograms) as JSON")
+    parser.add_argument("--batch", action="store_true", help="send everything as one streamed /ask/batch request")
+    args = parser.parse_args()
+    if args.load == "open" and not args.rate:
+        parser.error("--load open needs --rate")
 
-# --- Save results ---
-with open(RESULTS_FILE, "w", encoding="utf-8") as f:
-    json.dump(results, f, indent=2, ensure_ascii=False)
+    # --- Load questions ---
+    with open(args.questions, "r", encoding="utf-8") as f:
+        questions = [q.get("q") for q in json.load(f)]
 
-print(f"All results saved to {RESULTS_FILE}")
+    if args.batch:
+        rows = asyncio.run(run_batch(args, questions))
+    else:
+        rows, summary = asyncio.run(run_load(args, questions))
+        print_summary(summary)
+        if args.summary:
+            with open(args.summary, "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=2)
+            print(f"Summary saved to {args.summary}")
+    write_results(args.results, rows)
+    print(f"All results saved to {args.results}")
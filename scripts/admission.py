@@ -0,0 +1,114 @@
+# scripts/admission.py
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+
+class Overloaded(Exception):
+    """The executor queue is full; the request was rejected without running."""
+
+
+class DeadlineExceeded(Exception):
+    """The request did not finish (or start) before its deadline."""
+
+
+# Returned by a job that started after its deadline
+_EXPIRED = object()
+
+
+class AdmissionController:
+    """
+    Run blocking work on a fixed-size thread pool with a bounded wait queue.
+
+    At most max_workers jobs run at once and at most max_queue more may wait;
+    anything beyond that is rejected immediately with Overloaded. Each job has a
+    deadline: the caller gets DeadlineExceeded when it passes, and a job still
+    waiting in the queue at that point is skipped instead of run.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 64, timeout_s: Optional[float] = 10.0):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout_s or None
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="search")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+
+        # --- Metrics ---
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.completed = 0
+        self.max_queue_seen = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+        self.total_run = 0.0
+
+    async def run(self, fn: Callable, *args, timeout_s: Optional[float] = None):
+        timeout = timeout_s or self.timeout
+        with self._lock:
+            if self._queued + self._running >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise Overloaded(f"{self._queued} requests queued, {self._running} running")
+            self._queued += 1
+            self.admitted += 1
+            self.max_queue_seen = max(self.max_queue_seen, self._queued)
+        enqueued = time.perf_counter()
+        deadline = enqueued + timeout if timeout else None
+        # Like asyncio.to_thread: the job sees the caller's contextvars (e.g. its stage trace)
+        ctx = contextvars.copy_context()
+        future = asyncio.get_running_loop().run_in_executor(
+            self._executor, ctx.run, self._call, fn, args, enqueued, deadline)
+        try:
+            # shield: on timeout the caller gives up, the worker thread is not interrupted
+            result = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            result = _EXPIRED
+        if result is _EXPIRED:
+            # The deadline passed, or the job reached a worker only after it had
+            with self._lock:
+                self.timed_out += 1
+            raise DeadlineExceeded(f"no result within {timeout:.1f}s")
+        return result
+
+    def _call(self, fn, args, enqueued, deadline):
+        start = time.perf_counter()
+        wait = start - enqueued
+        with self._lock:
+            self._queued -= 1
+            self.total_wait += wait
+            self.max_wait_seen = max(self.max_wait_seen, wait)
+            if deadline is not None and start >= deadline:
+                # Nobody is waiting for this result any more
+                return _EXPIRED
+            self._running += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self.completed += 1
+                self.total_run += time.perf_counter() - start
+
+    def stats(self) -> dict:
+        with self._lock:
+            started = self.admitted - self._queued
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "timeout_s": self.timeout,
+                "queue_depth": self._queued,
+                "running": self._running,
+                "max_queue_seen": self.max_queue_seen,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "completed": self.completed,
+                "avg_wait_ms": 1000.0 * self.total_wait / started if started else 0.0,
+                "max_wait_seen_ms": 1000.0 * self.max_wait_seen,
+                "avg_run_ms": 1000.0 * self.total_run / self.completed if self.completed else 0.0,
+            }
@@ -1,18 +1,39 @@
 #scripts/ask_api.py
+import time
+_import_start = time.perf_counter()
 import os
+import sys
 import json
 import sqlite3
-import faiss
+import threading
+import contextvars
+import hmac
+from contextlib import contextmanager
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException
 from pydantic import BaseModel
-import re
+from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from sklearn.linear_model import LogisticRegression
 import random
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from query_batcher import QueryBatcher
+from query_cache import LRUCache, FileWatcher, normalize_query
+from sqlite_pool import KEYWORD_FILTERED_SQL, KEYWORD_SQL, ReadOnlyConnectionPool, fts_match_expression
+from index_builder import prepare_vectors, read_index, selector_params, set_search_params
+from chunk_store import ChunkStore
+from metadata_index import MetadataIndex
+from shards import MANIFEST, open_coordinator, track_missing_shards
+from admission import AdmissionController, DeadlineExceeded, Overloaded
+from cross_encoder import CrossEncoderReranker
+from sentence_index import (SENTENCE_INFO_FILE, SENTENCE_META_FILE, SENTENCE_VECTORS_FILE, SentenceIndex,
+                            sentence_index_is_current)
+from metrics import SamplingProfiler, memory_usage, registry, stage, start_trace, submit_in_context
+from learned_reranker import (RERANKER_FILE, ChunkFeatureCache, feature_matrix, index_fingerprint,
+                              load_reranker, rerank)
 
 os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
 # -----------------------------
@@ -23,26 +44,324 @@ random.seed(42)
 # --- Paths ---
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__),".."))
 FAISS_INDEX = os.path.join(PROJECT_ROOT, "faiss_index.bin")
-METADATA_FILE = os.path.join(PROJECT_ROOT, "metadata.json")
 DB_FILE = os.path.join(PROJECT_ROOT, "chunks.db")
 UI_FILE = os.path.join(PROJECT_ROOT, "ui.html")
 
+# --- Sharded retrieval (scripts/shards.py): FAISS + FTS5 searches fan out, chunk text stays here ---
+# SHARDS=shards runs each shard in SHARD_WORKERS local processes; SHARD_URLS=http://...,http://...
+# uses HTTP shard workers instead. Shards slower than SHARD_TIMEOUT_MS are left out (partial answer).
+SHARDS_DIR = os.environ.get("SHARDS", "")
+SHARD_URLS = [u for u in os.environ.get("SHARD_URLS", "").split(",") if u.strip()]
+SHARD_TIMEOUT_MS = float(os.environ.get("SHARD_TIMEOUT_MS", "500"))
+SHARDED = bool(SHARDS_DIR or SHARD_URLS)
+if SHARDS_DIR:
+    SHARDS_DIR = os.path.join(PROJECT_ROOT, SHARDS_DIR)
+
+# Files the index is read from: fingerprinted for the learned reranker and watched for rebuilds.
+# Sharded, the shard manifest (rewritten by every build) stands in for faiss_index.bin; with
+# SHARD_URLS alone the vectors live elsewhere and only chunks.db is local.
+if not SHARDED:
+    INDEX_FILES = [FAISS_INDEX, DB_FILE]
+elif SHARDS_DIR:
+    INDEX_FILES = [os.path.join(SHARDS_DIR, MANIFEST), DB_FILE]
+else:
+    INDEX_FILES = [DB_FILE]
+
 # --- Check files exist ---
-for path in [FAISS_INDEX, METADATA_FILE, DB_FILE, UI_FILE]:
+for path in INDEX_FILES + [UI_FILE]:
     if not os.path.exists(path):
         raise FileNotFoundError(f"Required file not found: {path}")
 
-# --- Load FAISS index & metadata ---
-index = faiss.read_index(FAISS_INDEX)
-with open(METADATA_FILE, "r", encoding="utf-8") as f:
-    chunks = json.load(f)
+# --- Startup-time breakdown ---
+startup_timings = {"imports": 1000 * (time.perf_counter() - _import_start)}
+print(f"[STARTUP] imports: {startup_timings['imports']:.0f} ms")
+
+@contextmanager
+def startup_stage(name):
+    start = time.perf_counter()
+    yield
+    startup_timings[name] = 1000 * (time.perf_counter() - start)
+    print(f"[STARTUP] {name}: {startup_timings[name]:.0f} ms")
+
+# --- Heavy components load lazily on first use (or in the warm-up hook) ---
+_resources = {}
+_resource_locks = {}
+_resource_locks_guard = threading.Lock()
+_NOT_LOADED = object()  # loaders may return None for "not available", which is cached too
+
+def lazy_resource(name, loader):
+    res = _resources.get(name, _NOT_LOADED)
+    if res is _NOT_LOADED:
+        with _resource_locks_guard:
+            lock = _resource_locks.setdefault(name, threading.Lock())
+        with lock:
+            res = _resources.get(name, _NOT_LOADED)
+            if res is _NOT_LOADED:
+                with startup_stage(name):
+                    res = loader()
+                _resources[name] = res
+    return res
+
+# FAISS_MMAP=1 maps the vectors from faiss_index.bin instead of copying them into each worker
+FAISS_MMAP = os.environ.get("FAISS_MMAP", "0") == "1"
+
+def _load_index():
+    index, index_info = read_index(FAISS_INDEX, mmap=FAISS_MMAP)
+    # Query-time ANN knobs: env overrides the defaults saved by create_embeddings.py
+    set_search_params(
+        index,
+        nprobe=os.environ.get("FAISS_NPROBE") or index_info["search"].get("nprobe"),
+        ef_search=os.environ.get("FAISS_EF_SEARCH") or index_info["search"].get("ef_search"),
+    )
+    return index, index_info
+
+def get_index():
+    return lazy_resource("faiss_index", _load_index)
+
+def _load_shards():
+    coordinator = open_coordinator(SHARDS_DIR, SHARD_URLS, timeout_ms=SHARD_TIMEOUT_MS,
+                                   workers_per_shard=int(os.environ.get("SHARD_WORKERS", "1")))
+    print(f"[STARTUP] {len(coordinator.shards)} shards ({coordinator.info['index_type']}, {coordinator.info['metric']})")
+    return coordinator
+
+def get_shards():
+    return lazy_resource("shards", _load_shards)
+
+def get_index_info():
+    """index_type, metric, labels and ntotal of what is searched: faiss_index.bin, or all shards together."""
+    if SHARDED:
+        return get_shards().info
+    index, index_info = get_index()
+    return {**index_info, "ntotal": int(index.ntotal)}
 
 # --- Sentence Transformer model (CPU only) ---
-model = SentenceTransformer("all-MiniLM-L6-v2", device="cpu")
+# torch is the reference; onnx / onnx-int8 need `python scripts/onnx_runtime.py encoder [--quantize]`
+# (check them with scripts/encoder_parity.py before switching)
+ENCODER_BACKEND = os.environ.get("ENCODER_BACKEND", "torch")  # torch | onnx | onnx-int8
+
+def _load_model():
+    if ENCODER_BACKEND.startswith("onnx"):
+        from onnx_runtime import OnnxSentenceEncoder
+        return OnnxSentenceEncoder(quantized=ENCODER_BACKEND == "onnx-int8",
+                                   intra_op_threads=int(os.environ.get("ONNX_THREADS", "0")))
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer("all-MiniLM-L6-v2", device="cpu")
+
+def get_model():
+    return lazy_resource("model", _load_model)
+
+# --- Per-thread read-only connections to chunks.db (FTS5 index + chunk_meta store) ---
+fts_pool = ReadOnlyConnectionPool(DB_FILE)
+store = ChunkStore(fts_pool)
+
+def _check_store():
+    try:
+        return store.count()
+    except sqlite3.OperationalError:
+        raise RuntimeError(f"{DB_FILE} has no chunk_meta table; rebuild it with create_chunks_db.py")
+
+# --- Learned reranker: trained offline by `python scripts/learned_reranker.py` ---
+# Per-chunk features (position, first paragraph, length, term set) are cached across queries
+chunk_features = ChunkFeatureCache(store, maxsize=int(os.environ.get("FEATURE_CACHE_SIZE", "20000")))
+
+def _load_clf():
+    """The trained model, or None (mode="learned" then ranks like hybrid) when there is no usable artifact."""
+    if not os.path.exists(RERANKER_FILE):
+        print(f"[WARN] no {RERANKER_FILE}; learned mode falls back to hybrid. "
+              "Train it with `python scripts/learned_reranker.py`")
+        return None
+    try:
+        artifact = load_reranker(RERANKER_FILE)
+    except Exception as e:  # version/feature mismatch, or a truncated / corrupt joblib file
+        print(f"[WARN] cannot load {RERANKER_FILE} ({type(e).__name__}: {e}); learned mode falls back to hybrid. "
+              "Retrain with `python scripts/learned_reranker.py`")
+        return None
+    if artifact["index_fingerprint"] != index_fingerprint(INDEX_FILES):
+        print(f"[WARN] {RERANKER_FILE} was trained against a different index; "
+              "retrain with `python scripts/learned_reranker.py`")
+    return artifact["model"]
+
+def get_clf():
+    return lazy_resource("learned_reranker", _load_clf)
+
+# --- Cross-encoder second stage (mode="cross"): torch, or ONNX (optionally int8) via onnxruntime ---
+CROSS_BACKEND = os.environ.get("CROSS_BACKEND", "torch")  # torch | onnx | onnx-int8
+CROSS_CANDIDATES = int(os.environ.get("CROSS_CANDIDATES", "20"))
+CROSS_BUDGET_MS = float(os.environ.get("CROSS_BUDGET_MS", "300"))
+# CROSS_RERANKER=1 loads the cross-encoder at startup. Otherwise the first mode="cross" request
+# starts loading it in the background, and requests fall back to hybrid until it is ready.
+CROSS_RERANKER = os.environ.get("CROSS_RERANKER", "0") == "1"
+
+def _load_cross_model():
+    if CROSS_BACKEND.startswith("onnx"):
+        from onnx_runtime import OnnxCrossEncoder
+        return OnnxCrossEncoder(quantized=CROSS_BACKEND == "onnx-int8",
+                                intra_op_threads=int(os.environ.get("ONNX_THREADS", "0")))
+    from sentence_transformers import CrossEncoder
+    from onnx_runtime import CROSS_MODEL
+    return CrossEncoder(CROSS_MODEL, device="cpu", max_length=512)
+
+def get_cross_model():
+    return lazy_resource("cross_model", _load_cross_model)
+
+_cross_loader = None
+_cross_loader_guard = threading.Lock()
+
+def _load_cross_in_background():
+    global _cross_loader
+    try:
+        get_cross_model()
+    except Exception as e:
+        print(f"[ERROR] loading the cross-encoder failed: {e!r}")
+        with _cross_loader_guard:
+            _cross_loader = None  # the next mode="cross" request retries
+
+def cross_model_ready():
+    """True once the cross-encoder is loaded; otherwise make sure a background load is running."""
+    global _cross_loader
+    if _resources.get("cross_model", _NOT_LOADED) is not _NOT_LOADED:
+        return True
+    with _cross_loader_guard:
+        if _cross_loader is None:
+            _cross_loader = threading.Thread(target=_load_cross_in_background,
+                                             name="cross-model-load", daemon=True)
+            _cross_loader.start()
+    return False
+
+cross_reranker = CrossEncoderReranker(get_cross_model,
+                                      batch_size=int(os.environ.get("CROSS_BATCH_SIZE", "16")),
+                                      cache_size=int(os.environ.get("CROSS_CACHE_SIZE", "50000")),
+                                      model_ready=cross_model_ready)
+
+# --- Query micro-batching (concurrent requests share one encode pass) ---
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", "3"))
+encoder = QueryBatcher(lambda texts: get_model().encode(texts), max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS)
+
+# --- Caches: query text -> embedding, (query, k, mode) -> ranked contexts ---
+CACHE_TTL_S = float(os.environ.get("CACHE_TTL_S", "0"))  # 0 = no expiry
+embedding_cache = LRUCache(int(os.environ.get("EMBEDDING_CACHE_SIZE", "4096")), ttl=CACHE_TTL_S)
+response_cache = LRUCache(int(os.environ.get("RESPONSE_CACHE_SIZE", "1024")), ttl=CACHE_TTL_S)
+
+def on_index_rebuilt():
+    embedding_cache.clear()
+    response_cache.clear()
+    fts_pool.reset()
+    chunk_features.clear()
+    cross_reranker.cache.clear()
+    selection_cache.clear()
+    # Reloaded on next use against the new files
+    _resources.pop("faiss_index", None)
+    _resources.pop("learned_reranker", None)
+    _resources.pop("sentences", None)
+    _resources.pop("metadata_index", None)
+    _resources.pop("result_columns", None)
+    shards = _resources.pop("shards", None)
+    if shards is not None:
+        shards.close()  # local shard workers restart against the new shard files
+
+# Rebuilding faiss_index.bin / chunks.db / the sentence index / the shards drops everything cached against the old files
+index_watcher = FileWatcher(INDEX_FILES + [SENTENCE_VECTORS_FILE, SENTENCE_META_FILE, SENTENCE_INFO_FILE],
+                            on_index_rebuilt)
+
+# --- Sentence index for extractive answers (built by scripts/sentence_index.py) ---
+def _load_sentences():
+    if not (os.path.exists(SENTENCE_VECTORS_FILE) and os.path.exists(SENTENCE_META_FILE)):
+        print("[WARN] No sentence index; answers fall back to chunk snippets. Run scripts/sentence_index.py")
+        return None
+    if not sentence_index_is_current(DB_FILE):
+        # Spans would point into different chunk text and cite the wrong passages
+        print(f"[WARN] Sentence index does not match {DB_FILE}; answers fall back to chunk snippets. "
+              "Rerun scripts/sentence_index.py (scripts/ingest.py keeps it in sync)")
+        return None
+    sentences = SentenceIndex()
+    print(f"[STARTUP] Sentence index: {len(sentences.meta)} sentences (memory-mapped)")
+    return sentences
+
+def get_sentences():
+    return lazy_resource("sentences", _load_sentences)
+
+# --- Metadata filters: inverted index over chunk_meta, resolved filters cached as FAISS selectors ---
+def get_metadata_index():
+    return lazy_resource("metadata_index", lambda: MetadataIndex(fts_pool.connection()))
+
+selection_cache = LRUCache(int(os.environ.get("FILTER_CACHE_SIZE", "256")))
+
+def embed_query(query):
+    key = normalize_query(query)
+    vec = embedding_cache.get(key)
+    if vec is None:
+        with stage("encode"):
+            vec = encoder.encode(query)
+        embedding_cache.put(key, vec)
+    return vec
+
+def embed_queries(queries):
+    """Embed many queries with one model.encode call for the cache misses."""
+    keys = [normalize_query(q) for q in queries]
+    vecs = [embedding_cache.get(key) for key in keys]
+    missing = [i for i, vec in enumerate(vecs) if vec is None]
+    if missing:
+        with stage("encode"):
+            encoded = np.asarray(get_model().encode([queries[i] for i in missing]), dtype="float32")
+        for i, vec in zip(missing, encoded):
+            vecs[i] = vec
+            embedding_cache.put(keys[i], vec)
+    return np.vstack(vecs)
 
 # --- FastAPI ---
 app = FastAPI()
 
+# Load everything before the first request unless WARMUP=0 (then on first use)
+@app.on_event("startup")
+def warm_up():
+    if os.environ.get("WARMUP", "1") == "0":
+        return
+    with startup_stage("warm_up_total"):
+        with startup_stage("chunk_store"):
+            _check_store()
+        if SHARDED:
+            get_shards()
+        else:
+            get_index()
+        get_model()
+        embed_query("warm up")
+        get_clf()
+        if CROSS_RERANKER:
+            get_cross_model()
+        get_sentences()
+    mem = memory_usage()
+    if mem:
+        print(f"[MEMORY] pid {os.getpid()}: rss {mem['rss_mb']:.0f} MB = shared {mem['shared_mb']:.0f} MB"
+              f" + private {mem['private_mb']:.0f} MB (pss {mem['pss_mb']:.0f} MB)")
+
+def preload():
+    """
+    Load read-only state in the parent before workers fork (gunicorn preload_app) so
+    its pages are shared copy-on-write. Nothing here may start threads or run the
+    model: thread pools and OpenMP state do not survive fork. Workers still run
+    warm_up() after fork for the rest.
+    """
+    with startup_stage("preload_total"):
+        # Shard worker pools are started per worker (warm_up), never before fork
+        if not SHARDED:
+            get_index()
+        get_sentences()
+        # onnxruntime sessions own thread pools, so ONNX backends load in each worker instead
+        if ENCODER_BACKEND == "torch":
+            get_model()
+        if CROSS_RERANKER and CROSS_BACKEND == "torch":
+            get_cross_model()
+        get_clf()
+
+@app.get("/stats/startup")
+def startup_stats():
+    return startup_timings
+
+@app.get("/stats/memory")
+def memory_stats():
+    return {"pid": os.getpid(), **memory_usage()}
+
 # Enable CORS for frontend
 app.add_middleware(
     CORSMiddleware,
@@ -61,10 +380,52 @@ def serve_ui():
     return FileResponse(UI_FILE)
 
 # --- Request schema ---
+class SearchFilter(BaseModel):
+    source_pdf: Optional[List[str]] = None  # any of these PDFs
+    title: Optional[str] = None             # case-insensitive substring
+    page_min: Optional[int] = None          # chunk overlaps [page_min, page_max]
+    page_max: Optional[int] = None
+    chunk_min: Optional[int] = None         # chunk_number within its PDF (chunk_max=1: first chunks)
+    chunk_max: Optional[int] = None
+
 class AskRequest(BaseModel):
     q: str
     k: int = 5
-    mode: str = "hybrid"  # baseline | hybrid | learned
+    mode: str = "hybrid"  # baseline | hybrid | learned | cross
+    debug: bool = False   # add per-stage timings to the response
+    filters: Optional[SearchFilter] = None
+
+class AskBatchRequest(BaseModel):
+    queries: List[str]
+    k: int = 5
+    modes: List[str] = ["baseline", "hybrid", "learned"]
+    filters: Optional[SearchFilter] = None  # applied to every query
+
+def filter_key(filters):
+    return json.dumps(dict(filters), sort_keys=True) if filters is not None else None
+
+def resolve_filter(filters):
+    """
+    SearchFilter -> selection restricting both searches to the matching chunks:
+    {"ids": chunk_ids, "json": the same as a JSON array for FTS5, "faiss": SearchParameters with an IDSelector}. None when nothing is filtered.
+    Sharded, only the filter itself is passed on ({"filters": ...}): each shard resolves it against
+    its own chunks, so the full metadata index is never built here.
+    """
+    if filters is None:
+        return None
+    if SHARDED:
+        return {"filters": dict(filters)}
+    key = filter_key(filters)
+    selection = selection_cache.get(key)
+    if selection is None:
+        ids = get_metadata_index().resolve(**dict(filters))
+        if ids is None:
+            return None
+        index, index_info = get_index()
+        labels = ids if index_info["labels"] == "chunk_id" else ids - 1
+        selection = {"ids": ids, "json": json.dumps(ids.tolist()), "faiss": selector_params(index, labels)}
+        selection_cache.put(key, selection)
+    return selection
 
 # --- Helpers ---
 def normalize(scores):
@@ -74,155 +435,505 @@ def normalize(scores):
     return (scores - scores.min()) / (scores.max() - scores.min() + 1e-8)
 
 # --- Baseline, Keyword, Hybrid, Learned ---
-def baseline_search(query, k=5):
-    q_vec = model.encode([query]).astype("float32")
-    D, I = index.search(q_vec, k)
-    scores = 1 - D[0]  # convert distance to similarity
-    scores = normalize(scores)
+def result_columns():
+    # chunks.db files built before scripts/dedup.py existed have no duplicates column
+    return lazy_resource("result_columns", lambda: ("chunk_id", "pdf", "text") +
+                         (("duplicates",) if store.has_column("duplicates") else ()))
+
+def make_results(chunk_ids, scores):
+    # Chunk text is only fetched here, for the final top-k
+    with stage("fetch_chunks"):
+        rows = store.get(chunk_ids, columns=result_columns())
     results = []
-    for score, idx in zip(scores, I[0]):
-        chunk = chunks[idx]
-        results.append({"pdf": chunk['pdf'], "text": chunk['text'], "score": float(score)})
+    for cid, score in zip(chunk_ids, scores):
+        chunk = rows[int(cid)]
+        # Near-duplicates collapsed into this chunk at ingest: the other places the passage appears
+        duplicates = chunk.get('duplicates')
+        results.append({"chunk_id": int(cid), "pdf": chunk['pdf'], "text": chunk['text'], "score": float(score),
+                        "also_in": json.loads(duplicates) if duplicates else []})
     return results
 
-def keyword_search(query, k=5):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    safe_query = re.sub(r'[\"\'\*\?\:\[\]\(\)\~\^\&\|]', ' ', query)
-    safe_query = ' '.join(safe_query.split())
-    sql = f'SELECT pdf, text, rank_val FROM chunks WHERE text MATCH "{safe_query}" ORDER BY rank_val LIMIT {k}'
+# Cosine indexes (metric "ip") return comparable scores across queries, so weak
+# vector hits can be dropped with one global floor instead of per-query min-max.
+VECTOR_MIN_SCORE = float(os.environ.get("VECTOR_MIN_SCORE", "0"))
+
+def search_vectors(q_vecs, k, selection=None):
+    """
+    One index.search call for a (n_queries, dim) matrix. Returns raw (D, I) and index_info.
+    With a selection, FAISS skips every vector outside it (no over-fetching).
+    """
+    if SHARDED:
+        shards = get_shards()
+        x = prepare_vectors(q_vecs, shards.info["metric"])
+        with stage("faiss_search"):
+            D, I = shards.search_vectors(x, k, selection["filters"] if selection else None)
+        return D, I, shards.info
+    index, index_info = get_index()
+    x = prepare_vectors(q_vecs, index_info["metric"])
+    with stage("faiss_search"):
+        if selection is None:
+            D, I = index.search(x, k)
+        else:
+            D, I = index.search(x, k, params=selection["faiss"])
+    return D, I, index_info
+
+def vector_hits(dist, labels, index_info):
+    """One query's row of FAISS output -> (chunk_ids, similarity scores)."""
+    # Labels are chunk_ids for indexes built with add_with_ids, else FAISS row i holds chunk_id i+1
+    found = labels >= 0
+    chunk_ids = (labels if index_info["labels"] == "chunk_id" else labels + 1)[found]
+    if index_info["index_type"] == "hnsw":
+        # HNSW cannot delete, so chunks of removed PDFs stay as tombstones (see ingest.py)
+        live = store.exists(chunk_ids)
+        chunk_ids, found = chunk_ids[live], np.flatnonzero(found)[live]
+    if index_info["metric"] == "ip":
+        scores = dist[found]  # already cosine similarity
+        keep = scores >= VECTOR_MIN_SCORE
+        return chunk_ids[keep], scores[keep]
+    scores = normalize(1 - dist[found])  # legacy L2 index: convert distance to similarity
+    return chunk_ids, scores
+
+def vector_candidates(query, k=5, selection=None):
+    D, I, index_info = search_vectors(embed_query(query), k, selection)
+    return vector_hits(D[0], I[0], index_info)
+
+def keyword_candidates(query, k=5, selection=None):
+    rows = keyword_search(query, k, selection)
+    chunk_ids = np.array([r['chunk_id'] for r in rows], dtype="int64")
+    scores = np.array([r['score'] for r in rows], dtype="float64")
+    return chunk_ids, scores
+
+def baseline_search(query, k=5, selection=None):
+    return make_results(*vector_candidates(query, k, selection))
+
+def keyword_search(query, k=5, selection=None):
+    match = fts_match_expression(query)
+    if not match:
+        return []
     try:
-        c.execute(sql)
-        results = [{"pdf": row[0], "text": row[1], "score": 1/row[2] if row[2] != 0 else 0} for row in c.fetchall()]
+        with stage("fts5_search"):
+            if SHARDED:
+                # Shard bm25 uses per-shard term statistics; rescoring their pooled candidates
+                # here gives the single-index scores (and the learned reranker's bm25 feature)
+                candidates = get_shards().keyword_candidates(match, k, selection["filters"] if selection else None)
+                rows = fts_pool.connection().execute(KEYWORD_FILTERED_SQL, (match, json.dumps(candidates), k)).fetchall()
+            elif selection is None:
+                rows = fts_pool.connection().execute(KEYWORD_SQL, (match, k)).fetchall()
+            else:
+                rows = fts_pool.connection().execute(KEYWORD_FILTERED_SQL, (match, selection["json"], k)).fetchall()
     except sqlite3.OperationalError:
-        results = []
-    finally:
-        conn.close()
-    return results
+        return []
+    # rank_val is the chunk_id the row was built from (see create_chunks_db.py);
+    # bm25() is lower-is-better, so flip its sign into a similarity
+    return [{"chunk_id": int(row[0]), "score": -row[1]} for row in rows]
 
-# --- Updated hybrid reranker ---
-def hybrid_rerank(query, top_k=5, alpha=0.6):
-    baseline_results = baseline_search(query, top_k*3)
-    keyword_results = keyword_search(query, top_k*3)
-    combined = {}
-    for r in baseline_results:
-        key = r['text'][:100]
-        combined[key] = {"pdf": r['pdf'], "text": r['text'], "vector_score": r['score'], "keyword_score":0}
-    for r in keyword_results:
-        key = r['text'][:100]
-        if key in combined:
-            combined[key]['keyword_score'] = r['score']
-        else:
-            combined[key] = {"pdf": r['pdf'], "text": r['text'], "vector_score":0, "keyword_score":r['score']}
-    vec_scores = normalize([v['vector_score'] for v in combined.values()])
-    key_scores = normalize([v['keyword_score'] for v in combined.values()])
-    final_results = []
-    for i, (k, v) in enumerate(combined.items()):
-        score = alpha * vec_scores[i] + (1-alpha) * key_scores[i]
-        final_results.append({"pdf": v['pdf'], "text": v['text'], "score": score})
-    return sorted(final_results, key=lambda x: x['score'], reverse=True)[:top_k]
+# --- Fused retrieval shared by the rerankers ---
+retrieval_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("RETRIEVAL_WORKERS", "8")), thread_name_prefix="retrieval")
+
+def fused_retrieval(query, n, selection=None):
+    """
+    Run the FAISS and FTS5 searches concurrently and join them on chunk_id.
+    Returns aligned arrays: ids (vector hits first, then keyword-only hits),
+    vector and keyword scores (0 where a chunk was found by one side only).
+    """
+    vec_future = submit_in_context(retrieval_pool, vector_candidates, query, n, selection)
+    kw_ids, kw_scores = keyword_candidates(query, n, selection)
+    return fuse(*vec_future.result(), kw_ids, kw_scores)
+
+def fuse(vec_ids, vec_scores, kw_ids, kw_scores):
+    with stage("fuse"):
+        return _fuse(vec_ids, vec_scores, kw_ids, kw_scores)
+
+def _fuse(vec_ids, vec_scores, kw_ids, kw_scores):
+    ids = np.concatenate([vec_ids, kw_ids[~np.isin(kw_ids, vec_ids)]]).astype("int64")
+    vector = np.zeros(len(ids))
+    vector[:len(vec_ids)] = vec_scores
+    keyword = np.zeros(len(ids))
+    if len(kw_ids):
+        sorter = np.argsort(ids)
+        keyword[sorter[np.searchsorted(ids, kw_ids, sorter=sorter)]] = kw_scores
+    return {"ids": ids, "vector": vector, "keyword": keyword}
+
+def hybrid_rerank(query, top_k=5, alpha=0.6, selection=None):
+    return rank_hybrid(fused_retrieval(query, top_k*3, selection), top_k, alpha)
+
+def hybrid_scores(cand, alpha=0.6):
+    return alpha * normalize(cand["vector"]) + (1-alpha) * normalize(cand["keyword"])
+
+def rank_hybrid(cand, top_k=5, alpha=0.6):
+    with stage("rerank_hybrid"):
+        scores = hybrid_scores(cand, alpha)
+        order = np.argsort(-scores, kind="stable")[:top_k]
+    return make_results(cand["ids"][order], scores[order])
 
 # --- Updated learned reranker ---
-def train_learned_reranker(baseline_fn, keyword_fn):
-    questions = [
-        "What are PPE safety requirements?",
-        "How to safely operate a laser scanner?",
-        "Define safety functions for machinery.",
-        "Explain risk reduction steps for operators.",
-        "What are type-C standards in ISO 13849-1?",
-        "How to calculate performance level (PL) for a safety function?",
-        "List hazards in industrial machinery.",
-        "When should emergency stop be applied?"
-    ]
-    features, labels = [], []
-    for q in questions:
-        baseline_results = baseline_fn(q, 5)
-        keyword_results = keyword_fn(q, 5)
-        combined = {}
-        for r in baseline_results:
-            key = r['text'][:100]
-            combined[key] = {"vector_score": r['score'], "keyword_score": 0}
-        for r in keyword_results:
-            key = r['text'][:100]
-            if key in combined:
-                combined[key]['keyword_score'] = r['score']
-            else:
-                combined[key] = {"vector_score": 0, "keyword_score": r['score']}
-        for v in combined.values():
-            features.append([v['vector_score'], v['keyword_score']])
-            labels.append(1 if v['vector_score'] > 0 else 0)  # keep top scores same
-    clf = LogisticRegression(class_weight='balanced', random_state=42)
-    clf.fit(np.array(features), np.array(labels))
-    return clf
-
-clf = train_learned_reranker(baseline_search, keyword_search)
-
-def learned_rerank(query, top_k=5):
-    baseline_results = baseline_search(query, top_k*3)
-    keyword_results = keyword_search(query, top_k*3)
-    combined, feat, texts = {}, [], []
-    for r in baseline_results:
-        key = r['text'][:100]
-        combined[key] = {"pdf": r['pdf'], "text": r['text'], "vector_score": r['score'], "keyword_score":0}
-    for r in keyword_results:
-        key = r['text'][:100]
-        if key in combined:
-            combined[key]['keyword_score'] = r['score']
-        else:
-            combined[key] = {"pdf": r['pdf'], "text": r['text'], "vector_score":0, "keyword_score":r['score']}
-    for k, v in combined.items():
-        feat.append([v['vector_score'], v['keyword_score']])
-        texts.append(v)
-    feat = np.array(feat)
-    if len(feat) == 0:
+def learned_rerank(query, top_k=5, selection=None):
+    return rank_learned(query, fused_retrieval(query, top_k*3, selection), top_k)
+
+def rank_learned(query, cand, top_k=5):
+    if len(cand["ids"]) == 0:
         return []
-    pred_scores = clf.predict_proba(feat)[:,1]
-    sorted_chunks = [texts[i] for i in np.argsort(-pred_scores)]
-    for i, c in enumerate(sorted_chunks):
-        c['score'] = pred_scores[i]
-    return sorted_chunks[:top_k]
+    clf = get_clf()
+    if clf is None:
+        return rank_hybrid(cand, top_k)  # no usable reranker.joblib (see _load_clf)
+    with stage("rerank_learned"):
+        order, scores = rerank(clf, feature_matrix(query, cand, chunk_features), top_k)
+    return make_results(cand["ids"][order], scores)
+
+# --- Cross-encoder reranker ---
+def cross_rerank(query, top_k=5, selection=None):
+    # The time budget covers the whole request, first-stage retrieval included
+    deadline = time.perf_counter() + CROSS_BUDGET_MS / 1000.0
+    return rank_cross(query, fused_retrieval(query, max(CROSS_CANDIDATES, top_k), selection), top_k, deadline)
+
+# Set per request (track_cross_fallbacks): queries whose cross-encoder budget ran out, or
+# that arrived while the model was still loading
+_cross_fallbacks = contextvars.ContextVar("cross_fallbacks", default=None)
+
+def track_cross_fallbacks():
+    fallbacks = set()
+    _cross_fallbacks.set(fallbacks)
+    return fallbacks
+
+def rank_cross(query, cand, top_k=5, deadline=None):
+    """
+    Rescore the hybrid top CROSS_CANDIDATES; fall back to the hybrid order if the budget runs
+    out or the model is not loaded yet, recording the query in the request's
+    track_cross_fallbacks() set.
+    """
+    with stage("rerank_cross"):
+        scores = hybrid_scores(cand)
+        order = np.argsort(-scores, kind="stable")[:max(CROSS_CANDIDATES, top_k)]
+        ids = cand["ids"][order]
+        rows = store.get(ids, columns=("chunk_id", "text"))
+        cross_scores = cross_reranker.score(query, ids, [rows[int(i)]["text"] for i in ids], deadline)
+    if cross_scores is None:
+        fallbacks = _cross_fallbacks.get()
+        if fallbacks is not None:
+            fallbacks.add(query)
+        return make_results(ids[:top_k], scores[order][:top_k])
+    top = np.argsort(-cross_scores, kind="stable")[:top_k]
+    return make_results(ids[top], cross_scores[top])
 
 # --- Extractive answer with citation + threshold ---
 ANSWER_THRESHOLD = 0.1
-def extract_answer_with_citation(results, max_chunks=2):
-    snippets = []
-    for r in results[:max_chunks]:
-        text = r['text'].replace("\n", " ").strip()
-        snippet = text[:200] + ("..." if len(text) > 200 else "")
-        snippets.append(f"{snippet} (Source: {r['pdf']})")
-    return " ".join(snippets)
+ANSWER_SENTENCES = int(os.environ.get("ANSWER_SENTENCES", "2"))
 
-# --- API endpoint ---
-@app.post("/ask")
-def ask(req: AskRequest):
-    try:
-        if req.mode == "baseline":
-            results = baseline_search(req.q, req.k)
-        elif req.mode == "hybrid":
-            results = hybrid_rerank(req.q, req.k)
-        elif req.mode == "learned":
-            results = learned_rerank(req.q, req.k)
-        else:
-            raise HTTPException(status_code=400, detail="Invalid mode")
-
-        if not results or results[0]['score'] < ANSWER_THRESHOLD:
-            return {
-                "answer": None,
-                "contexts": [],
-                "reranker_used": req.mode,
-                "message": "No confident answer found. Abstaining."
-            }
-
-        answer = extract_answer_with_citation(results)
-        return {
+def extract_answer_with_citation(results, max_chunks=2, query_vec=None):
+    """
+    Best-matching sentences of the top results, each cited with PDF, page and character span.
+    Sentence vectors are precomputed at ingest, so this is one dot product over the
+    candidates' sentences against the (already cached) query embedding: no model call.
+    Without a sentence index (or query vector) falls back to the first 200 chars per chunk.
+    Returns (answer, citations).
+    """
+    sentences = get_sentences() if query_vec is not None else None
+    best = sentences.best(query_vec, [r['chunk_id'] for r in results], ANSWER_SENTENCES) if sentences else []
+    if not best:
+        snippets = []
+        for r in results[:max_chunks]:
+            text = r['text'].replace("\n", " ").strip()
+            snippet = text[:200] + ("..." if len(text) > 200 else "")
+            also = "".join(f"; also {d['source_pdf']}" for d in r['also_in'])
+            snippets.append(f"{snippet} (Source: {r['pdf']}{also})")
+        return " ".join(snippets), []
+
+    by_id = {r['chunk_id']: r for r in results}
+    parts, citations = [], []
+    for s in best:
+        r = by_id[s['chunk_id']]
+        sentence = r['text'][s['char_start']:s['char_end']].replace("\n", " ")
+        also = "".join(f"; also {d['source_pdf']}, p. {d['page_start']}" for d in r['also_in'])
+        parts.append(f"{sentence} (Source: {r['pdf']}, p. {s['page']}{also})")
+        citations.append({**s, "pdf": r['pdf'], "also_in": r['also_in']})
+    return " ".join(parts), citations
+
+# --- Encoder batching metrics ---
+@app.get("/stats/encoder")
+def encoder_stats():
+    return encoder.stats()
+
+# --- Cache hit/miss counters ---
+@app.get("/stats/cache")
+def cache_stats():
+    return {"embedding": embedding_cache.stats(), "response": response_cache.stats(),
+            "features": chunk_features.cache.stats(), "cross": cross_reranker.cache.stats(),
+            "filters": selection_cache.stats()}
+
+# --- Per-shard calls, timeouts and errors ---
+@app.get("/stats/shards")
+def shard_stats():
+    if not SHARDED:
+        return {"sharded": False}
+    return {"sharded": True, **get_shards().stats()}
+
+# --- Cross-encoder calls, fallbacks and latency ---
+@app.get("/stats/cross")
+def cross_stats():
+    return cross_reranker.stats()
+
+# --- Search executor with admission control ---
+# Encode, FAISS and reranking run on SEARCH_WORKERS threads; at most SEARCH_QUEUE more
+# requests wait, the rest get a fast 503 instead of queueing behind a burst.
+search_executor = AdmissionController(
+    max_workers=int(os.environ.get("SEARCH_WORKERS", str(os.cpu_count() or 4))),
+    max_queue=int(os.environ.get("SEARCH_QUEUE", "64")),
+    timeout_s=float(os.environ.get("SEARCH_TIMEOUT_S", "10")),
+)
+RETRY_AFTER_S = os.environ.get("RETRY_AFTER_S", "1")
+
+@app.get("/stats/queue")
+def queue_stats():
+    return search_executor.stats()
+
+# --- Prometheus metrics and the sampling profiler ---
+registry.gauge("rag_queue_depth", "Requests waiting for a search worker", lambda: search_executor.stats()["queue_depth"])
+registry.gauge("rag_search_running", "Requests running on search workers", lambda: search_executor.stats()["running"])
+registry.describe("rag_requests_rejected_total", "counter", "Requests (or batch chunks) rejected by admission control")
+registry.gauge("rag_response_cache_hit_rate", "Response cache hit rate", lambda: response_cache.stats()["hit_rate"])
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "1000"))
+profiler = SamplingProfiler(interval_ms=float(os.environ.get("PROFILER_INTERVAL_MS", "5")))
+if os.environ.get("PROFILER", "0") == "1":
+    profiler.start()
+
+def format_trace(trace):
+    return ", ".join(f"{name} {ms:.1f} ms" for name, ms in trace.items()) or "no stages ran"
+
+# The profiler endpoints expose stacks and slow questions: off unless DEBUG_TOKEN is set,
+# and then only for requests sending it as X-Debug-Token
+DEBUG_TOKEN = os.environ.get("DEBUG_TOKEN", "")
+
+def require_debug_token(x_debug_token: Optional[str] = Header(None)):
+    if not DEBUG_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_debug_token is None or not hmac.compare_digest(x_debug_token, DEBUG_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid debug token")
+
+class ProfilerRequest(BaseModel):
+    enabled: bool
+    interval_ms: Optional[float] = None
+    slow_request_ms: Optional[float] = None
+
+@app.post("/debug/profiler", dependencies=[Depends(require_debug_token)])
+def set_profiler(req: ProfilerRequest):
+    """Switch sampling on/off at runtime; while on, requests slower than SLOW_REQUEST_MS are captured."""
+    global SLOW_REQUEST_MS
+    if req.slow_request_ms is not None:
+        SLOW_REQUEST_MS = req.slow_request_ms
+    if req.enabled:
+        profiler.start(req.interval_ms)
+    else:
+        profiler.stop()
+    return {"enabled": profiler.enabled, "interval_ms": 1000.0 * profiler.interval, "slow_request_ms": SLOW_REQUEST_MS}
+
+@app.get("/debug/profiler", dependencies=[Depends(require_debug_token)])
+def get_profiler(top: int = 30):
+    """Slow-request captures plus the hottest stacks across all threads since sampling started."""
+    return {
+        "enabled": profiler.enabled,
+        "slow_request_ms": SLOW_REQUEST_MS,
+        "captures": list(profiler.captures),
+        "top_stacks": dict(list(profiler.collapsed().items())[:top]),
+    }
+
+RERANKERS = {"baseline": baseline_search, "hybrid": hybrid_rerank, "learned": learned_rerank, "cross": cross_rerank}
+
+def make_response(results, mode, query=None):
+    if not results or results[0]['score'] < ANSWER_THRESHOLD:
+        response = {
+            "answer": None,
+            "contexts": [],
+            "reranker_used": mode,
+            "message": "No confident answer found. Abstaining."
+        }
+    else:
+        # Embedding cache hit: the query was encoded for retrieval a moment ago
+        query_vec = embed_query(query) if query is not None else None
+        with stage("answer"):
+            answer, citations = extract_answer_with_citation(results, query_vec=query_vec)
+        response = {
             "answer": answer,
+            "citations": citations,
             "contexts": results,
-            "reranker_used": req.mode
+            "reranker_used": mode
         }
+    return response
+
+def used_reranker(mode, query, fallbacks):
+    """What actually ranked a response: learned without a usable artifact and cross past its budget are hybrid."""
+    if (mode == "learned" and get_clf() is None) or (mode == "cross" and query in fallbacks):
+        return "hybrid"
+    return mode
 
+def answer_query(q, k, mode, cache_key, filters=None):
+    start = time.perf_counter()
+    missing = track_missing_shards() if SHARDED else None
+    fallbacks = track_cross_fallbacks()
+    selection = resolve_filter(filters)
+    if selection is not None and "ids" in selection and not len(selection["ids"]):
+        results = []  # no chunk matches the filter
+    else:
+        results = RERANKERS[mode](q, k, selection=selection)
+    response = make_response(results, mode, q)
+    used = used_reranker(mode, q, fallbacks)
+    if used != mode:
+        # Cross-encoder budget ran out or no learned model: these are hybrid results
+        response.update(reranker_used=used, degraded=True)
+    if missing:
+        # Some shards did not answer: flag the response
+        response.update(partial=True, missing_shards=sorted(missing))
+    if not (missing or used != mode):
+        response_cache.put(cache_key, response)
+    end = time.perf_counter()
+    if profiler.enabled and 1000.0 * (end - start) >= SLOW_REQUEST_MS:
+        # Stacks this worker thread was sampled in while answering (retrieval threads not included)
+        profiler.capture(q, threading.get_ident(), start, end, mode=mode, k=k)
+    return response
+
+# --- Batch queries: one encode, one index.search, shared candidates for all modes ---
+BATCH_CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", "64"))
+# A chunk of the batch may run this long per (query, mode), but never less than SEARCH_TIMEOUT_S
+BATCH_TIMEOUT_PER_QUERY_MS = float(os.environ.get("BATCH_TIMEOUT_PER_QUERY_MS", "250"))
+
+def batch_timeout_s(n_queries, modes):
+    if search_executor.timeout is None:
+        return None  # SEARCH_TIMEOUT_S=0: no deadline
+    return max(search_executor.timeout, n_queries * len(modes) * BATCH_TIMEOUT_PER_QUERY_MS / 1000.0)
+
+def rank_batch(queries, k=5, modes=("baseline", "hybrid", "learned"), selection=None):
+    """
+    Rank every query in every mode; returns one {mode: results} dict per query.
+    All queries are encoded together and searched with a single index.search. baseline
+    uses the first k hits; hybrid/learned fuse the first k*3 vector and keyword hits,
+    and cross the first max(CROSS_CANDIDATES, k), as the single-query paths do. FTS5
+    only runs when a mode needs keyword scores. cross gets its own budget per query.
+    A selection (resolve_filter) restricts every query to the same chunks.
+    """
+    n = k * 3
+    n_search = max(n, CROSS_CANDIDATES) if "cross" in modes else n
+    fused_modes = {"hybrid", "learned", "cross"} & set(modes)
+    kw_futures = [submit_in_context(retrieval_pool, keyword_candidates, q, n_search, selection)
+                  for q in queries] if fused_modes else []
+    D, I, index_info = search_vectors(embed_queries(queries), n_search, selection)
+    ranked = []
+    for i, q in enumerate(queries):
+        results = {}
+        if "baseline" in modes:
+            results["baseline"] = make_results(*vector_hits(D[i][:k], I[i][:k], index_info))
+        if fused_modes:
+            kw_ids, kw_scores = kw_futures[i].result()
+        if "hybrid" in modes or "learned" in modes:
+            cand = fuse(*vector_hits(D[i][:n], I[i][:n], index_info), kw_ids[:n], kw_scores[:n])
+            if "hybrid" in modes:
+                results["hybrid"] = rank_hybrid(cand, k)
+            if "learned" in modes:
+                results["learned"] = rank_learned(q, cand, k)
+        if "cross" in modes:
+            m = max(CROSS_CANDIDATES, k)
+            cand = fuse(*vector_hits(D[i][:m], I[i][:m], index_info), kw_ids[:m], kw_scores[:m])
+            results["cross"] = rank_cross(q, cand, k, time.perf_counter() + CROSS_BUDGET_MS / 1000.0)
+        ranked.append(results)
+    return ranked
+
+def answer_batch(queries, k=5, modes=("baseline", "hybrid", "learned"), filters=None):
+    missing = track_missing_shards() if SHARDED else None
+    fallbacks = track_cross_fallbacks()
+    selection = resolve_filter(filters)
+    rows = [{"question": q, "results": {m: make_response(results[m], m, q) for m in modes}}
+            for q, results in zip(queries, rank_batch(queries, k, modes, selection))]
+    for row in rows:
+        for mode, response in row["results"].items():
+            used = used_reranker(mode, row["question"], fallbacks)
+            if used != mode:
+                response.update(reranker_used=used, degraded=True)
+    if missing:
+        # One scatter serves the whole chunk of queries, so every row is partial
+        for row in rows:
+            row.update(partial=True, missing_shards=sorted(missing))
+    return rows
+
+def ask_batch(queries, k=5, modes=("baseline", "hybrid", "learned"), filters=None):
+    """Yield {"question", "results": {mode: /ask response}} per query, BATCH_CHUNK_SIZE at a time."""
+    for start in range(0, len(queries), BATCH_CHUNK_SIZE):
+        yield from answer_batch(queries[start:start + BATCH_CHUNK_SIZE], k, modes, filters)
+
+# --- API endpoint ---
+@app.post("/ask")
+async def ask(req: AskRequest):
+    index_watcher.check()
+    if req.mode not in RERANKERS:
+        raise HTTPException(status_code=400, detail="Invalid mode")
+    cache_key = (normalize_query(req.q), req.k, req.mode, filter_key(req.filters))
+    start = time.perf_counter()
+    trace = start_trace()
+    status = "ok"
+    try:
+        response = response_cache.get(cache_key)
+        if response is None:
+            response = await search_executor.run(answer_query, req.q, req.k, req.mode, cache_key, req.filters)
+        else:
+            status = "cached"
+    except Overloaded:
+        status = "rejected"
+        registry.inc("rag_requests_rejected_total", endpoint="ask")
+        raise HTTPException(status_code=503, detail="Server busy, retry later", headers={"Retry-After": RETRY_AFTER_S})
+    except DeadlineExceeded:
+        status = "timeout"
+        print(f"[ERROR] Question timed out: {req.q} ({format_trace(trace)})")
+        raise HTTPException(status_code=504, detail="Search did not finish in time")
     except Exception as e:
-        print(f"[ERROR] Question failed: {req.q}")
+        status = "error"
+        print(f"[ERROR] Question failed: {req.q} ({type(e).__name__}: {e}; {format_trace(trace)})")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.observe("rag_request_seconds", elapsed, mode=req.mode)
+        registry.inc("rag_requests_total", mode=req.mode, status=status)
+    if req.debug:
+        # Cached responses are shared; add the debug field to a copy
+        response = {**response, "debug": {"total_ms": 1000.0 * elapsed, "cached": status == "cached",
+                                          "stages_ms": dict(trace)}}
+    return response
+
+@app.post("/ask/batch")
+async def ask_batch_endpoint(req: AskBatchRequest):
+    """Stream one NDJSON line per query as each chunk of the batch finishes."""
+    index_watcher.check()
+    if not req.modes or any(m not in RERANKERS for m in req.modes):
+        raise HTTPException(status_code=400, detail="Invalid mode")
+
+    async def lines():
+        timed_out = None
+        for start in range(0, len(req.queries), BATCH_CHUNK_SIZE):
+            chunk = req.queries[start:start + BATCH_CHUNK_SIZE]
+            if timed_out is not None:
+                # The timed-out chunk still holds a worker; don't queue more work behind it
+                rows = [{"question": q, "error": timed_out} for q in chunk]
+            else:
+                try:
+                    rows = await search_executor.run(answer_batch, chunk, req.k, req.modes, req.filters,
+                                                     timeout_s=batch_timeout_s(len(chunk), req.modes))
+                except Exception as e:
+                    # Status is already sent; report the failure per query so clients can retry them
+                    print(f"[ERROR] Batch of {len(chunk)} questions failed: {e!r}")
+                    rows = [{"question": q, "error": str(e) or type(e).__name__} for q in chunk]
+                    if isinstance(e, Overloaded):
+                        registry.inc("rag_requests_rejected_total", endpoint="ask_batch")
+                    if isinstance(e, DeadlineExceeded):
+                        timed_out = str(e)
+            for row in rows:
+                yield json.dumps(row, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+# gunicorn.conf.py sets PRELOAD=1 before importing the app in the parent process
+if os.environ.get("PRELOAD", "0") == "1":
+    preload()
 
 # --- Generate results table for all 8 questions ---
 def generate_results_table():
@@ -237,10 +948,8 @@ def generate_results_table():
         "When should emergency stop be applied?"
     ]
     table = []
-    for q in questions:
-        baseline = baseline_search(q, 5)
-        hybrid = hybrid_rerank(q, 5)
-        learned = learned_rerank(q, 5)
+    for q, ranked in zip(questions, rank_batch(questions, 5)):
+        baseline, hybrid, learned = ranked["baseline"], ranked["hybrid"], ranked["learned"]
         table.append({
             "question": q,
             "baseline_top_score": baseline[0]['score'] if baseline else None,
@@ -253,4 +962,4 @@ def generate_results_table():
 if __name__ == "_ ,kjnbv vbhjkolp[]';lkmnb _main__":
     result_table = generate_results_table()
     for row in result_table:
-        print(row)
\ No newline at end of file
+        print(row)
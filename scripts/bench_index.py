@@ -0,0 +1,114 @@
+# scripts/bench_index.py
+# Recall-vs-latency sweep for FAISS index types, measured against the exact flat index.
+# Usage: python scripts/bench_index.py [--k 10] [--holdout 200] [--json index_bench.json]
+import argparse
+import json
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from index_builder import METRICS, build_index, index_memory_bytes, prepare_vectors, set_search_params
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FAISS_INDEX = os.path.join(PROJECT_ROOT, "faiss_index.bin")
+METADATA_FILE = os.path.join(PROJECT_ROOT, "metadata.json")
+EMBEDDINGS_FILE = os.path.join(PROJECT_ROOT, "embeddings.f16.npy")
+
+# (index_type, build kwargs, list of search-time settings to sweep)
+SWEEP = [
+    ("flat", {}, [{}]),
+    ("ivf", {}, [{"nprobe": n} for n in (1, 4, 8, 16, 32)]),
+    ("hnsw", {"hnsw_m": 32, "ef_construction": 200}, [{"ef_search": e} for e in (16, 32, 64, 128)]),
+    ("ivfpq", {"pq_m": 48, "pq_bits": 8}, [{"nprobe": n} for n in (4, 8, 16, 32)]),
+]
+
+
+def load_embeddings():
+    """Reuse vectors from create_embeddings.py or a flat index; otherwise encode metadata.json."""
+    if os.path.exists(EMBEDDINGS_FILE):
+        print(f"Reusing vectors from {EMBEDDINGS_FILE}")
+        return np.load(EMBEDDINGS_FILE, mmap_mode="r")
+    if os.path.exists(FAISS_INDEX):
+        index = faiss.read_index(FAISS_INDEX)
+        if isinstance(faiss.downcast_index(index), faiss.IndexFlat):
+            print(f"Reusing {index.ntotal} vectors from {FAISS_INDEX}")
+            return index.reconstruct_n(0, index.ntotal)
+    from sentence_transformers import SentenceTransformer
+    with open(METADATA_FILE, "r", encoding="utf-8") as f:
+        texts = [c["text"] for c in json.load(f)]
+    print(f"Encoding {len(texts)} chunks from {METADATA_FILE}")
+    model = SentenceTransformer("all-MiniLM-L6-v2", device="cpu")
+    return np.asarray(model.encode(texts, show_progress_bar=True), dtype="float32")
+
+
+def recall_at_k(approx, exact, k):
+    hits = sum(len(set(a[:k]) & set(e[:k])) for a, e in zip(approx, exact))
+    return hits / (k * len(exact))
+
+
+def timed_search(index, queries, k):
+    # One query per call, as the API issues them
+    start = time.perf_counter()
+    labels = [index.search(q.reshape(1, -1), k)[1][0] for q in queries]
+    elapsed = time.perf_counter() - start
+    return np.array(labels), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FAISS recall@k / QPS / memory sweep")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--holdout", type=int, default=200, help="chunks held out of the index and used as queries")
+    parser.add_argument("--metric", choices=METRICS, default="l2")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    embeddings = prepare_vectors(load_embeddings(), args.metric)
+    rng = np.random.default_rng(args.seed)
+    perm = rng.permutation(len(embeddings))
+    holdout = min(args.holdout, len(embeddings) // 5)
+    queries, base = embeddings[perm[:holdout]], embeddings[perm[holdout:]]
+    print(f"{len(base)} indexed vectors, {len(queries)} held-out queries, k={args.k}, metric={args.metric}\n")
+
+    exact, _ = build_index(base, index_type="flat", metric=args.metric)
+    truth = exact.search(queries, args.k)[1]
+
+    rows = []
+    print(f"{'index':<8}{'params':<56}{'recall@k':>10}{'qps':>10}{'ms/query':>10}{'memory MB':>11}{'build s':>9}")
+    for index_type, build_kwargs, search_settings in SWEEP:
+        t0 = time.perf_counter()
+        try:
+            index, build_params = build_index(base, index_type=index_type, metric=args.metric, **build_kwargs)
+        except (RuntimeError, ValueError) as e:
+            print(f"{index_type:<8}skipped: {e}")
+            continue
+        build_s = time.perf_counter() - t0
+        memory = index_memory_bytes(index)
+        for search in search_settings:
+            set_search_params(index, **search)
+            labels, elapsed = timed_search(index, queries, args.k)
+            row = {
+                "index_type": index_type,
+                "params": dict(build_params, **search),
+                f"recall@{args.k}": recall_at_k(labels, truth, args.k),
+                "qps": len(queries) / elapsed,
+                "ms_per_query": 1000 * elapsed / len(queries),
+                "memory_bytes": memory,
+                "build_s": build_s,
+            }
+            rows.append(row)
+            print(f"{index_type:<8}{json.dumps(row['params']):<56}{row[f'recall@{args.k}']:>10.3f}"
+                  f"{row['qps']:>10.0f}{row['ms_per_query']:>10.3f}{memory / 2**20:>11.2f}{build_s:>9.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"k": args.k, "metric": args.metric, "indexed": len(base), "queries": len(queries), "results": rows}, f, indent=2)
+        print(f"\nSaved results to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# scripts/bench_keyword_search.py
+# Microbenchmark: per-query keyword search overhead, connect-per-call vs pooled connections.
+# "legacy" is the old f-string/rank_val query; "connect+bm25" vs "pooled+bm25" run the identical
+# bound bm25 query and differ only in connection handling.
+# Usage: python scripts/bench_keyword_search.py [--queries-per-client 200] [--clients 1 8 32]
+import argparse
+import json
+import os
+import re
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sqlite_pool import ReadOnlyConnectionPool, fts_match_expression
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DB_FILE = os.path.join(PROJECT_ROOT, "chunks.db")
+QUESTIONS_FILE = os.path.join(PROJECT_ROOT, "questions.json")
+K = 15
+
+
+# --- Previous implementation: new connection + f-string MATCH per call ---
+def keyword_search_connect_per_call(query, k=K):
+    conn = sqlite3.connect(DB_FILE)
+    c = conn.cursor()
+    safe_query = re.sub(r'[\"\'\*\?\:\[\]\(\)\~\^\&\|]', ' ', query)
+    safe_query = ' '.join(safe_query.split())
+    sql = f'SELECT pdf, text, rank_val FROM chunks WHERE text MATCH "{safe_query}" ORDER BY rank_val LIMIT {k}'
+    try:
+        c.execute(sql)
+        return c.fetchall()
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+
+
+# --- Same bound bm25 query, but still a fresh connection per call ---
+SQL = "SELECT rank_val, pdf, text, bm25(chunks) AS score FROM chunks WHERE text MATCH ? ORDER BY score LIMIT ?"
+
+
+def keyword_search_connect_bm25(query, k=K):
+    conn = sqlite3.connect(f"file:{DB_FILE}?mode=ro", uri=True)
+    try:
+        return conn.execute(SQL, (fts_match_expression(query), k)).fetchall()
+    finally:
+        conn.close()
+
+
+# --- Current implementation: pooled read-only connection + bound MATCH + bm25 ---
+pool = ReadOnlyConnectionPool(DB_FILE)
+
+
+def keyword_search_pooled(query, k=K):
+    return pool.connection().execute(SQL, (fts_match_expression(query), k)).fetchall()
+
+
+def run(fn, queries, clients, per_client):
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(clients + 1)
+
+    def client(offset):
+        local = []
+        barrier.wait()
+        for i in range(per_client):
+            q = queries[(offset + i) % len(queries)]
+            t0 = time.perf_counter()
+            fn(q)
+            local.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "mean_us": 1e6 * statistics.fmean(latencies),
+        "p50_us": 1e6 * latencies[len(latencies) // 2],
+        "p99_us": 1e6 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "qps": len(latencies) / wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keyword search connection-overhead microbenchmark")
+    parser.add_argument("--queries-per-client", type=int, default=200)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+
+    with open(QUESTIONS_FILE, "r", encoding="utf-8") as f:
+        queries = [q["q"] for q in json.load(f)]
+
+    print(f"{'impl':<14}{'clients':>8}{'mean us':>12}{'p50 us':>12}{'p99 us':>12}{'qps':>10}")
+    for clients in args.clients:
+        for name, fn in [
+            ("legacy", keyword_search_connect_per_call),
+            ("connect+bm25", keyword_search_connect_bm25),
+            ("pooled+bm25", keyword_search_pooled),
+        ]:
+            r = run(fn, queries, clients, args.queries_per_client)
+            print(f"{name:<14}{clients:>8}{r['mean_us']:>12.1f}{r['p50_us']:>12.1f}{r['p99_us']:>12.1f}{r['qps']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+# scripts/benchmark.py
+# Retrieval quality + latency benchmark against qrels.json.
+#     python scripts/benchmark.py --save bench_baseline.json
+#     python scripts/benchmark.py --compare bench_baseline.json       # exit 1 on regressions
+#     python scripts/benchmark.py --url http://127.0.0.1:8000         # also time /ask over HTTP
+# Quality: recall@k, MRR and nDCG per mode; learned mode is scored k-fold on held-out questions.
+# Latency: per-stage percentiles (encode, FAISS, FTS5, rerank) and end-to-end p50/p95/p99
+# + throughput at several concurrency levels.
+# For HTTP runs start the server with RESPONSE_CACHE_SIZE=0 EMBEDDING_CACHE_SIZE=0.
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Caches would turn repeated questions into lookups; measure the real pipeline
+os.environ.setdefault("RESPONSE_CACHE_SIZE", "0")
+os.environ.setdefault("EMBEDDING_CACHE_SIZE", "0")
+os.environ.setdefault("CROSS_CACHE_SIZE", "0")
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from learned_reranker import QRELS_FILE, feature_matrix, load_qrels, qrels_folds, rerank, train_learned_reranker
+
+MODES = ["baseline", "hybrid", "learned"]
+
+
+# --- Quality ---
+def recall_at(ranked, relevant, k):
+    return len(set(ranked[:k]) & relevant) / len(relevant) if relevant else 0.0
+
+
+def reciprocal_rank(ranked, relevant):
+    for rank, cid in enumerate(ranked, start=1):
+        if cid in relevant:
+            return 1.0 / rank
+    return 0.0
+
+
+def ndcg_at(ranked, relevant, k):
+    gains = np.array([1.0 if cid in relevant else 0.0 for cid in ranked[:k]])
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    ideal = discounts[:min(len(relevant), k)].sum()
+    return float((gains * discounts[:len(gains)]).sum() / ideal) if ideal else 0.0
+
+
+def quality(rankings, qrels, ks):
+    """rankings: {question: [chunk_id, ...]} -> mean metrics over the judged questions."""
+    k_max = max(ks)
+    out = {f"recall@{k}": float(np.mean([recall_at(rankings[q], rel, k) for q, rel in qrels.items()])) for k in ks}
+    out["mrr"] = float(np.mean([reciprocal_rank(rankings[q][:k_max], rel) for q, rel in qrels.items()]))
+    out[f"ndcg@{k_max}"] = float(np.mean([ndcg_at(rankings[q], rel, k_max) for q, rel in qrels.items()]))
+    return out
+
+
+def heldout_learned_rankings(api, qrels, k, n_folds):
+    """
+    Learned-mode rankings where each question is ranked by a model trained on the other
+    folds only, so its quality is never measured on questions it was trained on.
+    """
+    folds = qrels_folds(qrels, n_folds)
+    rankings = {}
+    for i, heldout in enumerate(folds):
+        train = {q: rel for j, fold in enumerate(folds) if j != i for q, rel in fold.items()}
+        model = train_learned_reranker(api.fused_retrieval, api.chunk_features, train)
+        for q in heldout:
+            cand = api.fused_retrieval(q, k * 3)
+            if len(cand["ids"]) == 0:
+                rankings[q] = []
+                continue
+            order, _ = rerank(model, feature_matrix(q, cand, api.chunk_features), k)
+            rankings[q] = [int(cid) for cid in cand["ids"][order]]
+    return rankings
+
+
+# --- Latency ---
+def percentiles(samples_s):
+    ms = 1000.0 * np.asarray(samples_s)
+    return {"p50": float(np.percentile(ms, 50)), "p95": float(np.percentile(ms, 95)),
+            "p99": float(np.percentile(ms, 99)), "mean": float(ms.mean()), "n": int(ms.size)}
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - start
+
+
+def run_load(call, questions, concurrency, rounds):
+    """Send every question `rounds` times from `concurrency` threads; latency percentiles + QPS."""
+    work = [q for _ in range(rounds) for q in questions]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = [t for _, t in pool.map(lambda q: timed(call, q), work)]
+    wall = time.perf_counter() - start
+    return {**percentiles(latencies), "qps": len(work) / wall}
+
+
+def stage_latencies(api, questions, k, modes, rounds):
+    """Time each pipeline stage separately on the same inputs /ask would see."""
+    stages = {"encode": [], "faiss_search": [], "fts5_search": [], "fetch_chunks": []}
+    stages.update({f"rerank_{m}": [] for m in modes if m != "baseline"})
+    for _ in range(rounds):
+        for q in questions:
+            vec, t = timed(api.encoder.encode, q)
+            stages["encode"].append(t)
+            (D, I, info), t = timed(api.search_vectors, vec, k * 3)
+            stages["faiss_search"].append(t)
+            (kw_ids, kw_scores), t = timed(api.keyword_candidates, q, k * 3)
+            stages["fts5_search"].append(t)
+            cand = api.fuse(*api.vector_hits(D[0], I[0], info), kw_ids, kw_scores)
+            _, t = timed(api.store.get, cand["ids"][:k])
+            stages["fetch_chunks"].append(t)
+            if "hybrid" in modes:
+                stages["rerank_hybrid"].append(timed(api.rank_hybrid, cand, k)[1])
+            if "learned" in modes:
+                stages["rerank_learned"].append(timed(api.rank_learned, q, cand, k)[1])
+            if "cross" in modes:
+                stages["rerank_cross"].append(timed(api.rank_cross, q, cand, k)[1])
+    return {name: percentiles(samples) for name, samples in stages.items()}
+
+
+def http_caller(url, mode, k):
+    import requests
+    session = requests.Session()
+
+    def call(q):
+        resp = session.post(f"{url}/ask", json={"q": q, "k": k, "mode": mode}, timeout=60)
+        resp.raise_for_status()
+        return resp.json()
+    return call
+
+
+# --- Regression check ---
+def compare(current, baseline, max_quality_drop, max_latency_increase):
+    """List of human-readable regressions of current vs baseline."""
+    problems = []
+    for mode, metrics in baseline.get("quality", {}).items():
+        for name, old in metrics.items():
+            new = current["quality"].get(mode, {}).get(name)
+            if new is not None and new < old - max_quality_drop:
+                problems.append(f"quality {mode} {name}: {old:.4f} -> {new:.4f}")
+    for where in ("inprocess", "http"):
+        for mode, levels in baseline.get("latency", {}).get(where, {}).items():
+            for conc, old in levels.items():
+                new = current.get("latency", {}).get(where, {}).get(mode, {}).get(conc)
+                if new is None:
+                    continue
+                if new["p95"] > old["p95"] * (1 + max_latency_increase):
+                    problems.append(f"latency {where} {mode} c={conc} p95: {old['p95']:.1f} -> {new['p95']:.1f} ms")
+                if new["qps"] < old["qps"] / (1 + max_latency_increase):
+                    problems.append(f"throughput {where} {mode} c={conc}: {old['qps']:.1f} -> {new['qps']:.1f} qps")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrieval quality and latency benchmark")
+    parser.add_argument("--qrels", default=QRELS_FILE)
+    parser.add_argument("--folds", type=int, default=4, help="cross-validation folds for learned-mode quality")
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES + ["cross"])
+    parser.add_argument("--ks", type=int, nargs="+", default=[5, 10], help="cut-offs for recall@k; MRR/nDCG use the largest")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--rounds", type=int, default=5, help="passes over the questions per measurement")
+    parser.add_argument("--url", default=None, help="also benchmark a running server over HTTP")
+    parser.add_argument("--save", default=None, help="write the report as a JSON baseline")
+    parser.add_argument("--compare", default=None, help="baseline JSON to check for regressions")
+    parser.add_argument("--max-quality-drop", type=float, default=0.01, help="absolute drop allowed per metric")
+    parser.add_argument("--max-latency-increase", type=float, default=0.25, help="relative p95/QPS change allowed")
+    args = parser.parse_args()
+    if args.folds < 2:
+        parser.error("--folds must be at least 2 so every question is held out of training")
+
+    qrels = load_qrels(args.qrels)
+    questions = list(qrels)
+    k = max(args.ks)
+
+    import ask_api as api
+    api.warm_up()
+    search = {"baseline": api.baseline_search, "hybrid": api.hybrid_rerank,
+              "learned": api.learned_rerank, "cross": api.cross_rerank}
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "questions": len(questions),
+            "k": k,
+            "learned_quality": f"{min(args.folds, len(questions))}-fold held-out",
+            "index": {key: api.get_index_info().get(key) for key in ("index_type", "metric", "ntotal")},
+            "encoder_backend": api.ENCODER_BACKEND,
+            "rounds": args.rounds,
+        },
+        "quality": {},
+        "stages": stage_latencies(api, questions, k, args.modes, args.rounds),
+        "latency": {"inprocess": {}},
+    }
+    for mode in args.modes:
+        if mode == "learned":
+            # Latency below still uses the deployed reranker.joblib
+            rankings = heldout_learned_rankings(api, qrels, k, args.folds)
+        else:
+            rankings = {q: [r["chunk_id"] for r in search[mode](q, k)] for q in questions}
+        report["quality"][mode] = quality(rankings, qrels, args.ks)
+        report["latency"]["inprocess"][mode] = {
+            str(c): run_load(lambda q: search[mode](q, k), questions, c, args.rounds) for c in args.concurrency
+        }
+        if args.url:
+            call = http_caller(args.url.rstrip("/"), mode, k)
+            report["latency"].setdefault("http", {})[mode] = {
+                str(c): run_load(call, questions, c, args.rounds) for c in args.concurrency
+            }
+
+    # --- Summary ---
+    for mode, metrics in report["quality"].items():
+        print(f"{mode:9s} " + "  ".join(f"{name} {value:.3f}" for name, value in metrics.items()))
+    for name, p in report["stages"].items():
+        print(f"stage {name:15s} p50 {p['p50']:7.2f}  p95 {p['p95']:7.2f}  p99 {p['p99']:7.2f} ms")
+    for where, modes in report["latency"].items():
+        for mode, levels in modes.items():
+            for conc, p in levels.items():
+                print(f"{where:9s} {mode:9s} c={conc:>3s}  p50 {p['p50']:7.2f}  p95 {p['p95']:7.2f}  "
+                      f"p99 {p['p99']:7.2f} ms  {p['qps']:8.1f} qps")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved benchmark to {args.save}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            problems = compare(report, json.load(f), args.max_quality_drop, args.max_latency_increase)
+        for p in problems:
+            print(f"[REGRESSION] {p}")
+        print(f"{len(problems)} regressions vs {args.compare}")
+        sys.exit(1 if problems else 0)
@@ -0,0 +1,61 @@
+# scripts/chunk_io.py
+import json
+import os
+from typing import Dict, Iterator
+
+
+def iter_chunks(path: str) -> Iterator[Dict]:
+    """Yield chunk dicts from a .jsonl file lazily, or from a .json array."""
+    if path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+
+
+def count_chunks(path: str) -> int:
+    if path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            return sum(1 for line in f if line.strip())
+    return sum(1 for _ in iter_chunks(path))
+
+
+class ChunkWriter:
+    """
+    Stream chunk dicts to disk one at a time: JSON Lines for .jsonl paths, otherwise
+    a JSON array written incrementally. Writes to path + ".tmp" and renames on close.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.jsonl = path.endswith(".jsonl")
+        self.count = 0
+        self._f = open(path + ".tmp", "w", encoding="utf-8")
+        if not self.jsonl:
+            self._f.write("[")
+
+    def write(self, chunk: Dict) -> None:
+        if self.jsonl:
+            self._f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+        else:
+            self._f.write(("," if self.count else "") + "\n  " + json.dumps(chunk, ensure_ascii=False))
+        self.count += 1
+
+    def close(self) -> None:
+        if not self.jsonl:
+            self._f.write("\n]\n")
+        self._f.close()
+        os.replace(self.path + ".tmp", self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._f.close()
+            os.remove(self.path + ".tmp")
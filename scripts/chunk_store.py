@@ -0,0 +1,87 @@
+# scripts/chunk_store.py
+import json
+import sqlite3
+from typing import Dict, Iterable, Sequence
+
+import numpy as np
+
+from sqlite_pool import ReadOnlyConnectionPool
+
+# chunk_meta lives in chunks.db next to the FTS5 table, keyed by chunk_id
+COLUMNS = ("chunk_id", "pdf", "source_pdf", "title", "text", "chunk_number", "total_chunks",
+           "chunk_len", "page_start", "page_end", "is_first_paragraph", "page_breaks", "duplicates")
+# Columns added after the first release, migrated in place by create_chunk_store()
+ADDED_COLUMNS = ("page_breaks", "duplicates")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunk_meta (
+    chunk_id INTEGER PRIMARY KEY,
+    pdf TEXT, source_pdf TEXT, title TEXT, text TEXT,
+    chunk_number INTEGER, total_chunks INTEGER, chunk_len INTEGER,
+    page_start INTEGER, page_end INTEGER, is_first_paragraph INTEGER,
+    page_breaks TEXT,  -- JSON [[char_offset, page], ...] where each page starts in text
+    duplicates TEXT    -- JSON [{chunk_id, pdf, source_pdf, title, chunk_number, page_start, page_end}, ...] collapsed into this chunk
+)
+"""
+
+
+def create_chunk_store(conn: sqlite3.Connection) -> None:
+    conn.execute(SCHEMA)
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(chunk_meta)")}
+    for column in ADDED_COLUMNS:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE chunk_meta ADD COLUMN {column} TEXT")
+
+
+def _value(value):
+    return json.dumps(value) if isinstance(value, list) else value
+
+
+def insert_chunks(conn: sqlite3.Connection, chunks: Iterable[Dict]) -> None:
+    conn.executemany(
+        f"INSERT OR REPLACE INTO chunk_meta ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+        ([_value(c.get(col)) for col in COLUMNS] for c in chunks),
+    )
+
+
+def delete_chunks(conn: sqlite3.Connection, chunk_ids: Iterable[int]) -> None:
+    conn.executemany("DELETE FROM chunk_meta WHERE chunk_id = ?", [(int(i),) for i in chunk_ids])
+
+
+class ChunkStore:
+    """
+    Read side of chunk_meta. Rows are looked up by chunk_id only when needed (e.g. the
+    final top-k), through per-thread read-only, memory-mapped connections, so workers
+    keep no per-chunk Python objects in memory.
+    """
+
+    def __init__(self, pool: ReadOnlyConnectionPool):
+        self.pool = pool
+        # Constant SQL text (ids passed as one JSON array) keeps statements in the cache
+        self._sql = {}
+
+    def _query(self, columns: Sequence[str]) -> str:
+        sql = self._sql.get(columns)
+        if sql is None:
+            sql = f"SELECT {', '.join(columns)} FROM chunk_meta WHERE chunk_id IN (SELECT value FROM json_each(?))"
+            self._sql[columns] = sql
+        return sql
+
+    def get(self, chunk_ids: Iterable[int], columns: Sequence[str] = ("chunk_id", "pdf", "text")) -> Dict[int, Dict]:
+        columns = tuple(columns) if "chunk_id" in columns else ("chunk_id",) + tuple(columns)
+        ids = json.dumps([int(i) for i in chunk_ids])
+        rows = self.pool.connection().execute(self._query(columns), (ids,)).fetchall()
+        return {row[0]: dict(zip(columns, row)) for row in rows}
+
+    def exists(self, chunk_ids: np.ndarray) -> np.ndarray:
+        """Boolean mask: which chunk_ids are (still) in the store."""
+        present = self.get(chunk_ids, columns=("chunk_id",))
+        return np.array([int(i) in present for i in chunk_ids], dtype=bool)
+
+    def has_column(self, column: str) -> bool:
+        """False for chunks.db files built before the column was added (see ADDED_COLUMNS)."""
+        rows = self.pool.connection().execute("PRAGMA table_info(chunk_meta)").fetchall()
+        return any(row[1] == column for row in rows)
+
+    def count(self) -> int:
+        return self.pool.connection().execute("SELECT COUNT(*) FROM chunk_meta").fetchone()[0]
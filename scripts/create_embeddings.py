@@ -1,41 +1,147 @@
+import argparse
 import json
 import os
+import sys
+from itertools import islice
 from sentence_transformers import SentenceTransformer
-import faiss
 import numpy as np
 
-# Absolute paths
-BASE_DIR = r"D:\industrial-safety-qa"
-CHUNKS_JSON = os.path.join(BASE_DIR, "chunks.json")       # Input from pdfread.py
-INDEX_FILE = os.path.join(BASE_DIR, "faiss_index.bin")    # FAISS index output
-METADATA_FILE = os.path.join(BASE_DIR, "metadata.json")   # Metadata output
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from index_builder import INDEX_TYPES, METRICS, build_index, prepare_vectors, write_index
+from chunk_io import ChunkWriter, count_chunks, iter_chunks
 
-# Load chunks from JSON
-with open(CHUNKS_JSON, "r", encoding="utf-8") as f:
-    chunks = json.load(f)
+# Paths
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CHUNKS_FILE = os.path.join(PROJECT_ROOT, "chunks.jsonl")             # Input from pdfread.py
+INDEX_FILE = os.path.join(PROJECT_ROOT, "faiss_index.bin")           # FAISS index output (+ faiss_index.json)
+METADATA_FILE = os.path.join(PROJECT_ROOT, "metadata.json")          # Metadata output
+EMBEDDINGS_FILE = os.path.join(PROJECT_ROOT, "embeddings.f16.npy")   # Memory-mapped float16 vectors
+IDS_FILE = os.path.join(PROJECT_ROOT, "embeddings.ids.npy")          # chunk_id of each row
+CHECKPOINT_FILE = os.path.join(PROJECT_ROOT, "embeddings.ckpt.json")  # Rows encoded so far
 
-print(f"Loaded {len(chunks)} chunks from {CHUNKS_JSON}.")
+# --- Options ---
+parser = argparse.ArgumentParser(description="Embed chunks in batches (resumable) and build the FAISS index")
+parser.add_argument("--chunks", default=CHUNKS_FILE, help="chunks.jsonl from pdfread.py (or a .json array)")
+parser.add_argument("--batch-size", type=int, default=256, help="chunks encoded per batch; bounds peak RAM")
+parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat",
+                    help="flat = exact scan; ivf / hnsw / ivfpq = approximate (see scripts/bench_index.py)")
+parser.add_argument("--metric", choices=METRICS, default="l2",
+                    help="ip = L2-normalize and score by inner product (cosine similarity)")
+parser.add_argument("--train-size", type=int, default=50000, help="vectors used to train IVF/IVF-PQ")
+parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default ~4*sqrt(n))")
+parser.add_argument("--nprobe", type=int, default=8, help="IVF lists scanned per query")
+parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW graph degree")
+parser.add_argument("--ef-construction", type=int, default=200, help="HNSW build-time beam width")
+parser.add_argument("--ef-search", type=int, default=64, help="HNSW query-time beam width")
+parser.add_argument("--pq-m", type=int, default=48, help="IVF-PQ sub-quantizers (must divide 384)")
+parser.add_argument("--pq-bits", type=int, default=8, help="IVF-PQ bits per sub-quantizer")
+args = parser.parse_args()
+
+# Count chunks without loading them
+n = count_chunks(args.chunks)
+stat = os.stat(args.chunks)
+source = {"chunks": os.path.abspath(args.chunks), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "n": n}
+print(f"Found {n} chunks in {args.chunks}.")
+
+# Index labels, metadata.json and chunk_meta are all keyed on chunk_id, which pdfread.py assigns.
+# The old chunks.json (pdf/text only) has none, nor the position/page fields the API reads.
+first = next(iter_chunks(args.chunks), None)
+if first is not None and "chunk_id" not in first:
+    raise SystemExit(f"{args.chunks} has no chunk_id (fields: {', '.join(first)}). It predates pdfread.py; "
+                     "regenerate the chunks with `python scripts/pdfread.py` and embed chunks.jsonl instead.")
 
 # Initialize SentenceTransformer model
-model = SentenceTransformer("all-MiniLM-L6-v2")  # lightweight & fast
-
-# Create embeddings
-texts = [chunk["text"] for chunk in chunks]
-print("Generating embeddings...")
-embeddings = model.encode(texts, show_progress_bar=True)
-embeddings = np.array(embeddings).astype("float32")  # FAISS requires float32
-
-# Create FAISS index
-dimension = embeddings.shape[1]
-index = faiss.IndexFlatL2(dimension)
-index.add(embeddings)
-print(f"FAISS index created with {index.ntotal} vectors.")
-
-# Save FAISS index
-faiss.write_index(index, INDEX_FILE)
+model = SentenceTransformer("all-MiniLM-L6-v2", device="cpu")  # lightweight & fast
+dim = model.get_sentence_embedding_dimension()
+
+# --- Resume from checkpoint, or start a fresh store ---
+done = 0
+if not args.restart and os.path.exists(CHECKPOINT_FILE):
+    with open(CHECKPOINT_FILE, "r", encoding="utf-8") as f:
+        ckpt = json.load(f)
+    if ckpt["source"] == source:
+        done = ckpt["done"]
+        print(f"Resuming after {done}/{n} chunks.")
+    else:
+        print("Chunks file changed since the checkpoint; starting over.")
+if done:
+    store = np.load(EMBEDDINGS_FILE, mmap_mode="r+")
+    ids = np.load(IDS_FILE, mmap_mode="r+")
+else:
+    store = np.lib.format.open_memmap(EMBEDDINGS_FILE, mode="w+", dtype="float16", shape=(n, dim))
+    ids = np.lib.format.open_memmap(IDS_FILE, mode="w+", dtype="int64", shape=(n,))
+
+def save_checkpoint(done):
+    store.flush()
+    ids.flush()
+    tmp = CHECKPOINT_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"source": source, "done": done}, f)
+    os.replace(tmp, CHECKPOINT_FILE)
+
+# --- FAISS index, filled incrementally from the store ---
+index = None
+build_params = {}
+# IVF/IVF-PQ are trained once train_size vectors exist; flat/HNSW start with the first batch
+train_rows = min(n, args.train_size if args.index_type in ("ivf", "ivfpq") else args.batch_size)
+
+def add_rows(start, end):
+    global index, build_params
+    if index is None:
+        if end < train_rows:
+            return
+        index, build_params = build_index(
+            np.asarray(store[:train_rows], dtype="float32"),
+            index_type=args.index_type,
+            metric=args.metric,
+            nlist=args.nlist,
+            hnsw_m=args.hnsw_m,
+            ef_construction=args.ef_construction,
+            pq_m=args.pq_m,
+            pq_bits=args.pq_bits,
+            ids=ids[:train_rows],
+        )
+        start = train_rows
+    for s in range(start, end, args.batch_size):
+        e = min(end, s + args.batch_size)
+        index.add_with_ids(prepare_vectors(store[s:e], args.metric), np.asarray(ids[s:e]))
+
+# Re-add rows encoded before an interruption (cheap compared with re-encoding them)
+add_rows(0, done)
+
+# --- Encode remaining chunks batch by batch ---
+chunks = islice(iter_chunks(args.chunks), done, None)
+while done < n:
+    batch = list(islice(chunks, args.batch_size))
+    if not batch:
+        break
+    vectors = model.encode([c["text"] for c in batch], batch_size=64)
+    end = done + len(batch)
+    store[done:end] = vectors.astype("float16")
+    ids[done:end] = [c["chunk_id"] for c in batch]
+    add_rows(done, end)
+    save_checkpoint(end)
+    done = end
+    print(f"Encoded {done}/{n} chunks")
+
+if index is None:
+    raise SystemExit(f"No chunks to index in {args.chunks}")
+print(f"FAISS {args.index_type}/{args.metric} index created with {index.ntotal} vectors.")
+
+# Save FAISS index + index type / default query-time parameters
+write_index(index, INDEX_FILE, {
+    "index_type": args.index_type,
+    "metric": args.metric,
+    "labels": "chunk_id",
+    "params": build_params,
+    "search": {"nprobe": args.nprobe, "ef_search": args.ef_search},
+})
 print(f"Saved FAISS index to {INDEX_FILE}")
 
-# Save metadata for reference (mapping back to PDFs/chunks)
-with open(METADATA_FILE, "w", encoding="utf-8") as f:
-    json.dump(chunks, f, indent=2, ensure_ascii=False)
-print(f"Saved metadata to {METADATA_FILE}")
+# Save metadata for reference (mapping back to PDFs/chunks), streamed chunk by chunk
+with ChunkWriter(METADATA_FILE) as writer:
+    for chunk in iter_chunks(args.chunks):
+        writer.write(chunk)
+os.remove(CHECKPOINT_FILE)
+print(f"Saved metadata to {METADATA_FILE}; vectors kept in {EMBEDDINGS_FILE}")
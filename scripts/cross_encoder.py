@@ -0,0 +1,82 @@
+# scripts/cross_encoder.py
+import threading
+import time
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+
+from query_cache import LRUCache, normalize_query
+
+
+class CrossEncoderReranker:
+    """
+    Second-stage reranker: rescore (query, chunk text) pairs with a cross-encoder,
+    batch_size pairs per forward pass on CPU. Scores are cached per (normalized
+    query, chunk_id). score() checks the deadline before every batch and returns
+    None once it has passed, so the caller can fall back to the first-stage order.
+    If model_ready is given and returns False, score() returns None at once instead
+    of loading the model inside the request.
+    """
+
+    def __init__(self, load_model: Callable, batch_size: int = 16, cache_size: int = 50000,
+                 model_ready: Optional[Callable[[], bool]] = None):
+        self.load_model = load_model  # returns an object with predict(pairs, batch_size)
+        self.model_ready = model_ready
+        self.batch_size = max(1, batch_size)
+        self.cache = LRUCache(cache_size)
+
+        # --- Metrics ---
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.fallbacks = 0
+        self.pairs_scored = 0
+        self.total_score = 0.0
+
+    def score(self, query: str, chunk_ids: Sequence[int], texts: Sequence[str],
+              deadline: Optional[float] = None) -> Optional[np.ndarray]:
+        key = normalize_query(query)
+        scores = np.empty(len(chunk_ids), dtype="float64")
+        todo = []
+        for i, cid in enumerate(chunk_ids):
+            cached = self.cache.get((key, int(cid)))
+            if cached is None:
+                todo.append(i)
+            else:
+                scores[i] = cached
+
+        start = time.perf_counter()
+        scored = 0
+        try:
+            if todo and self.model_ready is not None and not self.model_ready():
+                with self._stats_lock:
+                    self.fallbacks += 1
+                return None
+            model = self.load_model() if todo else None
+            for b in range(0, len(todo), self.batch_size):
+                if deadline is not None and time.perf_counter() >= deadline:
+                    with self._stats_lock:
+                        self.fallbacks += 1
+                    return None
+                batch = todo[b:b + self.batch_size]
+                out = model.predict([(query, texts[i]) for i in batch], batch_size=self.batch_size)
+                for i, s in zip(batch, out):
+                    scores[i] = s
+                    self.cache.put((key, int(chunk_ids[i])), float(s))
+                scored += len(batch)
+            return scores
+        finally:
+            with self._stats_lock:
+                self.requests += 1
+                self.pairs_scored += scored
+                self.total_score += time.perf_counter() - start
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "batch_size": self.batch_size,
+                "requests": self.requests,
+                "fallbacks": self.fallbacks,
+                "pairs_scored": self.pairs_scored,
+                "avg_score_ms": 1000.0 * self.total_score / self.requests if self.requests else 0.0,
+                "cache": self.cache.stats(),
+            }
@@ -0,0 +1,196 @@
+# scripts/dedup.py
+# Ingest-time near-duplicate collapsing (MinHash + LSH over word shingles).
+#     python scripts/dedup.py [--chunks chunks.jsonl] [--threshold 0.8]   # after pdfread.py
+# Rewrites the chunks file keeping one canonical chunk per cluster of near-duplicates;
+# the others are listed on it under "duplicates" (chunk_id, pdf, title, position, pages) so the
+# API can still cite every source. Only canonical chunks are embedded and indexed.
+# ingest.py keeps the signatures of live chunks in chunks.db (StoredNearDuplicateIndex).
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import zlib
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from chunk_io import ChunkWriter, iter_chunks
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CHUNKS_FILE = os.path.join(PROJECT_ROOT, "chunks.jsonl")
+
+MERSENNE_PRIME = (1 << 31) - 1
+TOKEN = re.compile(r"\w+")
+DUPLICATE_FIELDS = ("chunk_id", "pdf", "source_pdf", "title", "chunk_number", "page_start", "page_end")
+
+
+def shingle_hashes(text: str, size: int = 5) -> np.ndarray:
+    """crc32 of every run of `size` consecutive lowercased words (the whole text if shorter)."""
+    words = TOKEN.findall(text.lower())
+    grams = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+    return np.array([zlib.crc32(g.encode("utf-8")) for g in grams], dtype="int64") % MERSENNE_PRIME
+
+
+def duplicate_ref(chunk: Dict) -> Dict:
+    """What a canonical chunk keeps about a collapsed duplicate: where else the passage appears."""
+    return {field: chunk.get(field) for field in DUPLICATE_FIELDS}
+
+
+class NearDuplicateIndex:
+    """
+    MinHash signatures (num_perm universal hashes, min over shingles) banded into an LSH
+    table: texts whose signatures agree on a whole band are candidates, and a candidate
+    is a duplicate when the estimated Jaccard similarity is >= threshold. Only canonical
+    texts are indexed, so each duplicate maps straight to its cluster's canonical key.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, bands: int = 16,
+                 shingle_size: int = 5, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError(f"bands={bands} must divide num_perm={num_perm}")
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, MERSENNE_PRIME, size=num_perm).astype("int64")
+        self.b = rng.randint(0, MERSENNE_PRIME, size=num_perm).astype("int64")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self._buckets: List[Dict[bytes, List[Hashable]]] = [{} for _ in range(bands)]
+        self._signatures: Dict[Hashable, np.ndarray] = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def signature(self, text: str) -> np.ndarray:
+        h = shingle_hashes(text, self.shingle_size)
+        # h, a < 2^31 so a*h + b fits in int64
+        return ((np.outer(h, self.a) + self.b) % MERSENNE_PRIME).min(axis=0)
+
+    def _band_keys(self, sig: np.ndarray):
+        return [sig[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def _candidates(self, sig: np.ndarray) -> Iterator[Tuple[Hashable, np.ndarray]]:
+        """(key, signature) of every indexed text sharing at least one band with sig."""
+        keys = {key for band, bk in zip(self._buckets, self._band_keys(sig)) for key in band.get(bk, ())}
+        return ((key, self._signatures[key]) for key in keys)
+
+    def find(self, sig: np.ndarray) -> Optional[Hashable]:
+        """Indexed key most similar to sig, if it reaches the threshold."""
+        best, best_sim = None, self.threshold
+        for key, other in self._candidates(sig):
+            sim = float(np.mean(other == sig))
+            if sim >= best_sim:
+                best, best_sim = key, sim
+        return best
+
+    def insert(self, key: Hashable, sig: np.ndarray) -> None:
+        self._signatures[key] = sig
+        for band, bk in zip(self._buckets, self._band_keys(sig)):
+            band.setdefault(bk, []).append(key)
+
+    def add(self, key: Hashable, text: str) -> Optional[Hashable]:
+        """Canonical key text duplicates, or None after indexing text as a new canonical under key."""
+        sig = self.signature(text)
+        match = self.find(sig)
+        if match is None:
+            self.insert(key, sig)
+        return match
+
+
+DEDUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dedup_signatures (chunk_id INTEGER PRIMARY KEY, signature BLOB);
+CREATE TABLE IF NOT EXISTS dedup_buckets (bucket INTEGER, chunk_id INTEGER, PRIMARY KEY (bucket, chunk_id)) WITHOUT ROWID;
+"""
+
+
+class StoredNearDuplicateIndex(NearDuplicateIndex):
+    """
+    NearDuplicateIndex kept in chunks.db next to chunk_meta, so ingest.py only signs and
+    inserts the chunks a run adds. Signatures are stored as int32 blobs, and each band is
+    reduced to a 64-bit bucket id (band number included); a bucket collision only adds a
+    candidate, which find() still checks against the full signature. Writes go through
+    the caller's connection and are committed with the rest of its transaction. The
+    stored signatures are only valid for the default num_perm, bands, shingle_size and seed.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, **kwargs):
+        super().__init__(**kwargs)
+        self.conn = conn
+        conn.executescript(DEDUP_SCHEMA)
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM dedup_signatures").fetchone()[0]
+
+    def _bucket_ids(self, sig: np.ndarray) -> List[int]:
+        return [int.from_bytes(hashlib.blake2b(bytes([i]) + bk, digest_size=8).digest(), "little", signed=True)
+                for i, bk in enumerate(self._band_keys(sig))]
+
+    def _candidates(self, sig: np.ndarray) -> Iterator[Tuple[Hashable, np.ndarray]]:
+        rows = self.conn.execute(
+            "SELECT chunk_id, signature FROM dedup_signatures WHERE chunk_id IN "
+            "(SELECT chunk_id FROM dedup_buckets WHERE bucket IN (SELECT value FROM json_each(?)))",
+            (json.dumps(self._bucket_ids(sig)),))
+        return ((cid, np.frombuffer(blob, dtype="<i4").astype("int64")) for cid, blob in rows.fetchall())
+
+    def insert(self, key: int, sig: np.ndarray) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO dedup_signatures (chunk_id, signature) VALUES (?, ?)",
+                          (int(key), sig.astype("<i4").tobytes()))
+        self.conn.executemany("INSERT OR IGNORE INTO dedup_buckets (bucket, chunk_id) VALUES (?, ?)",
+                              [(b, int(key)) for b in self._bucket_ids(sig)])
+
+    def remove(self, keys: Iterable[int]) -> None:
+        """Drop chunks (e.g. of deleted PDFs) so they can no longer be matched."""
+        for key in keys:
+            row = self.conn.execute("SELECT signature FROM dedup_signatures WHERE chunk_id = ?", (int(key),)).fetchone()
+            if row is None:
+                continue
+            sig = np.frombuffer(row[0], dtype="<i4").astype("int64")
+            self.conn.executemany("DELETE FROM dedup_buckets WHERE bucket = ? AND chunk_id = ?",
+                                  [(b, int(key)) for b in self._bucket_ids(sig)])
+            self.conn.execute("DELETE FROM dedup_signatures WHERE chunk_id = ?", (int(key),))
+
+    def unsigned(self) -> List[int]:
+        """chunk_meta rows without a stored signature: a corpus built before this table, or ingested without dedup."""
+        return [row[0] for row in self.conn.execute(
+            "SELECT chunk_id FROM chunk_meta WHERE chunk_id NOT IN (SELECT chunk_id FROM dedup_signatures)")]
+
+
+def dedup_chunks_file(path: str, threshold: float = 0.8) -> Dict[str, int]:
+    """Collapse near-duplicate chunks of a chunks file in place (two streaming passes)."""
+    index = NearDuplicateIndex(threshold=threshold)
+    duplicates: Dict[int, List[Dict]] = {}
+    collapsed = set()
+    total = 0
+    for chunk in iter_chunks(path):
+        total += 1
+        canonical = index.add(chunk["chunk_id"], chunk["text"])
+        if canonical is not None:
+            duplicates.setdefault(canonical, []).append(duplicate_ref(chunk))
+            # a duplicate that was itself canonical in an earlier run brings its duplicates along
+            duplicates[canonical].extend(chunk.get("duplicates") or [])
+            collapsed.add(chunk["chunk_id"])
+
+    with ChunkWriter(path) as writer:
+        for chunk in iter_chunks(path):
+            if chunk["chunk_id"] in collapsed:
+                continue
+            if chunk["chunk_id"] in duplicates:
+                chunk["duplicates"] = (chunk.get("duplicates") or []) + duplicates[chunk["chunk_id"]]
+            writer.write(chunk)
+    return {"chunks": total, "canonical": total - len(collapsed), "collapsed": len(collapsed),
+            "clusters": len(duplicates)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collapse near-duplicate chunks before embedding")
+    parser.add_argument("--chunks", default=CHUNKS_FILE, help="chunks.jsonl from pdfread.py (or a .json array)")
+    parser.add_argument("--threshold", type=float, default=0.8, help="estimated Jaccard similarity of word 5-grams")
+    args = parser.parse_args()
+
+    stats = dedup_chunks_file(args.chunks, args.threshold)
+    print(f"{stats['chunks']} chunks -> {stats['canonical']} canonical; collapsed {stats['collapsed']} "
+          f"near-duplicates into {stats['clusters']} clusters in {args.chunks}")
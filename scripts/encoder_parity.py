@@ -0,0 +1,96 @@
+# scripts/encoder_parity.py
+# Check an ONNX query encoder against the PyTorch reference before switching ENCODER_BACKEND:
+#     python scripts/onnx_runtime.py encoder --quantize
+#     python scripts/encoder_parity.py --backends onnx onnx-int8
+# Reports per-query cosine drift, top-k overlap with the reference results on the existing
+# FAISS index, qrels recall@k for both encoders, and single-query encode latency.
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from index_builder import prepare_vectors, read_index
+from onnx_runtime import OnnxSentenceEncoder
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FAISS_INDEX = os.path.join(PROJECT_ROOT, "faiss_index.bin")
+DB_FILE = os.path.join(PROJECT_ROOT, "chunks.db")
+QRELS_FILE = os.path.join(PROJECT_ROOT, "qrels.json")
+
+
+def sample_queries(n, words=12, seed=42):
+    """The judged questions plus n pseudo-queries: the first words of randomly chosen chunks."""
+    with open(QRELS_FILE, "r", encoding="utf-8") as f:
+        qrels = {q: set(ids) for q, ids in json.load(f).items()}
+    conn = sqlite3.connect(f"file:{DB_FILE}?mode=ro", uri=True)
+    ids = [r[0] for r in conn.execute("SELECT chunk_id FROM chunk_meta")]
+    picked = np.random.default_rng(seed).choice(ids, size=min(n, len(ids)), replace=False)
+    rows = conn.execute("SELECT text FROM chunk_meta WHERE chunk_id IN (SELECT value FROM json_each(?))",
+                        (json.dumps([int(i) for i in picked]),)).fetchall()
+    conn.close()
+    return list(qrels), qrels, [" ".join(text.split()[:words]) for (text,) in rows]
+
+
+def search(index, index_info, vecs, k):
+    _, I = index.search(prepare_vectors(vecs, index_info["metric"]), k)
+    return I if index_info["labels"] == "chunk_id" else np.where(I >= 0, I + 1, I)
+
+
+def qrels_recall(labels, questions, qrels, k):
+    return float(np.mean([len(set(row[:k].tolist()) & qrels[q]) / min(len(qrels[q]), k)
+                          for row, q in zip(labels, questions)]))
+
+
+def encode_latency_ms(model, queries, repeat=50):
+    start = time.perf_counter()
+    for i in range(repeat):
+        model.encode(queries[i % len(queries)])
+    return 1000.0 * (time.perf_counter() - start) / repeat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cosine drift and recall@k of ONNX query encoders vs PyTorch")
+    parser.add_argument("--backends", nargs="+", choices=["onnx", "onnx-int8"], default=["onnx", "onnx-int8"])
+    parser.add_argument("--sample", type=int, default=500, help="pseudo-queries drawn from chunks.db")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=0, help="onnxruntime intra-op threads")
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+
+    questions, qrels, pseudo = sample_queries(args.sample)
+    queries = questions + pseudo
+    index, index_info = read_index(FAISS_INDEX)
+
+    reference = SentenceTransformer("all-MiniLM-L6-v2", device="cpu")
+    ref_vecs = np.asarray(reference.encode(queries, batch_size=64), dtype="float32")
+    ref_labels = search(index, index_info, ref_vecs, args.k)
+    report = {"torch": {
+        "encode_ms": encode_latency_ms(reference, queries),
+        f"qrels_recall@{args.k}": qrels_recall(ref_labels, questions, qrels, args.k),
+    }}
+
+    for backend in args.backends:
+        model = OnnxSentenceEncoder(quantized=backend == "onnx-int8", intra_op_threads=args.threads)
+        vecs = model.encode(queries, batch_size=64)
+        cos = np.sum(prepare_vectors(vecs, "ip") * prepare_vectors(ref_vecs, "ip"), axis=1)
+        labels = search(index, index_info, vecs, args.k)
+        overlap = [len(set(a.tolist()) & set(b.tolist())) / args.k for a, b in zip(labels, ref_labels)]
+        recall = qrels_recall(labels, questions, qrels, args.k)
+        report[backend] = {
+            "encode_ms": encode_latency_ms(model, queries),
+            "cosine_mean": float(cos.mean()),
+            "cosine_min": float(cos.min()),
+            "cosine_p01": float(np.percentile(cos, 1)),
+            f"overlap@{args.k}_vs_torch": float(np.mean(overlap)),
+            f"qrels_recall@{args.k}": recall,
+            f"qrels_recall@{args.k}_change": recall - report["torch"][f"qrels_recall@{args.k}"],
+        }
+
+    print(f"{len(queries)} queries ({len(questions)} judged), k={args.k}, index {index_info['index_type']}/{index_info['metric']}")
+    print(json.dumps(report, indent=2))
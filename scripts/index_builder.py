@@ -0,0 +1,184 @@
+# scripts/index_builder.py
+import json
+import math
+import os
+from typing import Optional, Tuple
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+METRICS = ("l2", "ip")
+
+
+def index_info_path(index_path: str) -> str:
+    """faiss_index.bin -> faiss_index.json (index type, build and search parameters)."""
+    return os.path.splitext(index_path)[0] + ".json"
+
+
+def default_nlist(n: int) -> int:
+    # ~4*sqrt(n) lists, but keep >= 39 training points per centroid
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def prepare_vectors(vectors: np.ndarray, metric: str = "l2") -> np.ndarray:
+    """float32 copy of vectors, L2-normalized for "ip" so inner product == cosine."""
+    vectors = np.array(vectors, dtype="float32", order="C", ndmin=2)
+    if metric == "ip":
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def build_index(
+    embeddings: np.ndarray,
+    index_type: str = "flat",
+    metric: str = "l2",
+    nlist: Optional[int] = None,
+    hnsw_m: int = 32,
+    ef_construction: int = 200,
+    pq_m: int = 48,
+    pq_bits: int = 8,
+    ids: Optional[np.ndarray] = None,
+) -> Tuple[faiss.Index, dict]:
+    """
+    Build (and train, if needed) a FAISS index over float32 embeddings.
+    metric="ip" L2-normalizes the vectors and searches by inner product, so
+    the index returns cosine similarities directly. Passing ids wraps the index
+    in an IndexIDMap2 so those ids (chunk_ids) are returned as labels.
+    Returns the index and the build parameters to store next to it.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric!r}; expected one of {METRICS}")
+    embeddings = prepare_vectors(embeddings, metric)
+    faiss_metric = faiss.METRIC_INNER_PRODUCT if metric == "ip" else faiss.METRIC_L2
+    n, dim = embeddings.shape
+    if index_type == "flat":
+        index = faiss.IndexFlat(dim, faiss_metric)
+        params = {}
+    elif index_type == "ivf":
+        nlist = nlist or default_nlist(n)
+        index = faiss.IndexIVFFlat(faiss.IndexFlat(dim, faiss_metric), dim, nlist, faiss_metric)
+        params = {"nlist": nlist}
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss_metric)
+        index.hnsw.efConstruction = ef_construction
+        params = {"hnsw_m": hnsw_m, "ef_construction": ef_construction}
+    elif index_type == "ivfpq":
+        nlist = nlist or default_nlist(n)
+        if dim % pq_m:
+            raise ValueError(f"pq_m={pq_m} must divide the embedding dimension {dim}")
+        index = faiss.IndexIVFPQ(faiss.IndexFlat(dim, faiss_metric), dim, nlist, pq_m, pq_bits, faiss_metric)
+        params = {"nlist": nlist, "pq_m": pq_m, "pq_bits": pq_bits}
+    else:
+        raise ValueError(f"Unknown index type {index_type!r}; expected one of {INDEX_TYPES}")
+
+    if not index.is_trained:
+        index.train(embeddings)
+    if ids is not None:
+        index = id_mapped(index)
+        index.add_with_ids(embeddings, np.asarray(ids, dtype="int64"))
+    else:
+        index.add(embeddings)
+    return index, params
+
+
+def set_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    """Apply query-time knobs; ignored for index types they do not apply to."""
+    if nprobe:
+        try:
+            faiss.extract_index_ivf(index).nprobe = int(nprobe)
+        except RuntimeError:
+            pass
+    if ef_search:
+        hnsw = faiss.downcast_index(unwrap_id_map(index))
+        if hasattr(hnsw, "hnsw"):
+            hnsw.hnsw.efSearch = int(ef_search)
+
+
+def selector_params(index: faiss.Index, labels: np.ndarray) -> faiss.SearchParameters:
+    """
+    SearchParameters restricting index.search to the given labels (IDSelectorBatch).
+    Explicit parameters replace the index's own nprobe / efSearch, so those are carried over.
+    """
+    sel = faiss.IDSelectorBatch(np.ascontiguousarray(labels, dtype="int64"))
+    inner = unwrap_id_map(index)
+    if isinstance(inner, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF(sel=sel, nprobe=inner.nprobe)
+    elif hasattr(inner, "hnsw"):
+        params = faiss.SearchParametersHNSW(sel=sel, efSearch=inner.hnsw.efSearch)
+    else:
+        params = faiss.SearchParameters(sel=sel)
+    params.selector = sel  # params only holds a raw pointer; keep the selector alive with it
+    return params
+
+
+def unwrap_id_map(index: faiss.Index) -> faiss.Index:
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def id_mapped(index: faiss.Index) -> faiss.IndexIDMap2:
+    """Wrap an (empty or filled) index so add_with_ids/remove_ids use chunk_ids as labels."""
+    if isinstance(faiss.downcast_index(index), faiss.IndexIDMap2):
+        return faiss.downcast_index(index)
+    if index.ntotal:
+        raise ValueError("id_mapped() needs an empty index; re-add its vectors with add_with_ids")
+    return faiss.IndexIDMap2(index)  # the wrapper keeps a reference to the inner index
+
+
+def stored_ids(index: faiss.Index) -> np.ndarray:
+    """Labels held by an IndexIDMap2 (i.e. the chunk_ids it contains)."""
+    return faiss.vector_to_array(faiss.downcast_index(index).id_map).astype("int64")
+
+
+def reconstruct_vectors(index: faiss.Index, info: dict, chunk_ids: np.ndarray) -> np.ndarray:
+    """
+    Stored vectors of the given chunk_ids (float32; lossy for IVF-PQ). IVF indexes get a
+    direct map first, which reconstruct() needs to find a vector by id.
+    """
+    keys = np.asarray(chunk_ids, dtype="int64")
+    if info.get("labels") != "chunk_id":
+        keys = keys - 1  # legacy index: row i holds chunk_id i+1
+    index = faiss.downcast_index(index)
+    inner = unwrap_id_map(index)
+    if isinstance(inner, faiss.IndexIVF) and inner.direct_map.type == faiss.DirectMap.NoMap:
+        # Behind an IndexIDMap2 the IVF ids are row numbers (array map); otherwise they are chunk_ids
+        wrapped = isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2))
+        inner.set_direct_map_type(faiss.DirectMap.Array if wrapped else faiss.DirectMap.Hashtable)
+    return np.vstack([index.reconstruct(int(key)) for key in keys]).astype("float32") if len(keys) else \
+        np.zeros((0, index.d), dtype="float32")
+
+
+def index_memory_bytes(index: faiss.Index) -> int:
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def write_index(index: faiss.Index, path: str, info: dict) -> None:
+    faiss.write_index(index, path)
+    info = dict(info, ntotal=int(index.ntotal), dim=int(index.d))
+    with open(index_info_path(path), "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=2)
+
+
+def read_index(path: str, mmap: bool = False) -> Tuple[faiss.Index, dict]:
+    """
+    Load an index and its sidecar info. Indexes built before the sidecar existed
+    are exact IndexFlatL2 and load as {"index_type": "flat", "metric": "l2"}.
+    info["labels"] is "row" when FAISS row i holds chunk_id i+1, or "chunk_id"
+    when the index was filled with add_with_ids (see scripts/ingest.py).
+    mmap=True maps the vector data read-only from the file instead of copying it
+    into the heap, so processes serving the same file share it via the page cache.
+    """
+    info_file = index_info_path(path)
+    info = {"index_type": "flat", "metric": "l2", "labels": "row", "params": {}, "search": {}}
+    if os.path.exists(info_file):
+        with open(info_file, "r", encoding="utf-8") as f:
+            info.update(json.load(f))
+    flags = 0
+    if mmap:
+        # IVF inverted lists map with IO_FLAG_MMAP; flat / HNSW vector storage needs IO_FLAG_MMAP_IFC
+        flags = faiss.IO_FLAG_MMAP if info["index_type"] in ("ivf", "ivfpq") else faiss.IO_FLAG_MMAP_IFC
+        flags |= faiss.IO_FLAG_READ_ONLY
+    return faiss.read_index(path, flags), info
@@ -0,0 +1,357 @@
+# scripts/ingest.py
+# Incremental, resumable ingestion. Only new or changed PDFs are parsed, chunked and
+# embedded; deleted PDFs are removed (or tombstoned) from the FAISS index, the FTS5
+# table and chunk_meta, all keyed on stable chunk_ids. New chunks that near-duplicate a
+# live chunk (or each other) are collapsed onto it at ingest (see scripts/dedup.py); removing a
+# canonical chunk promotes its first live duplicate. chunk_meta is the chunk record:
+# metadata.json is only rewritten from it with --export-metadata.
+# Usage: python scripts/ingest.py [--pdf-dir ispdfs] [--rebuild] [--index-type flat --metric ip]
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from index_builder import (INDEX_TYPES, METRICS, build_index, prepare_vectors, read_index,
+                           stored_ids, write_index)
+from pdfread import chunk_pdf, load_sources
+from chunk_io import ChunkWriter
+from chunk_store import COLUMNS, create_chunk_store, delete_chunks, insert_chunks
+from dedup import StoredNearDuplicateIndex, duplicate_ref
+from sentence_index import SENTENCE_META_FILE, build_sentence_index, sentence_index_is_current, update_sentence_index
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+PDF_FOLDER = os.path.join(PROJECT_ROOT, "ispdfs")
+FAISS_INDEX = os.path.join(PROJECT_ROOT, "faiss_index.bin")
+METADATA_FILE = os.path.join(PROJECT_ROOT, "metadata.json")
+DB_FILE = os.path.join(PROJECT_ROOT, "chunks.db")
+MANIFEST_FILE = os.path.join(PROJECT_ROOT, "ingest_manifest.json")
+EMBED_BATCH_SIZE = 64
+_model = None
+
+
+def encode(texts):
+    global _model
+    if _model is None:
+        from sentence_transformers import SentenceTransformer
+        _model = SentenceTransformer("all-MiniLM-L6-v2", device="cpu")
+    return _model.encode(texts, batch_size=64)
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_json_atomic(path, obj, indent=2):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=indent, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def write_index_atomic(index, info):
+    tmp = FAISS_INDEX + ".tmp"
+    write_index(index, tmp, info)
+    os.replace(tmp, FAISS_INDEX)
+    os.replace(os.path.splitext(tmp)[0] + ".json", os.path.splitext(FAISS_INDEX)[0] + ".json")
+
+
+def open_index():
+    """
+    Load the index in chunk_id-labelled form. A legacy flat index (row i = chunk_id i+1)
+    is converted in place; other legacy index types have to be rebuilt.
+    """
+    if not os.path.exists(FAISS_INDEX):
+        return None, None
+    index, info = read_index(FAISS_INDEX)
+    if info["labels"] == "chunk_id":
+        return index, info
+    if info["index_type"] != "flat":
+        raise SystemExit(f"{FAISS_INDEX} is a row-labelled {info['index_type']} index; rerun with --rebuild")
+    vectors = index.reconstruct_n(0, index.ntotal)
+    index, _ = build_index(vectors, "flat", metric=info["metric"], ids=np.arange(1, index.ntotal + 1))
+    info["labels"] = "chunk_id"
+    print(f"Converted legacy flat index ({index.ntotal} vectors) to chunk_id labels.")
+    return index, info
+
+
+def open_fts():
+    conn = sqlite3.connect(DB_FILE)
+    # Same schema as create_chunks_db.py; rowid and rank_val both hold the chunk_id
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING FTS5(pdf, text, rank_val UNINDEXED)")
+    create_chunk_store(conn)
+    return conn
+
+
+def adopt_existing(manifest, conn, pdf_files):
+    """
+    First run over an existing corpus: record which chunk_ids each PDF already owns,
+    including chunks collapsed onto a canonical one by dedup.py.
+    """
+    by_source = {}
+    for cid, source_pdf, duplicates in conn.execute("SELECT chunk_id, source_pdf, duplicates FROM chunk_meta"):
+        by_source.setdefault(source_pdf, []).append(cid)
+        for ref in json.loads(duplicates or "[]"):
+            by_source.setdefault(ref["source_pdf"], []).append(ref["chunk_id"])
+    for pdf_file, sha in pdf_files.items():
+        if pdf_file in by_source:
+            manifest["documents"][sha] = {"file": pdf_file, "chunk_ids": sorted(by_source[pdf_file])}
+    print(f"Adopted {len(manifest['documents'])} already-indexed PDFs into {MANIFEST_FILE}.")
+
+
+def promote_duplicates(orphaned, docs, pdf_dir, sources):
+    """
+    orphaned: live duplicate refs of canonical chunks whose PDF was removed, one list per
+    removed chunk. The first live ref of each becomes the new canonical chunk, carrying the
+    rest as its duplicates. Collapsed chunks are not stored, so their text comes from
+    re-chunking the owning PDF (chunking is deterministic and chunk_ids follow chunk order).
+    """
+    owner = {cid: sha for sha, doc in docs.items() for cid in doc["chunk_ids"]}
+    parsed = {}
+    promoted = []
+    for refs in orphaned:
+        ref = refs[0]
+        sha = owner[ref["chunk_id"]]
+        if sha not in parsed:
+            doc = docs[sha]
+            doc_chunks = chunk_pdf(os.path.join(pdf_dir, doc["file"]), sources.get(doc["file"], doc["file"]))
+            parsed[sha] = dict(zip(doc["chunk_ids"], doc_chunks)) if len(doc_chunks) == len(doc["chunk_ids"]) else {}
+        chunk = parsed[sha].get(ref["chunk_id"])
+        if chunk is None or chunk.get("chunk_number") != ref.get("chunk_number"):
+            print(f"[WARN] {docs[sha]['file']} no longer chunks as it did at ingest; {len(refs)} collapsed "
+                  "duplicates cannot be promoted, rerun with --rebuild to index them again")
+            continue
+        promoted.append({"chunk_id": ref["chunk_id"], **chunk, "duplicates": refs[1:]})
+    return promoted
+
+
+def sign_unsigned(dedup, conn, skip, batch_size=1000):
+    """Add live chunk_meta rows the dedup tables do not cover yet; a one-off pass after upgrading."""
+    ids = [cid for cid in dedup.unsigned() if cid not in skip]
+    for start in range(0, len(ids), batch_size):
+        rows = conn.execute("SELECT chunk_id, text FROM chunk_meta WHERE chunk_id IN (SELECT value FROM json_each(?))",
+                            (json.dumps(ids[start:start + batch_size]),)).fetchall()
+        for cid, text in rows:
+            dedup.insert(cid, dedup.signature(text))
+    return len(ids)
+
+
+def export_metadata(conn, path):
+    """Write chunk_meta out as a metadata.json array, in chunk_id order, for scripts that still read it."""
+    with ChunkWriter(path) as writer:
+        for row in conn.execute(f"SELECT {', '.join(COLUMNS)} FROM chunk_meta ORDER BY chunk_id"):
+            chunk = dict(zip(COLUMNS, row))
+            for column in ("page_breaks", "duplicates"):
+                chunk[column] = json.loads(chunk[column]) if chunk[column] else None
+            writer.write({k: v for k, v in chunk.items() if v is not None})
+    return writer.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally ingest PDFs into the index, FTS5 table and chunk_meta")
+    parser.add_argument("--pdf-dir", default=PDF_FOLDER)
+    parser.add_argument("--rebuild", action="store_true", help="ignore existing state and ingest every PDF")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat", help="used when a new index is created")
+    parser.add_argument("--metric", choices=METRICS, default="l2", help="used when a new index is created")
+    parser.add_argument("--train-size", type=int, default=50000, help="vectors used to train a new IVF/IVF-PQ index")
+    parser.add_argument("--dedup-threshold", type=float, default=0.8,
+                        help="collapse new chunks this similar to a live one (MinHash Jaccard); 1 disables")
+    parser.add_argument("--export-metadata", action="store_true",
+                        help=f"also rewrite {os.path.basename(METADATA_FILE)} from chunk_meta (reads the whole corpus)")
+    args = parser.parse_args()
+
+    sources = load_sources()
+    pdf_files = {
+        name: file_sha256(os.path.join(args.pdf_dir, name))
+        for name in sorted(os.listdir(args.pdf_dir)) if name.endswith(".pdf")
+    }
+
+    # --- Load current state ---
+    manifest = {"next_chunk_id": 1, "documents": {}, "tombstones": []}
+    index, info = None, None
+    conn = open_fts()
+    if not args.rebuild:
+        manifest = load_json(MANIFEST_FILE, manifest)
+        index, info = open_index()
+        if not manifest["documents"] and conn.execute("SELECT 1 FROM chunk_meta LIMIT 1").fetchone():
+            adopt_existing(manifest, conn, pdf_files)
+    if info is None:
+        info = {"index_type": args.index_type, "metric": args.metric, "params": {}, "search": {}}
+
+    # --- Diff the folder against the manifest (keyed by content hash) ---
+    current = {sha: name for name, sha in pdf_files.items()}
+    docs = manifest["documents"]
+    removed_ids = set()
+    for sha in list(docs):
+        if sha not in current:
+            doc = docs.pop(sha)
+            removed_ids.update(doc["chunk_ids"])
+            print(f"Removed: {doc['file']}")
+        elif docs[sha]["file"] != current[sha]:
+            docs[sha]["file"] = current[sha]  # renamed, content unchanged
+    added = [(sha, name) for sha, name in current.items() if sha not in docs]
+
+    # Every store is reconciled against the chunk_ids owned by manifest documents, so
+    # chunks of deleted PDFs and orphans left by an interrupted run are both dropped
+    owned = {cid for doc in docs.values() for cid in doc["chunk_ids"]}
+    tombstones = set(manifest["tombstones"])
+    fts_ids = [row[0] for row in conn.execute("SELECT rowid FROM chunks")]
+    stored_meta = [row[0] for row in conn.execute("SELECT chunk_id FROM chunk_meta")]
+    index_ids = [int(i) for i in stored_ids(index)] if index is not None else []
+    stale_vectors = sorted(i for i in index_ids if i not in owned and i not in tombstones)
+    stale_rows = sorted(i for i in fts_ids if i not in owned)
+    stale_meta = sorted(i for i in stored_meta if i not in owned)
+
+    next_id = max([manifest["next_chunk_id"]] + [i + 1 for i in index_ids + fts_ids + stored_meta]) if not args.rebuild else 1
+
+    # --- Parse + chunk new/changed PDFs ---
+    new_chunks = []
+    for sha, name in added:
+        doc_chunks = chunk_pdf(os.path.join(args.pdf_dir, name), sources.get(name, name))
+        ids = list(range(next_id, next_id + len(doc_chunks)))
+        next_id += len(doc_chunks)
+        for cid, chunk in zip(ids, doc_chunks):
+            new_chunks.append({"chunk_id": cid, **chunk})
+        docs[sha] = {"file": name, "chunk_ids": ids}
+        print(f"Added: {name} ({len(doc_chunks)} chunks)")
+
+    # --- Near-duplicates: only canonical chunks are embedded and indexed, the rest are cited on them ---
+    updated = {}  # live chunk_id -> its new duplicates list
+    orphaned = []  # live duplicates of removed canonical chunks, one list per removed chunk
+    if stale_meta or removed_ids:
+        # Only chunks that carry duplicates can hold refs to removed ones
+        for cid, duplicates in conn.execute("SELECT chunk_id, duplicates FROM chunk_meta "
+                                            "WHERE duplicates IS NOT NULL AND duplicates != '[]'"):
+            refs = json.loads(duplicates)
+            live_refs = [d for d in refs if d["chunk_id"] in owned]
+            if cid not in owned:
+                if live_refs:
+                    orphaned.append(live_refs)
+            elif len(live_refs) != len(refs):
+                updated[cid] = live_refs
+    # A removed canonical chunk hands its cluster to its first live duplicate, which is embedded and indexed below
+    promoted = promote_duplicates(orphaned, docs, args.pdf_dir, sources)
+    if promoted:
+        print(f"Promoted {len(promoted)} collapsed duplicates to canonical chunks of removed ones.")
+    # Signatures and LSH buckets persist in chunks.db, so a run only signs the chunks it adds
+    dedup = StoredNearDuplicateIndex(conn, threshold=args.dedup_threshold)
+    dedup.remove(stale_meta)
+    if (new_chunks or promoted) and args.dedup_threshold < 1:
+        signed = sign_unsigned(dedup, conn, set(stale_meta))
+        if signed:
+            print(f"Stored MinHash signatures for {signed} existing chunks.")
+        fresh = {}  # canonical chunks added by this run, by chunk_id
+        for chunk in promoted:
+            dedup.insert(chunk["chunk_id"], dedup.signature(chunk["text"]))
+            fresh[chunk["chunk_id"]] = chunk
+        canonical_chunks = []
+        for chunk in new_chunks:
+            canonical = dedup.add(chunk["chunk_id"], chunk["text"])
+            if canonical is None:
+                fresh[chunk["chunk_id"]] = chunk
+                canonical_chunks.append(chunk)
+            elif canonical in fresh:
+                target = fresh[canonical]
+                target["duplicates"] = (target.get("duplicates") or []) + [duplicate_ref(chunk)]
+            else:
+                if canonical not in updated:
+                    row = conn.execute("SELECT duplicates FROM chunk_meta WHERE chunk_id = ?", (canonical,)).fetchone()
+                    updated[canonical] = json.loads(row[0] or "[]")
+                updated[canonical].append(duplicate_ref(chunk))
+        if len(canonical_chunks) < len(new_chunks):
+            print(f"Collapsed {len(new_chunks) - len(canonical_chunks)} near-duplicate chunks onto existing ones.")
+        new_chunks = canonical_chunks
+    new_chunks = promoted + new_chunks
+
+    if not (new_chunks or stale_vectors or stale_rows or stale_meta or updated or args.rebuild):
+        if args.export_metadata:
+            print(f"Exported {export_metadata(conn, METADATA_FILE)} chunks to {METADATA_FILE}.")
+        conn.close()
+        save_json_atomic(MANIFEST_FILE, manifest)
+        print("Nothing to ingest; index is up to date.")
+        return
+
+    # --- FAISS: remove (or tombstone) old chunk_ids, append new ones ---
+    if stale_vectors:
+        selector = faiss.IDSelectorBatch(np.array(stale_vectors, dtype="int64"))
+        try:
+            index.remove_ids(selector)
+        except RuntimeError:
+            # HNSW cannot delete; the API skips ids that are missing from metadata
+            tombstones.update(stale_vectors)
+            print(f"Tombstoned {len(stale_vectors)} chunk_ids ({info['index_type']} does not support removal).")
+    if new_chunks:
+        # A new IVF/IVF-PQ index is trained once train_size vectors (or all new ones) are
+        # encoded, as in create_embeddings.py; flat/HNSW start with the first batch
+        train_rows = min(len(new_chunks), args.train_size) if info["index_type"] in ("ivf", "ivfpq") else 1
+        pending_vectors, pending_ids = [], []
+        for start in range(0, len(new_chunks), EMBED_BATCH_SIZE):
+            batch = new_chunks[start:start + EMBED_BATCH_SIZE]
+            vectors = encode([c["text"] for c in batch])
+            ids = np.array([c["chunk_id"] for c in batch], dtype="int64")
+            if index is not None:
+                index.add_with_ids(prepare_vectors(vectors, info["metric"]), ids)
+                continue
+            pending_vectors.append(vectors)
+            pending_ids.append(ids)
+            if start + len(batch) >= train_rows:
+                index, info["params"] = build_index(np.vstack(pending_vectors), info["index_type"],
+                                                    metric=info["metric"], ids=np.concatenate(pending_ids))
+                pending_vectors, pending_ids = [], []
+    if index is None:
+        raise SystemExit(f"No PDFs found in {args.pdf_dir}")
+
+    # --- FTS5 + chunk_meta store ---
+    # Sentence spans index into chunk_meta text, so note whether they match it before it changes
+    sentences_current = os.path.exists(SENTENCE_META_FILE) and sentence_index_is_current(DB_FILE)
+    with conn:
+        delete_chunks(conn, stale_meta)
+        insert_chunks(conn, new_chunks)
+        conn.executemany("UPDATE chunk_meta SET duplicates = ? WHERE chunk_id = ?",
+                         [(json.dumps(refs), cid) for cid, refs in updated.items()])
+        conn.executemany("DELETE FROM chunks WHERE rowid = ?", [(i,) for i in stale_rows])
+        conn.executemany(
+            "INSERT INTO chunks (rowid, pdf, text, rank_val) VALUES (?, ?, ?, ?)",
+            [(c["chunk_id"], c["pdf"], c["text"], c["chunk_id"]) for c in new_chunks],
+        )
+    if args.export_metadata:
+        print(f"Exported {export_metadata(conn, METADATA_FILE)} chunks to {METADATA_FILE}.")
+    elif os.path.exists(METADATA_FILE):
+        print(f"[WARN] {METADATA_FILE} is not kept in sync by ingest.py; pass --export-metadata to refresh it")
+    conn.close()
+
+    # --- Sentence index (scripts/sentence_index.py), when in use: patched, or rebuilt if it was stale ---
+    if os.path.exists(SENTENCE_META_FILE):
+        if sentences_current and not args.rebuild:
+            n = update_sentence_index(encode, stale_meta, new_chunks, DB_FILE)
+        else:
+            n = build_sentence_index(encode, DB_FILE)
+        print(f"Sentence index holds {n} sentences.")
+
+    # --- Persist: index, then the manifest last ---
+    info["labels"] = "chunk_id"
+    write_index_atomic(index, info)
+    manifest["next_chunk_id"] = next_id
+    manifest["tombstones"] = sorted(tombstones)
+    save_json_atomic(MANIFEST_FILE, manifest)
+    print(f"Ingested {len(new_chunks)} new chunks, removed {len(stale_meta)}; index holds {index.ntotal} vectors.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,170 @@
 # learned_reranker.py
+# Learned reranker: vectorized features per candidate, offline training on qrels.json.
+# Run once after (re)building the index:
+#     python scripts/learned_reranker.py
+# The API loads the saved artifact instead of training at import time.
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Callable, Dict, Iterable, List
+
+import joblib
 import numpy as np
 from sklearn.linear_model import LogisticRegression
-from typing import Callable, List, Dict
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+from query_cache import LRUCache
+from sqlite_pool import STOPWORDS
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+RERANKER_FILE = os.path.join(PROJECT_ROOT, "reranker.joblib")
+QRELS_FILE = os.path.join(PROJECT_ROOT, "qrels.json")  # {question: [relevant chunk_ids]}
+ARTIFACT_VERSION = 2
+
+# Column order of the feature matrix
+FEATURES = ("vector", "bm25", "term_overlap", "position", "is_first_paragraph", "log_chunk_len")
+
+
+def index_fingerprint(paths: List[str]) -> str:
+    """
+    Cheap content fingerprint of the index files: size plus the first and last MiB
+    of each, so it changes on every rebuild without hashing multi-GB indexes.
+    """
+    h = hashlib.sha256()
+    for path in paths:
+        size = os.path.getsize(path)
+        h.update(f"{os.path.basename(path)}:{size}".encode())
+        with open(path, "rb") as f:
+            h.update(f.read(1 << 20))
+            if size > 2 << 20:
+                f.seek(-(1 << 20), os.SEEK_END)
+                h.update(f.read())
+    return h.hexdigest()
+
+
+def terms(text: str) -> frozenset:
+    return frozenset(t for t in re.findall(r"\w+", text.lower()) if t not in STOPWORDS)
+
+
+class ChunkFeatureCache:
+    """
+    Query-independent features per chunk_id, read from chunk_meta once and kept in an
+    LRU: a row of [position, is_first_paragraph, log_chunk_len] plus the chunk's term set.
+    """
+
+    def __init__(self, store, maxsize: int = 20000):
+        self.store = store
+        self.cache = LRUCache(maxsize)
+
+    def get(self, chunk_ids: Iterable[int]):
+        chunk_ids = [int(i) for i in chunk_ids]
+        found = {i: self.cache.get(i) for i in chunk_ids}
+        missing = [i for i, f in found.items() if f is None]
+        if missing:
+            rows = self.store.get(missing, columns=("chunk_number", "total_chunks", "is_first_paragraph", "chunk_len", "text"))
+            for i in missing:
+                row = rows[i]
+                position = (row["chunk_number"] - 1) / max(row["total_chunks"] - 1, 1)
+                static = np.array([position, row["is_first_paragraph"], np.log1p(row["chunk_len"])])
+                found[i] = (static, terms(row["text"]))
+                self.cache.put(i, found[i])
+        return [found[i] for i in chunk_ids]
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+
+def feature_matrix(query: str, cand: Dict[str, np.ndarray], chunk_features: ChunkFeatureCache) -> np.ndarray:
+    """(n_candidates, len(FEATURES)) matrix for fused_retrieval candidates, columns as in FEATURES."""
+    feats = chunk_features.get(cand["ids"])
+    q_terms = terms(query)
+    overlap = np.array([len(q_terms & t) for _, t in feats], dtype="float64") / max(len(q_terms), 1)
+    static = np.array([s for s, _ in feats]).reshape(len(feats), 3)
+    return np.column_stack([cand["vector"], cand["keyword"], overlap, static])
+
+
+def rerank(model, X: np.ndarray, top_k: int):
+    """Score all candidates with one predict_proba call; return (order, scores) of the top_k."""
+    scores = model.predict_proba(X)[:, 1]
+    if len(scores) > top_k:
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        top = np.arange(len(scores))
+    # Stable on ties so equal scores keep retrieval order
+    order = top[np.lexsort((top, -scores[top]))]
+    return order, scores[order]
+
+
+def load_qrels(path: str = QRELS_FILE) -> Dict[str, set]:
+    with open(path, "r", encoding="utf-8") as f:
+        return {q: set(ids) for q, ids in json.load(f).items()}
+
+
+def qrels_folds(qrels: Dict[str, set], k: int) -> List[Dict[str, set]]:
+    """
+    Split qrels into k disjoint folds for cross-validation. Questions are dealt
+    round-robin in sorted order, so the folds are balanced and stable across runs.
+    """
+    k = max(1, min(k, len(qrels)))
+    folds = [{} for _ in range(k)]
+    for i, q in enumerate(sorted(qrels)):
+        folds[i % k][q] = qrels[q]
+    return folds
+
 
 def train_learned_reranker(
-    baseline_search_fn: Callable[[str, int], List[Dict]],
-    keyword_search_fn: Callable[[str, int], List[Dict]]
-) -> LogisticRegression:
-    """
-    Train a tiny logistic regression reranker using baseline and keyword scores.
-    Pass the actual search functions from ask_api.py when calling this function.
-    """
-
-    questions = [
-        "What are PPE safety requirements?",
-        "How to safely operate a laser scanner?",
-        "Define safety functions for machinery.",
-        "Explain risk reduction steps for operators.",
-        "What are type-C standards in ISO 13849-1?",
-        "How to calculate performance level (PL) for a safety function?",
-        "List hazards in industrial machinery.",
-        "When should emergency stop be applied?"
-    ]
-
-    features = []
-    labels = []
-
-    for q in questions:
-        baseline_results = baseline_search_fn(q, 5)
-        keyword_results = keyword_search_fn(q, 5)
-
-        combined = {}
-        for r in baseline_results:
-            key = r['text'][:100]
-            combined[key] = {"pdf": r['pdf'], "text": r['text'], "vector_score": r['score'], "keyword_score": 0}
-
-        for r in keyword_results:
-            key = r['text'][:100]
-            if key in combined:
-                combined[key]['keyword_score'] = r['score']
-            else:
-                combined[key] = {"pdf": r['pdf'], "text": r['text'], "vector_score": 0, "keyword_score": r['score']}
-
-        for v in combined.values():
-            features.append([v['vector_score'], v['keyword_score']])
-            # Placeholder label: consider chunks with vector_score >0.4 as relevant
-            labels.append(1 if v['vector_score'] > 0.4 else 0)
-
-    clf = LogisticRegression()
-    clf.fit(np.array(features), np.array(labels))
-    return clf
+    retrieve_fn: Callable[[str, int], Dict[str, np.ndarray]],
+    chunk_features: ChunkFeatureCache,
+    qrels: Dict[str, set],
+    n_candidates: int = 30,
+):
+    """
+    Fit a scaled logistic regression on FEATURES. Each judged question contributes its
+    fused_retrieval candidates, labelled 1 if the chunk_id is relevant in qrels.
+    """
+    X, y = [], []
+    for q, relevant in qrels.items():
+        cand = retrieve_fn(q, n_candidates)
+        X.append(feature_matrix(q, cand, chunk_features))
+        y.append(np.isin(cand["ids"], list(relevant)).astype(int))
+    X, y = np.vstack(X), np.concatenate(y)
+    if len(np.unique(y)) < 2:
+        raise ValueError("qrels produced only one label class among the retrieved candidates")
+    model = make_pipeline(StandardScaler(), LogisticRegression(class_weight='balanced', random_state=42))
+    model.fit(X, y)
+    return model
+
+
+def save_reranker(model, fingerprint: str, path: str = RERANKER_FILE) -> None:
+    # Written to a temp file and renamed, so a running API never loads a half-written artifact
+    tmp = path + ".tmp"
+    joblib.dump({
+        "version": ARTIFACT_VERSION,
+        "model": model,
+        "features": FEATURES,
+        "index_fingerprint": fingerprint,
+        "trained_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }, tmp)
+    os.replace(tmp, path)
+
+
+def load_reranker(path: str = RERANKER_FILE) -> Dict:
+    artifact = joblib.load(path)
+    if artifact.get("version") != ARTIFACT_VERSION:
+        raise ValueError(f"{path} has artifact version {artifact.get('version')}, expected {ARTIFACT_VERSION}")
+    if tuple(artifact["features"]) != FEATURES:
+        raise ValueError(f"{path} was trained on features {artifact['features']}, expected {FEATURES}")
+    return artifact
+
+
+if __name__ == "__main__":
+    import ask_api
+
+    qrels = load_qrels()
+    model = train_learned_reranker(ask_api.fused_retrieval, ask_api.chunk_features, qrels)
+    fingerprint = index_fingerprint(ask_api.INDEX_FILES)
+    save_reranker(model, fingerprint)
+    print(f"Saved learned reranker to {RERANKER_FILE} (index {fingerprint[:12]})")
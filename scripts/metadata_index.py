@@ -0,0 +1,84 @@
+# scripts/metadata_index.py
+import json
+import sqlite3
+from collections import defaultdict
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+
+class MetadataIndex:
+    """
+    Inverted index over chunk_meta for filtered retrieval. source_pdf and title map to
+    the rows of their chunks; page range and position (chunk_number within its PDF) are
+    numpy columns. Built in one pass over chunks.db (a few bytes per chunk); resolve()
+    turns a filter into the sorted chunk_id set FAISS and FTS5 are restricted to.
+    Near-duplicates collapsed at ingest (scripts/dedup.py) get rows of their own that
+    point at their canonical chunk, so filtering on their PDF still finds the passage.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(chunk_meta)")}
+        duplicates = "duplicates" if "duplicates" in columns else "NULL"
+        rows = []
+        for row in conn.execute(
+            f"SELECT chunk_id, source_pdf, title, page_start, page_end, chunk_number, {duplicates} "
+            "FROM chunk_meta ORDER BY chunk_id"
+        ):
+            rows.append(row[:6])
+            for d in json.loads(row[6]) if row[6] else ():
+                rows.append((row[0], d.get("source_pdf"), d.get("title"), d.get("page_start"),
+                             d.get("page_end"), d.get("chunk_number")))
+        self.chunk_ids = np.array([r[0] for r in rows], dtype="int64")
+        self.page_start = np.array([r[3] or 0 for r in rows], dtype="int64")
+        self.page_end = np.array([r[4] or r[3] or 0 for r in rows], dtype="int64")
+        self.chunk_number = np.array([r[5] or 0 for r in rows], dtype="int64")
+
+        by_pdf, by_title = defaultdict(list), defaultdict(list)
+        for row, r in enumerate(rows):
+            by_pdf[(r[1] or "").lower()].append(row)
+            by_title[(r[2] or "").lower()].append(row)
+        self.by_pdf: Dict[str, np.ndarray] = {k: np.array(v, dtype="int64") for k, v in by_pdf.items()}
+        self.by_title: Dict[str, np.ndarray] = {k: np.array(v, dtype="int64") for k, v in by_title.items()}
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    @staticmethod
+    def _union(postings: Iterable[np.ndarray]) -> np.ndarray:
+        postings = list(postings)
+        return np.unique(np.concatenate(postings)) if postings else np.zeros(0, dtype="int64")
+
+    def resolve(self, source_pdf: Optional[Iterable[str]] = None, title: Optional[str] = None,
+                page_min: Optional[int] = None, page_max: Optional[int] = None,
+                chunk_min: Optional[int] = None, chunk_max: Optional[int] = None) -> Optional[np.ndarray]:
+        """
+        Sorted chunk_ids matching every given condition, or None when nothing is filtered.
+        source_pdf: any of these file names (case-insensitive). title: case-insensitive
+        substring. page_min/page_max: the chunk overlaps that page range.
+        chunk_min/chunk_max: chunk_number range within its PDF (chunk_max=1: first chunks only).
+        """
+        rows = None  # row positions still in the running; None = all
+        if source_pdf:
+            rows = self._union(self.by_pdf[p.lower()] for p in source_pdf if p.lower() in self.by_pdf)
+        if title:
+            needle = title.lower()
+            matched = self._union(v for t, v in self.by_title.items() if needle in t)
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+
+        ranges = [(self.page_end, page_min, None), (self.page_start, None, page_max),
+                  (self.chunk_number, chunk_min, chunk_max)]
+        ranges = [(col, lo, hi) for col, lo, hi in ranges if lo is not None or hi is not None]
+        if rows is None and not ranges:
+            return None
+        if rows is None:
+            rows = np.arange(len(self.chunk_ids))
+        for col, lo, hi in ranges:
+            values = col[rows]
+            keep = np.ones(len(rows), dtype=bool)
+            if lo is not None:
+                keep &= values >= lo
+            if hi is not None:
+                keep &= values <= hi
+            rows = rows[keep]
+        return np.unique(self.chunk_ids[rows])
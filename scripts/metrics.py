@@ -0,0 +1,216 @@
+# scripts/metrics.py
+import bisect
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+# Seconds; covers sub-millisecond FAISS/FTS5 calls up to multi-second cold encodes
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels] + ([extra] if extra else [])
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    """Cumulative-bucket histogram, rendered in the Prometheus text format."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines, cumulative = [], 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += n
+            le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+            lines.append(f"{name}_bucket{_labels(labels, le)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {self.sum}")
+        lines.append(f"{name}_count{_labels(labels)} {self.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Histograms and counters keyed by (name, labels), plus gauges read from callbacks
+    at scrape time (queue depth, cache sizes...). render() -> /metrics body.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._help[name] = (kind, help_text)
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def gauge(self, name: str, help_text: str, fn: Callable[[], float]) -> None:
+        self.describe(name, "gauge", help_text)
+        self._gauges[name] = fn
+
+    def render(self) -> str:
+        out, seen = [], set()
+
+        def header(name):
+            if name not in seen and name in self._help:
+                kind, help_text = self._help[name]
+                out.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"])
+            seen.add(name)
+
+        with self._lock:
+            for (name, labels), hist in sorted(self._histograms.items()):
+                header(name)
+                out.extend(hist.render(name, labels))
+            for (name, labels), value in sorted(self._counters.items()):
+                header(name)
+                out.append(f"{name}{_labels(labels)} {value}")
+        for name, fn in self._gauges.items():
+            header(name)
+            out.append(f"{name} {fn()}")
+        return "\n".join(out) + "\n"
+
+
+registry = MetricsRegistry()
+registry.describe("rag_stage_seconds", "histogram", "Time spent in each /ask pipeline stage")
+registry.describe("rag_request_seconds", "histogram", "End-to-end /ask latency by mode")
+registry.describe("rag_requests_total", "counter", "/ask requests by mode and outcome")
+
+# --- Per-request stage trace (propagated into executor threads via contextvars) ---
+_trace: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("rag_trace", default=None)
+
+
+def start_trace() -> Dict[str, float]:
+    """Collect stage timings (ms) of the current request into the returned dict."""
+    trace = {}
+    _trace.set(trace)
+    return trace
+
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.observe("rag_stage_seconds", elapsed, stage=name)
+        trace = _trace.get()
+        if trace is not None:
+            trace[name] = trace.get(name, 0.0) + 1000.0 * elapsed
+
+
+def submit_in_context(pool, fn, *args):
+    """pool.submit that carries the caller's contextvars (and so its trace) into the worker."""
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+def memory_usage(pid: Optional[int] = None) -> Dict[str, float]:
+    """
+    Shared vs private resident memory (MB) of a process from /proc/<pid>/smaps_rollup.
+    Shared pages (copy-on-write after fork, mmap'd index/DB files) are counted once
+    across workers in pss; private pages are what each extra worker really costs.
+    """
+    path = f"/proc/{pid or os.getpid()}/smaps_rollup"
+    if not os.path.exists(path):
+        return {}
+    fields = {}
+    with open(path, "r") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024.0
+    return {
+        "rss_mb": fields.get("Rss", 0.0),
+        "pss_mb": fields.get("Pss", 0.0),
+        "shared_mb": fields.get("Shared_Clean", 0.0) + fields.get("Shared_Dirty", 0.0),
+        "private_mb": fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0),
+    }
+
+
+class SamplingProfiler:
+    """
+    Low-overhead wall-clock sampler, off until start(). A background thread snapshots
+    every thread's stack each interval_ms into a bounded ring. capture() turns the
+    samples one thread took during a time window into collapsed stacks
+    ("file:func;file:func count", flamegraph-ready), e.g. for a slow request.
+    """
+
+    def __init__(self, interval_ms: float = 5.0, max_samples: int = 50000, max_captures: int = 20):
+        self.interval = interval_ms / 1000.0
+        self._samples = deque(maxlen=max_samples)  # (timestamp, thread_id, stack)
+        self.captures = deque(maxlen=max_captures)
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: Optional[float] = None) -> None:
+        if interval_ms:
+            self.interval = interval_ms / 1000.0
+        if self.enabled:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._samples.clear()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f"{frame.f_code.co_filename.rsplit('/', 1)[-1]}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                self._samples.append((now, tid, ";".join(reversed(stack))))
+
+    def collapsed(self, thread_id: Optional[int] = None, start: float = 0.0, end: float = float("inf")) -> Dict[str, int]:
+        counts = Counter(s for t, tid, s in list(self._samples)
+                         if start <= t <= end and (thread_id is None or tid == thread_id))
+        return dict(counts.most_common())
+
+    def capture(self, label: str, thread_id: int, start: float, end: float, **info) -> None:
+        self.captures.append({
+            "label": label,
+            "duration_ms": 1000.0 * (end - start),
+            **info,
+            "stacks": self.collapsed(thread_id, start, end),
+        })
@@ -0,0 +1,165 @@
+# scripts/onnx_runtime.py
+# ONNX export, int8 dynamic quantization and onnxruntime inference for the small
+# transformer models used at query time. onnx/onnxruntime are optional dependencies:
+#     pip install onnx onnxruntime
+# Export once, e.g.:
+#     python scripts/onnx_runtime.py encoder --quantize
+#     python scripts/onnx_runtime.py cross --quantize
+import argparse
+import os
+
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+MODELS_DIR = os.path.join(PROJECT_ROOT, "models")
+
+# Same weights as SentenceTransformer("all-MiniLM-L6-v2"): mean pooling + L2 normalization
+ENCODER_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+ENCODER_ONNX_DIR = os.path.join(MODELS_DIR, "query-encoder")
+
+CROSS_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+CROSS_ONNX_DIR = os.path.join(MODELS_DIR, "cross-encoder")
+
+MODEL_FILE = "model.onnx"
+QUANTIZED_FILE = "model.int8.onnx"
+
+
+def _require_onnxruntime():
+    try:
+        import onnxruntime
+    except ImportError:
+        raise RuntimeError("onnxruntime is not installed; `pip install onnx onnxruntime` to use ONNX backends")
+    return onnxruntime
+
+
+def export_onnx(model_name: str, out_dir: str, task: str = "embedding", opset: int = 17) -> str:
+    """
+    Export a Hugging Face encoder to out_dir/model.onnx (plus its tokenizer).
+    task="embedding" outputs last_hidden_state (pooling happens in numpy);
+    task="cross" outputs the sequence-classification logits.
+    """
+    import torch
+    from transformers import AutoModel, AutoModelForSequenceClassification, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model_cls = AutoModelForSequenceClassification if task == "cross" else AutoModel
+    model = model_cls.from_pretrained(model_name).eval()
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer.save_pretrained(out_dir)
+
+    sample = tokenizer(["what is a safety function"], ["a passage"] if task == "cross" else None, return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    output_name = "logits" if task == "cross" else "last_hidden_state"
+
+    class Wrapper(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs)))[0]
+
+    dynamic_axes = {n: {0: "batch", 1: "sequence"} for n in input_names}
+    dynamic_axes[output_name] = {0: "batch"} if task == "cross" else {0: "batch", 1: "sequence"}
+    path = os.path.join(out_dir, MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            Wrapper(), tuple(sample[n] for n in input_names), path,
+            input_names=input_names, output_names=[output_name],
+            dynamic_axes=dynamic_axes, opset_version=opset, dynamo=False,
+        )
+    return path
+
+
+def quantize_onnx(model_dir: str) -> str:
+    """Dynamic int8 quantization of model_dir/model.onnx -> model_dir/model.int8.onnx."""
+    _require_onnxruntime()
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    path = os.path.join(model_dir, QUANTIZED_FILE)
+    quantize_dynamic(os.path.join(model_dir, MODEL_FILE), path, weight_type=QuantType.QInt8)
+    return path
+
+
+class OnnxModel:
+    """Tokenizer + onnxruntime CPU session for a model exported by export_onnx()."""
+
+    def __init__(self, model_dir: str, quantized: bool = False, intra_op_threads: int = 0, max_length: int = 256):
+        ort = _require_onnxruntime()
+        from transformers import AutoTokenizer
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = intra_op_threads  # 0 = onnxruntime picks (physical cores)
+        opts.inter_op_num_threads = 1
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        path = os.path.join(model_dir, QUANTIZED_FILE if quantized else MODEL_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found; export it with scripts/onnx_runtime.py")
+        self.session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_length = max_length
+
+    def run(self, texts, text_pairs=None):
+        """Tokenize one padded batch and run it; returns (first output, attention_mask)."""
+        enc = self.tokenizer(texts, text_pairs, padding=True, truncation=True,
+                             max_length=self.max_length, return_tensors="np")
+        feed = {name: enc[name].astype("int64") for name in self.input_names}
+        return self.session.run(None, feed)[0], enc["attention_mask"]
+
+
+class OnnxSentenceEncoder(OnnxModel):
+    """Drop-in for SentenceTransformer.encode: mean-pooled, L2-normalized float32 vectors."""
+
+    def __init__(self, model_dir: str = ENCODER_ONNX_DIR, quantized: bool = False, intra_op_threads: int = 0,
+                 max_length: int = 256):
+        super().__init__(model_dir, quantized, intra_op_threads, max_length)
+
+    def encode(self, texts, batch_size: int = 32, **kwargs) -> np.ndarray:
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        out = []
+        for start in range(0, len(texts), batch_size):
+            hidden, mask = self.run(texts[start:start + batch_size])
+            mask = mask[:, :, None].astype("float32")
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            out.append(pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None))
+        vecs = np.concatenate(out).astype("float32") if out else np.zeros((0, 0), dtype="float32")
+        return vecs[0] if single else vecs
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.session.get_outputs()[0].shape[-1]
+
+
+class OnnxCrossEncoder(OnnxModel):
+    """Drop-in for sentence_transformers.CrossEncoder.predict (sigmoid of the logit)."""
+
+    def __init__(self, model_dir: str = CROSS_ONNX_DIR, quantized: bool = False, intra_op_threads: int = 0,
+                 max_length: int = 512):
+        super().__init__(model_dir, quantized, intra_op_threads, max_length)
+
+    def predict(self, pairs, batch_size: int = 32, **kwargs) -> np.ndarray:
+        scores = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            logits, _ = self.run([q for q, _ in batch], [p for _, p in batch])
+            scores.append(1.0 / (1.0 + np.exp(-logits[:, 0])))
+        return np.concatenate(scores) if scores else np.zeros(0, dtype="float32")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export query-time models to ONNX for onnxruntime on CPU")
+    parser.add_argument("model", choices=["encoder", "cross"])
+    parser.add_argument("--name", default=None, help="Hugging Face model id or local path")
+    parser.add_argument("--out", default=None, help="output directory")
+    parser.add_argument("--quantize", action="store_true", help="also write a dynamically int8-quantized copy")
+    args = parser.parse_args()
+
+    if args.model == "encoder":
+        name, out_dir, task = args.name or ENCODER_MODEL, args.out or ENCODER_ONNX_DIR, "embedding"
+    else:
+        name, out_dir, task = args.name or CROSS_MODEL, args.out or CROSS_ONNX_DIR, "cross"
+    print(f"Exported {export_onnx(name, out_dir, task=task)}")
+    if args.quantize:
+        print(f"Quantized {quantize_onnx(out_dir)}")
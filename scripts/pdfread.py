@@ -1,73 +1,121 @@
+import argparse
 import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from PyPDF2 import PdfReader
 import json
 from urllib.parse import unquote, urlparse
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from chunk_io import ChunkWriter
+
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PDF_FOLDER = os.path.join(SCRIPT_DIR, "../ispdfs")
 SOURCE_JSON = os.path.join(SCRIPT_DIR, "../sources.json")
-METADATA_JSON = os.path.join(SCRIPT_DIR, "../metadata.json")
+CHUNKS_JSONL = os.path.join(SCRIPT_DIR, "../chunks.jsonl")
+CHUNK_SIZE = 300
+PAGES_PER_TASK = 50  # large PDFs are split into page ranges of this size
 
 # Load PDF titles from sources.json
-with open(SOURCE_JSON, "r", encoding="utf-8") as f:
-    sources_list = json.load(f)
-
-sources = {}
-for item in sources_list:
-    pdf_name = os.path.basename(urlparse(item['url']).path)
-    pdf_name = unquote(pdf_name)
-    sources[pdf_name] = item['title']
-
-metadata = []
-pdf_counter = {}
-
-for pdf_file in os.listdir(PDF_FOLDER):
-    if pdf_file.endswith(".pdf"):
-        pdf_path = os.path.join(PDF_FOLDER, pdf_file)
-        reader = PdfReader(pdf_path)
-        text = ""
-        page_texts = []
-        for page_num, page in enumerate(reader.pages, start=1):
-            page_text = page.extract_text()
-            if page_text:
-                page_texts.append(page_text)
-                text += page_text + "\n"
-
-        words = text.split()
-        chunk_size = 300
-        base_name = pdf_file.rsplit(".pdf", 1)[0]
-
-        # Keep track of words covered per chunk to estimate pages
-        word_index = 0
-        total_chunks = (len(words) + chunk_size - 1) // chunk_size
-
-        for i in range(0, len(words), chunk_size):
-            chunk_words = words[i:i+chunk_size]
-            chunk_text = " ".join(chunk_words)
-            pdf_counter[base_name] = pdf_counter.get(base_name, 0) + 1
-            numbered_pdf_name = f"{base_name}_chunk{pdf_counter[base_name]}.pdf"
-
-            # Estimate pages for chunk (roughly)
-            approx_words_per_page = max(1, len(words)//len(page_texts))
-            page_start = (i // approx_words_per_page) + 1
-            page_end = min(len(page_texts), ((i + chunk_size - 1) // approx_words_per_page) + 1)
-
-            metadata.append({
-                "chunk_id": len(metadata)+1,
-                "pdf": numbered_pdf_name,
-                "source_pdf": pdf_file,
-                "title": sources.get(pdf_file, pdf_file),
-                "text": chunk_text,
-                "chunk_number": pdf_counter[base_name],
-                "total_chunks": total_chunks,
-                "chunk_len": len(chunk_words),
-                "page_start": page_start,
-                "page_end": page_end,
-                "is_first_paragraph": 1 if i == 0 else 0
-            })
-
-# Save metadata
-with open(METADATA_JSON, "w", encoding="utf-8") as f:
-    json.dump(metadata, f, indent=2, ensure_ascii=False)
-
-print(f"Created metadata.json with {len(metadata)} chunks.")
+def load_sources(source_json=SOURCE_JSON):
+    with open(source_json, "r", encoding="utf-8") as f:
+        sources_list = json.load(f)
+
+    sources = {}
+    for item in sources_list:
+        pdf_name = os.path.basename(urlparse(item['url']).path)
+        pdf_name = unquote(pdf_name)
+        sources[pdf_name] = item['title']
+    return sources
+
+def extract_pages(pdf_path, first=0, last=None):
+    """[(page_number, text)] for pages first..last-1 (1-based page numbers)."""
+    reader = PdfReader(pdf_path)
+    pages = reader.pages[first:last]
+    return [(first + n, page.extract_text() or "") for n, page in enumerate(pages, start=1)]
+
+def chunk_pages(pages, pdf_file, title, chunk_size=CHUNK_SIZE):
+    """Split extracted pages into ~chunk_size-word chunks (without chunk_id)."""
+    # Words plus the page each word came from, so chunks get exact page ranges
+    words, word_pages = [], []
+    for page_num, page_text in pages:
+        page_words = page_text.split()
+        words.extend(page_words)
+        word_pages.extend([page_num] * len(page_words))
+
+    # Character offset of every word in its chunk's " ".join()ed text, for page_breaks
+    offsets = [0] * len(words)
+    for j in range(1, len(words)):
+        offsets[j] = 0 if j % chunk_size == 0 else offsets[j - 1] + len(words[j - 1]) + 1
+
+    base_name = pdf_file.rsplit(".pdf", 1)[0]
+    total_chunks = (len(words) + chunk_size - 1) // chunk_size
+
+    doc_chunks = []
+    for n, i in enumerate(range(0, len(words), chunk_size), start=1):
+        chunk_words = words[i:i+chunk_size]
+        doc_chunks.append({
+            "pdf": f"{base_name}_chunk{n}.pdf",
+            "source_pdf": pdf_file,
+            "title": title,
+            "text": " ".join(chunk_words),
+            "chunk_number": n,
+            "total_chunks": total_chunks,
+            "chunk_len": len(chunk_words),
+            "page_start": word_pages[i],
+            "page_end": word_pages[i + len(chunk_words) - 1],
+            "is_first_paragraph": 1 if i == 0 else 0,
+            "page_breaks": [[offsets[j], word_pages[j]] for j in range(i, i + len(chunk_words))
+                            if j == i or word_pages[j] != word_pages[j - 1]]
+        })
+    return doc_chunks
+
+def chunk_pdf(pdf_path, title, chunk_size=CHUNK_SIZE):
+    """Extract and chunk one PDF in the current process."""
+    return chunk_pages(extract_pages(pdf_path), os.path.basename(pdf_path), title, chunk_size)
+
+def iter_documents_parallel(pdf_paths, workers=None, pages_per_task=PAGES_PER_TASK):
+    """
+    Extract PDFs on a process pool, splitting large documents into page ranges.
+    Yields (pdf_path, pages) in input order; at most ~2 tasks per worker are in
+    flight, so memory does not grow with the size of the corpus.
+    """
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()  # (pdf_path, [futures]) in input order
+
+        def submit(pdf_path):
+            n_pages = len(PdfReader(pdf_path).pages)
+            ranges = range(0, max(n_pages, 1), pages_per_task)
+            futures = [pool.submit(extract_pages, pdf_path, first, first + pages_per_task) for first in ranges]
+            pending.append((pdf_path, futures))
+
+        for pdf_path in pdf_paths:
+            submit(pdf_path)
+            while sum(len(f) for _, f in pending) >= 2 * workers:
+                pdf, futures = pending.popleft()
+                yield pdf, [page for f in futures for page in f.result()]
+        while pending:
+            pdf, futures = pending.popleft()
+            yield pdf, [page for f in futures for page in f.result()]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract and chunk PDFs in parallel, streaming chunks to disk")
+    parser.add_argument("--pdf-dir", default=PDF_FOLDER)
+    parser.add_argument("--output", default=CHUNKS_JSONL, help=".jsonl = JSON Lines, .json = JSON array")
+    parser.add_argument("--workers", type=int, default=None, help="extraction processes (default: CPU count)")
+    parser.add_argument("--pages-per-task", type=int, default=PAGES_PER_TASK)
+    args = parser.parse_args()
+
+    sources = load_sources()
+    pdf_paths = [os.path.join(args.pdf_dir, f) for f in sorted(os.listdir(args.pdf_dir)) if f.endswith(".pdf")]
+
+    with ChunkWriter(args.output) as writer:
+        for pdf_path, pages in iter_documents_parallel(pdf_paths, args.workers, args.pages_per_task):
+            pdf_file = os.path.basename(pdf_path)
+            for chunk in chunk_pages(pages, pdf_file, sources.get(pdf_file, pdf_file)):
+                writer.write({"chunk_id": writer.count + 1, **chunk})
+            print(f"Chunked {pdf_file}")
+
+    print(f"Wrote {writer.count} chunks to {args.output}.")
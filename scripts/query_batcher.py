@@ -0,0 +1,123 @@
+# scripts/query_batcher.py
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, List
+
+import numpy as np
+
+
+class QueryBatcher:
+    """
+    Collect queries arriving within a short window and encode them together.
+
+    Callers block in encode() until their vector is ready. A single background
+    thread waits up to max_wait_ms (or until max_batch_size queries are queued),
+    runs one batched encode_fn call and hands each caller its own row back.
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 3.0,
+    ):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = os.getpid()
+
+        # --- Metrics ---
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.queries = 0
+        self.max_batch_seen = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+        self.total_encode = 0.0
+        self.batch_size_counts = {}
+
+    def _check_fork(self):
+        # A forked worker (e.g. gunicorn preload_app) inherits no threads and possibly a
+        # held lock: start over with a fresh queue and condition in the child
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._pending = deque()
+            self._cond = threading.Condition()
+            self._thread = None
+
+    def _ensure_started(self):
+        # Start lazily so importing the module never spawns threads
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+            self._thread.start()
+
+    def encode(self, query: str) -> np.ndarray:
+        fut = Future()
+        self._check_fork()
+        with self._cond:
+            self._ensure_started()
+            self._pending.append((query, time.perf_counter(), fut))
+            self._cond.notify()
+        return fut.result()
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            # Window opens when the first query of the batch arrives
+            deadline = self._pending[0][1] + self.max_wait
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            n = min(len(self._pending), self.max_batch_size)
+            return [self._pending.popleft() for _ in range(n)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            start = time.perf_counter()
+            try:
+                vecs = np.asarray(self.encode_fn([q for q, _, _ in batch]), dtype="float32")
+            except Exception as e:
+                for _, _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            done = time.perf_counter()
+            for row, (_, _, fut) in zip(vecs, batch):
+                fut.set_result(row)
+            self._record(batch, start, done)
+
+    def _record(self, batch, start, done):
+        waits = [start - enqueued for _, enqueued, _ in batch]
+        with self._stats_lock:
+            size = len(batch)
+            self.batches += 1
+            self.queries += size
+            self.max_batch_seen = max(self.max_batch_seen, size)
+            self.total_wait += sum(waits)
+            self.max_wait_seen = max(self.max_wait_seen, max(waits))
+            self.total_encode += done - start
+            self.batch_size_counts[size] = self.batch_size_counts.get(size, 0) + 1
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "batches": self.batches,
+                "queries": self.queries,
+                "avg_batch_size": self.queries / self.batches if self.batches else 0.0,
+                "max_batch_seen": self.max_batch_seen,
+                "avg_wait_ms": 1000.0 * self.total_wait / self.queries if self.queries else 0.0,
+                "max_wait_seen_ms": 1000.0 * self.max_wait_seen,
+                "avg_encode_ms": 1000.0 * self.total_encode / self.batches if self.batches else 0.0,
+                "batch_size_histogram": dict(sorted(self.batch_size_counts.items())),
+            }
@@ -0,0 +1,116 @@
+# scripts/query_cache.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive cache key for a query string."""
+    return " ".join(query.lower().split())
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded LRU cache with an optional per-entry TTL.
+    ttl=None (or 0) keeps entries until they are evicted or cleared.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = max(0, maxsize)
+        self.ttl = ttl or None
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value) -> None:
+        if self.maxsize == 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+class FileWatcher:
+    """
+    Calls on_change() when any watched file's (mtime, size) changes, e.g. after
+    faiss_index.bin or chunks.db is rebuilt. Checks at most every interval seconds.
+    """
+
+    def __init__(self, paths: List[str], on_change: Callable[[], None], interval: float = 1.0):
+        self.paths = list(paths)
+        self.on_change = on_change
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last_check = time.monotonic()
+        self._fingerprint = self._snapshot()
+
+    def _snapshot(self):
+        snap = []
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+                snap.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                snap.append(None)
+        return tuple(snap)
+
+    def check(self) -> bool:
+        now = time.monotonic()
+        if now - self._last_check < self.interval:
+            return False
+        with self._lock:
+            if now - self._last_check < self.interval:
+                return False
+            self._last_check = now
+            current = self._snapshot()
+            if current == self._fingerprint:
+                return False
+            self._fingerprint = current
+        self.on_change()
+        return True
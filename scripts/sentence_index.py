@@ -0,0 +1,228 @@
+# scripts/sentence_index.py
+# Ingest-time sentence segmentation + sentence embeddings for extractive answers.
+#     python scripts/sentence_index.py        # after create_chunks_db.py / ingest.py
+# Reads chunk_meta from chunks.db and writes two memory-mapped arrays:
+#     sentences.f16.npy   (n_sentences, dim) float16, L2-normalized
+#     sentences.meta.npy  (n_sentences, 4) int64: chunk_id, char_start, char_end, page
+#     sentences.json      fingerprint of the chunk_meta rows they were built from
+# Rows are sorted by chunk_id, so a chunk's sentences are one contiguous slice.
+# scripts/ingest.py keeps them in sync; the API refuses files whose fingerprint does not
+# match chunks.db (the spans would point into different text) and answers with snippets.
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from index_builder import prepare_vectors
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DB_FILE = os.path.join(PROJECT_ROOT, "chunks.db")
+SENTENCE_VECTORS_FILE = os.path.join(PROJECT_ROOT, "sentences.f16.npy")
+SENTENCE_META_FILE = os.path.join(PROJECT_ROOT, "sentences.meta.npy")
+SENTENCE_INFO_FILE = os.path.join(PROJECT_ROOT, "sentences.json")
+
+# Sentence ends (., !, ? before a capital/digit/quote) and the bullet glyphs PDF extraction leaves inline
+BOUNDARY = re.compile(r"(?<=[.!?])\s+(?=[\"“(\[A-Z0-9])|\s*[•●■○▪]\s*")
+
+
+def split_sentences(text: str, min_words: int = 4, max_chars: int = 400) -> List[Tuple[int, int]]:
+    """Character spans of the sentences in text. Fragments under min_words are dropped;
+    run-ons longer than max_chars (tables, lists) are cut at word boundaries."""
+    spans, start = [], 0
+    for m in BOUNDARY.finditer(text):
+        spans.append((start, m.start()))
+        start = m.end()
+    spans.append((start, len(text)))
+
+    out = []
+    for s, e in spans:
+        while s < e and text[s].isspace():
+            s += 1
+        while e > s and text[e - 1].isspace():
+            e -= 1
+        if len(text[s:e].split()) < min_words:
+            continue
+        while e - s > max_chars:
+            cut = text.rfind(" ", s, s + max_chars)
+            cut = cut if cut > s else s + max_chars
+            out.append((s, cut))
+            s = cut + 1
+        out.append((s, e))
+    return out
+
+
+def page_of(offset: int, page_breaks, page_start) -> int:
+    """Page an offset of the chunk text falls on, from pdfread's [[char_offset, page], ...]."""
+    page = page_start or 0
+    for start, p in page_breaks or ():
+        if start > offset:
+            break
+        page = p
+    return page
+
+
+def corpus_fingerprint(db_file: str) -> Dict:
+    """Cheap fingerprint of chunk_meta: changes when chunks are added, removed, renumbered or rewritten."""
+    conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+    try:
+        n, max_id, checksum = conn.execute(
+            "SELECT count(*), coalesce(max(chunk_id), 0), total(chunk_id * length(text)) FROM chunk_meta").fetchone()
+    finally:
+        conn.close()
+    return {"chunks": n, "max_chunk_id": max_id, "checksum": checksum}
+
+
+def sentence_index_is_current(db_file: str = DB_FILE, info_file: str = SENTENCE_INFO_FILE) -> bool:
+    if not os.path.exists(info_file):
+        return False  # built before fingerprints were recorded
+    with open(info_file, "r", encoding="utf-8") as f:
+        return json.load(f).get("source") == corpus_fingerprint(db_file)
+
+
+def _save(vectors_tmp: str, meta: np.ndarray, db_file: str) -> None:
+    """Swap in the new vectors + meta, then the fingerprint (checked on load) last."""
+    # np.save appends .npy to names that lack it, so write the meta array through a file object
+    with open(SENTENCE_META_FILE + ".tmp", "wb") as f:
+        np.save(f, meta)
+    with open(SENTENCE_INFO_FILE + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"sentences": int(len(meta)), "source": corpus_fingerprint(db_file)}, f, indent=2)
+    os.replace(vectors_tmp, SENTENCE_VECTORS_FILE)
+    os.replace(SENTENCE_META_FILE + ".tmp", SENTENCE_META_FILE)
+    os.replace(SENTENCE_INFO_FILE + ".tmp", SENTENCE_INFO_FILE)
+
+
+def iter_chunk_rows(db_file: str, batch: int = 1000):
+    conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+    try:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(chunk_meta)")}
+        breaks = "page_breaks" if "page_breaks" in columns else "NULL"  # chunks.db built before page_breaks
+        cur = conn.execute(f"SELECT chunk_id, text, page_start, {breaks} FROM chunk_meta ORDER BY chunk_id")
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                break
+            for chunk_id, text, page_start, page_breaks in rows:
+                yield chunk_id, text or "", page_start, json.loads(page_breaks) if page_breaks else None
+    finally:
+        conn.close()
+
+
+def build_sentence_index(encode_fn, db_file: str = DB_FILE, batch_size: int = 256) -> int:
+    """Segment every chunk, then embed the sentences batch by batch into the memmap."""
+    # Pass 1: spans only (small ints), so the vector store can be sized up front
+    meta = []
+    for chunk_id, text, page_start, page_breaks in iter_chunk_rows(db_file):
+        for s, e in split_sentences(text):
+            meta.append((chunk_id, s, e, page_of(s, page_breaks, page_start)))
+    meta = np.array(meta, dtype="int64").reshape(-1, 4)
+    n = len(meta)
+    dim = len(encode_fn(["dimension probe"])[0])
+    vectors = np.lib.format.open_memmap(SENTENCE_VECTORS_FILE + ".tmp", mode="w+", dtype="float16", shape=(n, dim))
+
+    # Pass 2: re-read chunk texts in the same order and encode their sentences in batches
+    row, pending = 0, []
+
+    def flush():
+        nonlocal row, pending
+        if pending:
+            vectors[row:row + len(pending)] = prepare_vectors(encode_fn(pending), "ip").astype("float16")
+            row += len(pending)
+            pending = []
+
+    for chunk_id, text, _, _ in iter_chunk_rows(db_file):
+        for s, e in split_sentences(text):
+            pending.append(text[s:e])
+            if len(pending) >= batch_size:
+                flush()
+    flush()
+    assert row == n, f"sentence count changed between passes ({row} != {n}); was chunks.db rewritten?"
+    vectors.flush()
+    del vectors
+    _save(SENTENCE_VECTORS_FILE + ".tmp", meta, db_file)
+    return n
+
+
+def update_sentence_index(encode_fn, removed: Sequence[int], chunks: Sequence[Dict], db_file: str = DB_FILE,
+                          batch_size: int = 256) -> int:
+    """
+    Incremental counterpart of build_sentence_index for scripts/ingest.py: drop the sentences of
+    removed chunk_ids and append those of new chunks (dicts with chunk_id, text, page_start,
+    page_breaks). Kept vectors are copied slice by slice, never re-encoded.
+    """
+    old_meta = np.load(SENTENCE_META_FILE)
+    old_vectors = np.load(SENTENCE_VECTORS_FILE, mmap_mode="r")
+    keep = np.flatnonzero(~np.isin(old_meta[:, 0], np.asarray(list(removed), dtype="int64")))
+
+    new_meta, texts = [], []
+    for c in sorted(chunks, key=lambda c: c["chunk_id"]):
+        text = c.get("text") or ""
+        for s, e in split_sentences(text):
+            new_meta.append((c["chunk_id"], s, e, page_of(s, c.get("page_breaks"), c.get("page_start"))))
+            texts.append(text[s:e])
+    new_meta = np.array(new_meta, dtype="int64").reshape(-1, 4)
+
+    dim = old_vectors.shape[1]
+    new_vectors = np.zeros((0, dim), dtype="float16")
+    if texts:
+        new_vectors = np.vstack([prepare_vectors(encode_fn(texts[b:b + batch_size]), "ip").astype("float16")
+                                 for b in range(0, len(texts), batch_size)])
+
+    # Row sources: old row r >= 0, or new row j stored as -1 - j; written out in chunk_id order
+    meta = np.concatenate([old_meta[keep], new_meta])
+    source = np.concatenate([keep, -1 - np.arange(len(new_meta))])
+    order = np.argsort(meta[:, 0], kind="stable")  # new chunk_ids normally sort last already
+    vectors = np.lib.format.open_memmap(SENTENCE_VECTORS_FILE + ".tmp", mode="w+", dtype="float16",
+                                        shape=(len(meta), dim))
+    block = 16 * batch_size
+    for b in range(0, len(meta), block):
+        src = source[order[b:b + block]]
+        out = np.empty((len(src), dim), dtype="float16")
+        old = src >= 0
+        out[old] = old_vectors[src[old]]
+        out[~old] = new_vectors[-1 - src[~old]]
+        vectors[b:b + len(src)] = out
+    vectors.flush()
+    del vectors, old_vectors
+    _save(SENTENCE_VECTORS_FILE + ".tmp", meta[order], db_file)
+    return len(meta)
+
+
+class SentenceIndex:
+    """Read side: memory-mapped sentence vectors, scored only for the chunks asked about."""
+
+    def __init__(self, vectors_file: str = SENTENCE_VECTORS_FILE, meta_file: str = SENTENCE_META_FILE):
+        self.vectors = np.load(vectors_file, mmap_mode="r")
+        self.meta = np.load(meta_file, mmap_mode="r")
+        self.chunk_col = np.ascontiguousarray(self.meta[:, 0])
+
+    def best(self, q_vec: np.ndarray, chunk_ids: Sequence[int], top_n: int = 2) -> List[Dict]:
+        """Top sentences of the given chunks by cosine with the query (one matrix-vector product)."""
+        chunk_ids = np.asarray(chunk_ids, dtype="int64")
+        lo = np.searchsorted(self.chunk_col, chunk_ids, side="left")
+        hi = np.searchsorted(self.chunk_col, chunk_ids, side="right")
+        rows = np.concatenate([np.arange(a, b) for a, b in zip(lo, hi)] or [np.zeros(0, dtype="int64")])
+        if rows.size == 0:
+            return []
+        q = prepare_vectors(q_vec, "ip")[0]
+        scores = np.asarray(self.vectors[rows], dtype="float32") @ q
+        top = np.argsort(-scores, kind="stable")[:top_n]
+        return [{"chunk_id": int(self.meta[r, 0]), "char_start": int(self.meta[r, 1]), "char_end": int(self.meta[r, 2]),
+                 "page": int(self.meta[r, 3]), "score": float(scores[i])} for i, r in zip(top, rows[top])]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Segment chunks into sentences and embed them for extractive answers")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer("all-MiniLM-L6-v2", device="cpu")
+    n = build_sentence_index(lambda texts: model.encode(texts, batch_size=64), args.db, args.batch_size)
+    print(f"Saved {n} sentence vectors to {SENTENCE_VECTORS_FILE}")
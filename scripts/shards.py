@@ -0,0 +1,449 @@
+# scripts/shards.py
+# Sharded index layout and scatter-gather search.
+#     python scripts/shards.py build --shards 4                    # faiss_index.bin + chunks.db -> shards/
+#     python scripts/shards.py serve shards/shard-0 --port 8101    # optional HTTP shard worker
+# Chunks are partitioned by source PDF, so a document never spans shards. Each shard
+# directory holds its own faiss_index.bin (+ .json) and chunks.db (FTS5 table + chunk_meta
+# rows), the same layout the single-index API reads. ask_api.py with SHARDS=shards fans
+# every FAISS / FTS5 search out to worker processes (one pool per shard), or with
+# SHARD_URLS=http://127.0.0.1:8101,... to HTTP shard workers, merges the per-shard top-k
+# with a heap and reranks the merged candidates as usual. Keyword hits are rescored against
+# the full chunks.db so bm25 uses corpus-wide term statistics. Shards that fail or miss
+# SHARD_TIMEOUT_MS are left out and the response is marked partial.
+import argparse
+import contextvars
+import heapq
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from typing import Dict, List, Optional, Sequence, Set
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from chunk_store import create_chunk_store, insert_chunks
+from index_builder import (build_index, default_nlist, read_index, reconstruct_vectors, selector_params,
+                           set_search_params, write_index)
+from metadata_index import MetadataIndex
+from metrics import registry
+from query_cache import LRUCache
+from sqlite_pool import KEYWORD_FILTERED_SQL, KEYWORD_SQL, ReadOnlyConnectionPool
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FAISS_INDEX = os.path.join(PROJECT_ROOT, "faiss_index.bin")
+DB_FILE = os.path.join(PROJECT_ROOT, "chunks.db")
+SHARDS_DIR = os.path.join(PROJECT_ROOT, "shards")
+MANIFEST = "shards.json"
+# Each shard ranks keyword hits with its own term statistics, so its top-k can differ from its
+# share of the global top-k; shards return this many times k candidates for global rescoring.
+KEYWORD_OVERFETCH = 2
+
+registry.describe("rag_shard_seconds", "histogram", "Per-shard search latency seen by the coordinator")
+registry.describe("rag_shard_failures_total", "counter", "Shard calls that failed or timed out")
+
+
+# --- Build ---
+def shard_of(source_pdf: str, n_shards: int) -> int:
+    return zlib.crc32((source_pdf or "").encode("utf-8")) % n_shards
+
+
+def build_shards(n_shards: int, out_dir: str = SHARDS_DIR, index_file: str = FAISS_INDEX,
+                 db_file: str = DB_FILE, batch: int = 10000) -> dict:
+    """
+    Split the full index and chunks.db into n_shards directories. Vectors are copied
+    out of the existing index (no re-encoding) and each shard's index is rebuilt with
+    the same type and metric, IVF lists sized for the shard.
+    """
+    index, info = read_index(index_file)
+    src = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+    src.row_factory = sqlite3.Row
+    pdfs = [row[0] for row in src.execute("SELECT DISTINCT source_pdf FROM chunk_meta")]
+    by_shard = [[p for p in pdfs if shard_of(p, n_shards) == s] for s in range(n_shards)]
+
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    from learned_reranker import index_fingerprint  # sklearn stays out of the shard worker processes
+
+    # built_at + source make every build's manifest differ, so the API's file watcher and the
+    # learned reranker's fingerprint (both read shards.json, not faiss_index.bin) see a rebuild
+    manifest = {"n_shards": n_shards, "partition": "source_pdf", "index_type": info["index_type"],
+                "metric": info["metric"], "labels": "chunk_id",
+                "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "source": index_fingerprint([index_file, db_file]), "shards": []}
+    for s, shard_pdfs in enumerate(by_shard):
+        name = f"shard-{s}"
+        shard_dir = os.path.join(tmp_dir, name)
+        os.makedirs(shard_dir)
+        pdf_list = json.dumps(shard_pdfs)
+        chunks = [dict(row) for row in src.execute(
+            "SELECT * FROM chunk_meta WHERE source_pdf IN (SELECT value FROM json_each(?)) ORDER BY chunk_id",
+            (pdf_list,))]
+        ids = np.array([c["chunk_id"] for c in chunks], dtype="int64")
+        if not len(ids):
+            print(f"[WARN] {name} has no chunks (fewer PDFs than shards?)")
+            continue
+
+        # --- FAISS: same index type / metric, vectors copied from the full index ---
+        vectors = np.vstack([reconstruct_vectors(index, info, ids[i:i + batch]) for i in range(0, len(ids), batch)])
+        params = dict(info.get("params", {}))
+        if info["index_type"] in ("ivf", "ivfpq"):
+            params["nlist"] = default_nlist(len(ids))
+        shard_index, params = build_index(vectors, info["index_type"], metric=info["metric"], ids=ids, **params)
+        write_index(shard_index, os.path.join(shard_dir, "faiss_index.bin"), {
+            "index_type": info["index_type"], "metric": info["metric"], "labels": "chunk_id",
+            "params": params, "search": info.get("search", {}),
+        })
+
+        # --- chunks.db: FTS5 rows + chunk_meta of this shard's chunks ---
+        # FTS rows are re-tokenized from chunk_meta.text (the full table may be contentless)
+        conn = sqlite3.connect(os.path.join(shard_dir, "chunks.db"))
+        with conn:
+            conn.execute("CREATE VIRTUAL TABLE chunks USING FTS5(pdf, text, rank_val UNINDEXED)")
+            conn.executemany(
+                "INSERT INTO chunks (rowid, pdf, text, rank_val) VALUES (?, ?, ?, ?)",
+                [(c["chunk_id"], c["pdf"], c["text"], c["chunk_id"]) for c in chunks],
+            )
+            create_chunk_store(conn)
+            insert_chunks(conn, chunks)
+        conn.close()
+        manifest["shards"].append({"name": name, "chunks": int(len(ids)), "pdfs": len(shard_pdfs)})
+        print(f"{name}: {len(shard_pdfs)} PDFs, {len(ids)} chunks")
+    src.close()
+
+    with open(os.path.join(tmp_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return manifest
+
+
+# --- One shard: searched the same way ask_api searches the full index ---
+class Shard:
+    def __init__(self, shard_dir: str, mmap: bool = True):
+        self.name = os.path.basename(os.path.normpath(shard_dir))
+        self.index, self.info = read_index(os.path.join(shard_dir, "faiss_index.bin"), mmap=mmap)
+        set_search_params(
+            self.index,
+            nprobe=os.environ.get("FAISS_NPROBE") or self.info["search"].get("nprobe"),
+            ef_search=os.environ.get("FAISS_EF_SEARCH") or self.info["search"].get("ef_search"),
+        )
+        self.pool = ReadOnlyConnectionPool(os.path.join(shard_dir, "chunks.db"))
+        self._metadata = None
+        self._selections = LRUCache(int(os.environ.get("FILTER_CACHE_SIZE", "256")))
+        self._lock = threading.Lock()
+
+    def selection(self, filters: Optional[dict]) -> Optional[dict]:
+        """Filter -> this shard's FAISS selector + FTS5 rowid list (cached per filter)."""
+        if not filters:
+            return None
+        key = json.dumps(filters, sort_keys=True)
+        selection = self._selections.get(key)
+        if selection is None:
+            with self._lock:
+                if self._metadata is None:
+                    self._metadata = MetadataIndex(self.pool.connection())
+            ids = self._metadata.resolve(**filters)
+            if ids is None:
+                return None
+            selection = {"json": json.dumps(ids.tolist()), "faiss": selector_params(self.index, ids)}
+            self._selections.put(key, selection)
+        return selection
+
+    def search_vectors(self, x: np.ndarray, k: int, filters: Optional[dict] = None):
+        selection = self.selection(filters)
+        if selection is None:
+            return self.index.search(x, k)
+        return self.index.search(x, k, params=selection["faiss"])
+
+    def keyword_search(self, match: str, k: int, filters: Optional[dict] = None) -> List[tuple]:
+        selection = self.selection(filters)
+        try:
+            if selection is None:
+                return self.pool.connection().execute(KEYWORD_SQL, (match, k)).fetchall()
+            return self.pool.connection().execute(KEYWORD_FILTERED_SQL, (match, selection["json"], k)).fetchall()
+        except sqlite3.OperationalError:
+            return []
+
+    def health(self) -> dict:
+        return {"name": self.name, "ntotal": int(self.index.ntotal),
+                **{key: self.info[key] for key in ("index_type", "metric", "labels")}}
+
+
+# --- Shard backends: local worker processes or HTTP ---
+_worker_shard = None
+
+
+def _init_worker(shard_dir):
+    global _worker_shard
+    _worker_shard = Shard(shard_dir)
+
+
+def _call_worker(method, *args):
+    return getattr(_worker_shard, method)(*args)
+
+
+class ProcessShard:
+    """A pool of worker processes that each open the same shard (its index is mmap'd, so shared)."""
+
+    def __init__(self, shard_dir: str, workers: int = 1):
+        self.name = os.path.basename(os.path.normpath(shard_dir))
+        self.shard_dir = shard_dir
+        self.workers = workers
+        self._pool = self._start()
+
+    def _start(self):
+        # spawn: the coordinator may already run torch / thread pools, which do not survive fork
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(self.shard_dir,))
+
+    def submit(self, method: str, *args):
+        try:
+            return self._pool.submit(_call_worker, method, *args)
+        except BrokenProcessPool:
+            print(f"[WARN] shard {self.name} worker died; restarting it")
+            self._pool = self._start()
+            return self._pool.submit(_call_worker, method, *args)
+
+    def health(self) -> dict:
+        # One call per worker, so every process has loaded the shard before the first query
+        futures = [self.submit("health") for _ in range(self.workers)]
+        return [f.result() for f in futures][0]
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class HttpShard:
+    """A shard served by `python scripts/shards.py serve` (or anything with the same endpoints)."""
+
+    def __init__(self, url: str, executor: ThreadPoolExecutor, timeout_s: float):
+        self.name = url
+        self.url = url.rstrip("/")
+        self.timeout = timeout_s
+        self._executor = executor
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            import requests
+            session = self._local.session = requests.Session()
+        return session
+
+    def _post(self, method, *args):
+        if method == "search_vectors":
+            x, k, filters = args
+            body = {"vectors": np.asarray(x).tolist(), "k": k, "filters": filters}
+        else:
+            match, k, filters = args
+            body = {"match": match, "k": k, "filters": filters}
+        resp = self._session().post(f"{self.url}/{method}", json=body, timeout=self.timeout)
+        resp.raise_for_status()
+        out = resp.json()
+        if method == "search_vectors":
+            return np.array(out["D"], dtype="float32"), np.array(out["I"], dtype="int64")
+        return [tuple(row) for row in out["rows"]]
+
+    def submit(self, method: str, *args):
+        return self._executor.submit(self._post, method, *args)
+
+    def health(self) -> dict:
+        resp = self._session().get(f"{self.url}/health", timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    def close(self):
+        pass
+
+
+# --- Coordinator ---
+# Set per request (track_missing_shards); shards left out of any scatter are added to it
+_missing: contextvars.ContextVar[Optional[Set[str]]] = contextvars.ContextVar("missing_shards", default=None)
+
+
+def track_missing_shards() -> Set[str]:
+    """Collect the names of shards the current request's searches had to go without."""
+    missing = set()
+    _missing.set(missing)
+    return missing
+
+
+class ShardCoordinator:
+    """
+    Scatter each search to every shard, wait up to timeout_ms, and gather what came back:
+    per-query top-k vector lists are merged with a heap (by similarity for "ip", distance
+    for "l2") and keyword hits are pooled for rescoring. Slow or failed shards are
+    skipped, not waited for.
+    """
+
+    def __init__(self, shards: Sequence, info: dict, timeout_ms: float = 500.0):
+        self.shards = list(shards)
+        self.info = info
+        self.timeout = timeout_ms / 1000.0
+        self._lock = threading.Lock()
+        self._counts = {s.name: {"calls": 0, "timeouts": 0, "errors": 0, "last_error": None} for s in self.shards}
+
+    def _scatter(self, method: str, *args) -> list:
+        start = time.perf_counter()
+        futures = {}
+        for shard in self.shards:
+            try:
+                future = shard.submit(method, *args)
+            except Exception as e:
+                self._failed(shard, "errors", e)
+                continue
+            future.add_done_callback(
+                lambda f, name=shard.name: registry.observe("rag_shard_seconds", time.perf_counter() - start, shard=name))
+            futures[future] = shard
+        done, _ = wait(futures, timeout=self.timeout)
+        results = []
+        for future, shard in futures.items():
+            with self._lock:
+                self._counts[shard.name]["calls"] += 1
+            if future not in done:
+                future.cancel()
+                self._failed(shard, "timeouts", f"no answer within {1000 * self.timeout:.0f} ms")
+            elif future.exception() is not None:
+                self._failed(shard, "errors", future.exception())
+            else:
+                results.append(future.result())
+        return results
+
+    def _failed(self, shard, kind, error):
+        with self._lock:
+            counts = self._counts[shard.name]
+            counts[kind] += 1
+            counts["last_error"] = str(error) or type(error).__name__
+        registry.inc("rag_shard_failures_total", shard=shard.name, reason=kind)
+        missing = _missing.get()
+        if missing is not None:
+            missing.add(shard.name)
+
+    def search_vectors(self, x: np.ndarray, k: int, filters: Optional[dict] = None):
+        """(D, I) like index.search over the union of the shards (labels are chunk_ids)."""
+        parts = self._scatter("search_vectors", x, k, filters)
+        similarity = self.info["metric"] == "ip"
+        D = np.full((len(x), k), -np.inf if similarity else np.inf, dtype="float32")
+        I = np.full((len(x), k), -1, dtype="int64")
+        for q in range(len(x)):
+            # each shard's row is already sorted best-first
+            rows = [[(d, i) for d, i in zip(dist[q], labels[q]) if i >= 0] for dist, labels in parts]
+            merged = list(islice(heapq.merge(*rows, key=(lambda t: -t[0]) if similarity else (lambda t: t[0])), k))
+            if merged:
+                D[q, :len(merged)], I[q, :len(merged)] = zip(*merged)
+        return D, I
+
+    def keyword_candidates(self, match: str, k: int, filters: Optional[dict] = None) -> List[int]:
+        """
+        chunk_ids of the union of every shard's top KEYWORD_OVERFETCH * k keyword hits. Each
+        shard ranks with its own term statistics, so the caller rescores these against the
+        full chunks.db, whose bm25 uses the statistics of the whole corpus.
+        """
+        parts = self._scatter("keyword_search", match, KEYWORD_OVERFETCH * k, filters)
+        return sorted({int(row[0]) for rows in parts for row in rows})
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"timeout_ms": 1000 * self.timeout, **self.info, "shards": {n: dict(c) for n, c in self._counts.items()}}
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+
+def open_coordinator(shards_dir: Optional[str], urls: Sequence[str], timeout_ms: float = 500.0,
+                     workers_per_shard: int = 1) -> ShardCoordinator:
+    """Coordinator over HTTP shards (urls) or local worker processes for each shard in shards_dir."""
+    if urls:
+        executor = ThreadPoolExecutor(max_workers=4 * len(urls), thread_name_prefix="shard-http")
+        shards = [HttpShard(url, executor, timeout_ms / 1000.0) for url in urls]
+        healthy = []
+        for shard in shards:
+            try:
+                healthy.append(shard.health())
+            except Exception as e:
+                print(f"[WARN] shard {shard.name} is not answering: {e}")
+        if not healthy:
+            raise RuntimeError(f"none of the {len(shards)} shards in SHARD_URLS answered /health")
+        # ntotal only counts the shards that answered at startup
+        info = {**{key: healthy[0][key] for key in ("index_type", "metric", "labels")},
+                "ntotal": sum(h["ntotal"] for h in healthy)}
+    else:
+        with open(os.path.join(shards_dir, MANIFEST), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        shards = [ProcessShard(os.path.join(shards_dir, s["name"]), workers_per_shard) for s in manifest["shards"]]
+        info = {**{key: manifest[key] for key in ("index_type", "metric", "labels")},
+                "ntotal": sum(s["chunks"] for s in manifest["shards"])}
+        # Spawning a worker and loading its shard takes longer than a query timeout: do it now
+        with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+            for shard, health in zip(shards, pool.map(lambda shard: shard.health(), shards)):
+                if health["ntotal"] != next(s["chunks"] for s in manifest["shards"] if s["name"] == shard.name):
+                    print(f"[WARN] shard {shard.name} holds {health['ntotal']} vectors, {MANIFEST} says otherwise")
+    return ShardCoordinator(shards, info, timeout_ms)
+
+
+# --- HTTP shard worker ---
+def serve(shard_dir: str, host: str, port: int) -> None:
+    import uvicorn
+    from fastapi import FastAPI
+    from pydantic import BaseModel
+
+    shard = Shard(shard_dir)
+    app = FastAPI(title=f"shard {shard.name}")
+
+    class VectorQuery(BaseModel):
+        vectors: List[List[float]]
+        k: int
+        filters: Optional[Dict] = None
+
+    class KeywordQuery(BaseModel):
+        match: str
+        k: int
+        filters: Optional[Dict] = None
+
+    @app.post("/search_vectors")
+    def search_vectors(req: VectorQuery):
+        D, I = shard.search_vectors(np.asarray(req.vectors, dtype="float32"), req.k, req.filters)
+        # inf pads empty slots and is not valid JSON; those slots have label -1 anyway
+        return {"D": np.nan_to_num(D, posinf=0.0, neginf=0.0).tolist(), "I": I.tolist()}
+
+    @app.post("/keyword_search")
+    def keyword_search(req: KeywordQuery):
+        return {"rows": [list(row) for row in shard.keyword_search(req.match, req.k, req.filters)]}
+
+    @app.get("/health")
+    def health():
+        return shard.health()
+
+    uvicorn.run(app, host=host, port=port)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or serve a sharded index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="split faiss_index.bin + chunks.db into shards")
+    build.add_argument("--shards", type=int, required=True)
+    build.add_argument("--out", default=SHARDS_DIR)
+    build.add_argument("--index", default=FAISS_INDEX)
+    build.add_argument("--db", default=DB_FILE)
+    srv = sub.add_parser("serve", help="serve one shard over HTTP")
+    srv.add_argument("shard_dir")
+    srv.add_argument("--host", default="127.0.0.1")
+    srv.add_argument("--port", type=int, default=8101)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        manifest = build_shards(args.shards, args.out, args.index, args.db)
+        print(f"Wrote {len(manifest['shards'])} shards to {args.out}")
+    else:
+        serve(args.shard_dir, args.host, args.port)
@@ -0,0 +1,67 @@
+# scripts/sqlite_pool.py
+import os
+import re
+import sqlite3
+import threading
+
+# Very common words that would make an OR query match nearly every chunk
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how i in is it of on or should
+that the their there this to was what when where which who why will with you
+""".split())
+
+
+class ReadOnlyConnectionPool:
+    """
+    One read-only SQLite connection per worker thread, opened on first use and
+    reused for the life of the thread so its prepared-statement cache is reused too.
+    reset() makes every thread reopen its connection (e.g. after chunks.db is rebuilt).
+    A connection inherited across fork() is never reused: the child opens its own.
+    """
+
+    def __init__(self, path: str, mmap_size: int = 256 * 1024 * 1024, cache_size_kib: int = 64 * 1024):
+        self.path = path
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self._local = threading.local()
+        self._generation = 0
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, cached_statements=256)
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kib)}")  # negative = KiB
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid != os.getpid():
+            conn = None  # opened by the parent process before fork; leave it alone
+        if conn is None or self._local.generation != self._generation:
+            if conn is not None:
+                conn.close()
+            conn = self._open()
+            self._local.conn = conn
+            self._local.generation = self._generation
+            self._local.pid = os.getpid()
+        return conn
+
+    def reset(self) -> None:
+        self._generation += 1
+
+
+# bm25-ranked FTS5 search; rowid (and rank_val) hold the chunk_id, so a chunk_id filter is
+# one rowid constraint on the same query
+KEYWORD_SQL = "SELECT rank_val, bm25(chunks) AS score FROM chunks WHERE text MATCH ? ORDER BY score LIMIT ?"
+KEYWORD_FILTERED_SQL = ("SELECT rank_val, bm25(chunks) AS score FROM chunks WHERE text MATCH ? "
+                        "AND rowid IN (SELECT value FROM json_each(?)) ORDER BY score LIMIT ?")
+
+
+def fts_match_expression(query: str) -> str:
+    """
+    Turn free text into a safe FTS5 MATCH expression: every non-stopword becomes a
+    quoted term and terms are OR-ed, so punctuation can never break the query syntax
+    and bm25() ranks chunks by how many (and how rare) of the terms they contain.
+    """
+    terms = [t for t in re.findall(r"\w+", query.lower()) if t not in STOPWORDS]
+    return " OR ".join(f'"{t}"' for t in dict.fromkeys(terms))
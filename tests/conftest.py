@@ -0,0 +1,21 @@
+# tests/conftest.py
+# The scripts import each other as top-level modules (scripts/ is put on sys.path), and
+# run_questions.py lives in the project root: make both importable from the tests.
+import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "scripts"))
+sys.path.insert(0, PROJECT_ROOT)
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def ask_api():
+    """The API module. Importing it needs a built faiss_index.bin and chunks.db; skip without them."""
+    try:
+        import ask_api
+    except FileNotFoundError as e:
+        pytest.skip(str(e))
+    return ask_api
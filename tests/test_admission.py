@@ -0,0 +1,59 @@
+# tests/test_admission.py
+import asyncio
+import threading
+
+import pytest
+
+from admission import AdmissionController, DeadlineExceeded, Overloaded
+
+
+def test_runs_job_and_returns_result():
+    controller = AdmissionController(max_workers=2, max_queue=0, timeout_s=5)
+    assert asyncio.run(controller.run(lambda a, b: a + b, 2, 3)) == 5
+    stats = controller.stats()
+    assert stats["admitted"] == 1 and stats["completed"] == 1 and stats["rejected"] == 0
+
+
+def test_rejects_when_workers_and_queue_are_full():
+    controller = AdmissionController(max_workers=1, max_queue=0, timeout_s=5)
+    release = threading.Event()
+
+    async def scenario():
+        busy = asyncio.ensure_future(controller.run(release.wait))
+        await asyncio.sleep(0.05)
+        with pytest.raises(Overloaded):
+            await controller.run(lambda: "never runs")
+        release.set()
+        return await busy
+
+    assert asyncio.run(scenario()) is True
+    assert controller.stats()["rejected"] == 1
+
+
+def test_deadline_exceeded_while_running():
+    controller = AdmissionController(max_workers=1, max_queue=1, timeout_s=0.05)
+    release = threading.Event()
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(controller.run(release.wait))
+    release.set()
+    assert controller.stats()["timed_out"] == 1
+
+
+def test_queued_job_past_its_deadline_is_skipped():
+    controller = AdmissionController(max_workers=1, max_queue=1, timeout_s=5)
+    release = threading.Event()
+    ran = []
+
+    async def scenario():
+        busy = asyncio.ensure_future(controller.run(release.wait))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(controller.run(lambda: ran.append(1), timeout_s=0.05))
+        with pytest.raises(DeadlineExceeded):
+            await queued
+        release.set()
+        await busy
+        await asyncio.sleep(0.05)  # let the worker reach the expired job
+
+    asyncio.run(scenario())
+    assert ran == []
+    assert controller.stats()["queue_depth"] == 0
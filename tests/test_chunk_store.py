@@ -0,0 +1,61 @@
+# tests/test_chunk_store.py
+import json
+import sqlite3
+
+import numpy as np
+
+from chunk_store import ADDED_COLUMNS, COLUMNS, ChunkStore, create_chunk_store, delete_chunks, insert_chunks
+from sqlite_pool import ReadOnlyConnectionPool
+
+# chunk_meta as the first release created it, before page_breaks / duplicates
+OLD_SCHEMA = """
+CREATE TABLE chunk_meta (
+    chunk_id INTEGER PRIMARY KEY,
+    pdf TEXT, source_pdf TEXT, title TEXT, text TEXT,
+    chunk_number INTEGER, total_chunks INTEGER, chunk_len INTEGER,
+    page_start INTEGER, page_end INTEGER, is_first_paragraph INTEGER
+)
+"""
+
+
+def chunk(chunk_id, **extra):
+    return {"chunk_id": chunk_id, "pdf": f"a_chunk{chunk_id}.pdf", "source_pdf": "a.pdf", "title": "A",
+            "text": f"text {chunk_id}", "chunk_number": chunk_id, "total_chunks": 3, "chunk_len": 6,
+            "page_start": 1, "page_end": 1, "is_first_paragraph": int(chunk_id == 1), **extra}
+
+
+def columns(conn):
+    return [row[1] for row in conn.execute("PRAGMA table_info(chunk_meta)")]
+
+
+def test_migrates_old_table_in_place(tmp_path):
+    db = str(tmp_path / "chunks.db")
+    conn = sqlite3.connect(db)
+    conn.execute(OLD_SCHEMA)
+    conn.execute("INSERT INTO chunk_meta (chunk_id, pdf, text) VALUES (1, 'a_chunk1.pdf', 'old row')")
+    create_chunk_store(conn)
+    assert columns(conn) == list(COLUMNS)
+    assert all(c in columns(conn) for c in ADDED_COLUMNS)
+    assert conn.execute("SELECT text, page_breaks, duplicates FROM chunk_meta").fetchall() == [("old row", None, None)]
+    create_chunk_store(conn)  # idempotent
+    assert columns(conn) == list(COLUMNS)
+
+
+def test_insert_reads_back_and_delete(tmp_path):
+    db = str(tmp_path / "chunks.db")
+    conn = sqlite3.connect(db)
+    create_chunk_store(conn)
+    dup = [{"chunk_id": 9, "source_pdf": "b.pdf"}]
+    with conn:
+        insert_chunks(conn, [chunk(1, page_breaks=[[0, 1]]), chunk(2, duplicates=dup), chunk(3)])
+        delete_chunks(conn, [3])
+    conn.close()
+
+    store = ChunkStore(ReadOnlyConnectionPool(db))
+    assert store.count() == 2
+    rows = store.get([2, 1, 3], columns=("pdf", "duplicates", "page_breaks"))
+    assert set(rows) == {1, 2}
+    assert json.loads(rows[2]["duplicates"]) == dup  # lists are stored as JSON
+    assert json.loads(rows[1]["page_breaks"]) == [[0, 1]]
+    assert store.exists(np.array([1, 3])).tolist() == [True, False]
+    assert store.has_column("duplicates")
@@ -0,0 +1,43 @@
+# tests/test_cross_encoder.py
+import time
+
+import numpy as np
+
+from cross_encoder import CrossEncoderReranker
+
+
+class OverlapModel:
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, pairs, batch_size):
+        self.calls += 1
+        return np.array([len(set(q.split()) & set(t.split())) for q, t in pairs], dtype="float32")
+
+
+def test_scores_in_batches_and_caches():
+    model = OverlapModel()
+    reranker = CrossEncoderReranker(lambda: model, batch_size=2)
+    texts = ["laser scanner", "robot", "laser", "scanner zone"]
+    scores = reranker.score("laser scanner", [1, 2, 3, 4], texts)
+    assert scores.tolist() == [2, 0, 1, 1] and model.calls == 2
+    assert reranker.score("Laser  Scanner", [1, 2, 3, 4], texts).tolist() == [2, 0, 1, 1]
+    assert model.calls == 2  # served from the cache (normalized query, chunk_id)
+
+
+def test_past_deadline_falls_back():
+    reranker = CrossEncoderReranker(OverlapModel)
+    assert reranker.score("q", [1], ["q"], deadline=time.perf_counter() - 1) is None
+    assert reranker.stats()["fallbacks"] == 1
+
+
+def test_model_still_loading_falls_back_without_loading_it():
+    loads = []
+    reranker = CrossEncoderReranker(lambda: loads.append(1) or OverlapModel(), model_ready=lambda: False)
+    assert reranker.score("laser", [1, 2], ["laser", "robot"]) is None
+    assert loads == [] and reranker.stats()["fallbacks"] == 1
+
+    # fully cached candidates need no model at all
+    reranker.cache.put(("laser", 1), 3.0)
+    assert reranker.score("laser", [1], ["laser"]).tolist() == [3.0]
+    assert loads == []
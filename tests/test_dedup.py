@@ -0,0 +1,89 @@
+# tests/test_dedup.py
+import sqlite3
+
+import pytest
+
+from chunk_store import create_chunk_store, insert_chunks
+from dedup import NearDuplicateIndex, StoredNearDuplicateIndex, duplicate_ref
+
+WORDS = ("guard interlock sensor operator hazard machine stop reset light curtain "
+         "laser scanner zone muting brake torque valve pressure lockout tagout").split()
+
+
+def passage(seed, n=120):
+    return " ".join(WORDS[(seed * 7 + i * i + i) % len(WORDS)] + str(i % 13) for i in range(n))
+
+
+def test_identical_text_is_a_duplicate():
+    index = NearDuplicateIndex(threshold=0.8)
+    assert index.add(1, passage(1)) is None
+    assert index.add(2, passage(1)) == 1
+    assert len(index) == 1  # duplicates are not indexed
+
+
+def test_unrelated_text_is_canonical():
+    index = NearDuplicateIndex(threshold=0.5)
+    assert index.add(1, passage(1)) is None
+    assert index.add(2, passage(2)) is None
+    assert len(index) == 2
+
+
+def test_threshold_decides_near_duplicates():
+    original = passage(3)
+    words = original.split()
+    words[60] = "changed"
+    edited = " ".join(words)
+    # one changed word touches 5 of ~116 shingles: Jaccard ~0.92
+    loose = NearDuplicateIndex(threshold=0.8)
+    loose.add(1, original)
+    assert loose.add(2, edited) == 1
+    strict = NearDuplicateIndex(threshold=0.99)
+    strict.add(1, original)
+    assert strict.add(2, edited) is None
+
+
+def test_bands_must_divide_permutations():
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(num_perm=128, bands=10)
+
+
+def test_duplicate_ref_keeps_citation_fields_only():
+    chunk = {"chunk_id": 7, "pdf": "a_chunk2.pdf", "source_pdf": "a.pdf", "title": "A", "chunk_number": 2,
+             "page_start": 3, "page_end": 4, "text": "long text"}
+    ref = duplicate_ref(chunk)
+    assert "text" not in ref
+    assert ref["chunk_id"] == 7 and ref["source_pdf"] == "a.pdf" and ref["page_end"] == 4
+
+
+def test_stored_index_matches_like_the_in_memory_one(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "chunks.db"))
+    stored = StoredNearDuplicateIndex(conn, threshold=0.8)
+    memory = NearDuplicateIndex(threshold=0.8)
+    texts = [passage(1), passage(2), passage(1), passage(3), passage(2)]
+    for key, text in enumerate(texts, start=1):
+        assert stored.add(key, text) == memory.add(key, text)
+    assert len(stored) == len(memory) == 3
+    conn.commit()
+
+    # signatures survive reopening, so a later run only signs its own chunks
+    reopened = StoredNearDuplicateIndex(sqlite3.connect(str(tmp_path / "chunks.db")), threshold=0.8)
+    assert reopened.add(10, passage(3)) == 4
+
+
+def test_removed_chunks_no_longer_match(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "chunks.db"))
+    index = StoredNearDuplicateIndex(conn, threshold=0.8)
+    index.add(1, passage(1))
+    index.remove([1, 99])
+    assert len(index) == 0
+    assert conn.execute("SELECT COUNT(*) FROM dedup_buckets").fetchone()[0] == 0
+    assert index.add(2, passage(1)) is None
+
+
+def test_unsigned_lists_chunk_meta_rows_without_a_signature(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "chunks.db"))
+    create_chunk_store(conn)
+    insert_chunks(conn, [{"chunk_id": i, "text": passage(i)} for i in (1, 2, 3)])
+    index = StoredNearDuplicateIndex(conn)
+    index.insert(2, index.signature(passage(2)))
+    assert index.unsigned() == [1, 3]
@@ -0,0 +1,29 @@
+# tests/test_filters.py
+import numpy as np
+import pytest
+
+from index_builder import build_index
+from query_cache import LRUCache
+
+
+class FixedMetadata:
+    def resolve(self, **filters):
+        return np.array([2, 4], dtype="int64")
+
+
+@pytest.mark.parametrize("labels", ["row", "chunk_id"])
+def test_resolve_filter_translates_chunk_ids_to_index_labels(ask_api, monkeypatch, labels):
+    x = np.random.RandomState(0).rand(5, 8).astype("float32")
+    ids = np.arange(1, 6) if labels == "chunk_id" else None
+    index, _ = build_index(x, "flat", ids=ids)
+    monkeypatch.setattr(ask_api, "SHARDED", False)
+    monkeypatch.setattr(ask_api, "selection_cache", LRUCache(8))
+    monkeypatch.setattr(ask_api, "get_metadata_index", lambda: FixedMetadata())
+    monkeypatch.setattr(ask_api, "get_index", lambda: (index, {"labels": labels}))
+
+    selection = ask_api.resolve_filter(ask_api.SearchFilter(page_min=1))
+    assert selection["ids"].tolist() == [2, 4] and selection["json"] == "[2, 4]"
+    _, I = index.search(x[:1], 5, params=selection["faiss"])
+    found = sorted(int(i) for i in I[0] if i >= 0)
+    # a row-labelled index holds chunk_id c in row c - 1
+    assert found == ([1, 3] if labels == "row" else [2, 4])
@@ -0,0 +1,47 @@
+# tests/test_fused_retrieval.py
+import threading
+
+import numpy as np
+
+
+def test_fuse_joins_on_chunk_id(ask_api):
+    cand = ask_api._fuse(np.array([5, 3, 9]), np.array([0.9, 0.8, 0.7]),
+                         np.array([9, 2, 5]), np.array([4.0, 3.0, 2.0]))
+    # vector hits first, in their order, then keyword-only hits
+    assert cand["ids"].tolist() == [5, 3, 9, 2]
+    assert cand["vector"].tolist() == [0.9, 0.8, 0.7, 0.0]
+    assert cand["keyword"].tolist() == [2.0, 0.0, 4.0, 3.0]
+
+
+def test_fuse_with_one_side_empty(ask_api):
+    none, no_scores = np.array([], dtype="int64"), np.array([])
+    cand = ask_api._fuse(np.array([4, 1]), np.array([0.5, 0.4]), none, no_scores)
+    assert cand["ids"].tolist() == [4, 1] and cand["keyword"].tolist() == [0.0, 0.0]
+    cand = ask_api._fuse(none, no_scores, np.array([7]), np.array([1.5]))
+    assert cand["ids"].tolist() == [7] and cand["vector"].tolist() == [0.0] and cand["keyword"].tolist() == [1.5]
+
+
+def test_fused_retrieval_runs_both_searches_once(ask_api, monkeypatch):
+    calls = []
+
+    def vector_candidates(query, n, selection):
+        calls.append(("vector", query, n, selection, threading.current_thread().name))
+        return np.array([1, 2]), np.array([0.9, 0.1])
+
+    def keyword_candidates(query, n, selection):
+        calls.append(("keyword", query, n, selection, threading.current_thread().name))
+        return np.array([2, 3]), np.array([5.0, 1.0])
+
+    monkeypatch.setattr(ask_api, "vector_candidates", vector_candidates)
+    monkeypatch.setattr(ask_api, "keyword_candidates", keyword_candidates)
+    selection = {"ids": np.array([1, 2, 3])}
+    cand = ask_api.fused_retrieval("laser safety", 6, selection)
+
+    assert cand["ids"].tolist() == [1, 2, 3]
+    assert cand["vector"].tolist() == [0.9, 0.1, 0.0]
+    assert cand["keyword"].tolist() == [0.0, 5.0, 1.0]
+    assert sorted(c[:4] for c in calls) == [("keyword", "laser safety", 6, selection),
+                                            ("vector", "laser safety", 6, selection)]
+    # the FAISS side runs on the retrieval pool while FTS5 runs in the caller
+    threads = {c[0]: c[4] for c in calls}
+    assert threads["vector"].startswith("retrieval") and threads["keyword"] == threading.current_thread().name
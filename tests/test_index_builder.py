@@ -0,0 +1,72 @@
+# tests/test_index_builder.py
+import faiss
+import numpy as np
+import pytest
+
+from index_builder import INDEX_TYPES, build_index, read_index, selector_params, set_search_params, write_index
+
+
+def vectors(n=400, dim=16, seed=0):
+    return np.random.RandomState(seed).rand(n, dim).astype("float32")
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_read_index_round_trip(tmp_path, index_type):
+    x = vectors()
+    index, params = build_index(x, index_type, nlist=4, pq_m=4)
+    path = str(tmp_path / "faiss_index.bin")
+    write_index(index, path, {"index_type": index_type, "metric": "l2", "params": params, "search": {}})
+
+    loaded, info = read_index(path)
+    assert info["index_type"] == index_type and info["params"] == params
+    assert info["ntotal"] == len(x) and info["dim"] == x.shape[1]
+    assert info["labels"] == "row"  # no ids were passed
+    assert loaded.ntotal == len(x)
+    _, I = loaded.search(x[:1], 1)
+    if index_type != "ivfpq":  # PQ codes are lossy
+        assert I[0][0] == 0
+
+
+def test_read_index_without_sidecar_is_legacy_flat_l2(tmp_path):
+    path = str(tmp_path / "faiss_index.bin")
+    legacy = faiss.IndexFlatL2(16)
+    legacy.add(vectors(10))
+    faiss.write_index(legacy, path)
+
+    _, info = read_index(path)
+    assert (info["index_type"], info["metric"], info["labels"]) == ("flat", "l2", "row")
+
+
+def test_build_index_rejects_unknown_options():
+    with pytest.raises(ValueError):
+        build_index(vectors(10), "lsh")
+    with pytest.raises(ValueError):
+        build_index(vectors(10), "flat", metric="cosine")
+    with pytest.raises(ValueError):
+        build_index(vectors(100), "ivfpq", nlist=2, pq_m=5)
+
+
+def test_ip_metric_returns_cosine_similarity():
+    x = vectors(50) * 10  # unnormalized on purpose
+    index, _ = build_index(x, "flat", metric="ip")
+    q = x[:1] * 3
+    faiss.normalize_L2(q)
+    D, I = index.search(q, 2)
+    assert I[0][0] == 0 and D[0][0] == pytest.approx(1.0, abs=1e-5)
+    assert D[0][1] < D[0][0] <= 1.0 + 1e-5
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+def test_selector_params_restrict_search_to_labels(index_type):
+    x = vectors()
+    index, _ = build_index(x, index_type, nlist=4, ids=np.arange(1, len(x) + 1))
+    set_search_params(index, nprobe=4, ef_search=64)
+    allowed = np.array([5, 50, 300])
+    D, I = index.search(x[:1], 3, params=selector_params(index, allowed))
+    assert sorted(I[0].tolist()) == allowed.tolist()
+    # nprobe / efSearch set on the index are carried into the explicit parameters
+    params = selector_params(index, allowed)
+    if index_type == "ivf":
+        assert params.nprobe == 4
+    elif index_type == "hnsw":
+        assert params.efSearch == 64
@@ -0,0 +1,183 @@
+# tests/test_ingest.py
+# ingest.main() end to end on a temporary project: "PDFs" are text files (pages split by
+# form feeds) and embeddings are hashed bags of words, so no parser or model is needed.
+import json
+import os
+import re
+import sqlite3
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+import ingest
+from index_builder import read_index, stored_ids
+from pdfread import chunk_pages
+
+WORDS_PER_CHUNK = 20
+
+
+def fake_chunk_pdf(path, title):
+    with open(path, "r", encoding="utf-8") as f:
+        pages = f.read().split("\f")
+    return chunk_pages(list(enumerate(pages, start=1)), os.path.basename(path), title, WORDS_PER_CHUNK)
+
+
+def fake_encode(texts):
+    out = np.zeros((len(texts), 32), dtype="float32")
+    for i, text in enumerate(texts):
+        for word in re.findall(r"\w+", text.lower()):
+            out[i, zlib.crc32(word.encode()) % 32] += 1
+    return out
+
+
+def document(seed, n_words=60):
+    vocab = [f"w{i}" for i in range(500)]
+    return " ".join(np.random.RandomState(seed).choice(vocab, n_words))
+
+
+class Project:
+    def __init__(self, root, monkeypatch):
+        self.root = root
+        self.pdf_dir = root / "ispdfs"
+        self.pdf_dir.mkdir()
+        self.monkeypatch = monkeypatch
+        for name, file in (("FAISS_INDEX", "faiss_index.bin"), ("METADATA_FILE", "metadata.json"),
+                           ("DB_FILE", "chunks.db"), ("MANIFEST_FILE", "ingest_manifest.json"),
+                           ("SENTENCE_META_FILE", "sentences.meta.npy")):
+            monkeypatch.setattr(ingest, name, str(root / file))
+        monkeypatch.setattr(ingest, "PDF_FOLDER", str(self.pdf_dir))
+        monkeypatch.setattr(ingest, "load_sources", lambda: {})
+        monkeypatch.setattr(ingest, "chunk_pdf", fake_chunk_pdf)
+        monkeypatch.setattr(ingest, "encode", fake_encode)
+
+    def write(self, name, text):
+        (self.pdf_dir / name).write_text(text, encoding="utf-8")
+
+    def remove(self, name):
+        (self.pdf_dir / name).unlink()
+
+    def ingest(self, *args):
+        self.monkeypatch.setattr(sys, "argv", ["ingest.py", *args])
+        ingest.main()
+
+    def index_ids(self):
+        index, info = read_index(ingest.FAISS_INDEX)
+        assert info["labels"] == "chunk_id"
+        return sorted(int(i) for i in stored_ids(index))
+
+    def query(self, sql):
+        conn = sqlite3.connect(ingest.DB_FILE)
+        try:
+            return conn.execute(sql).fetchall()
+        finally:
+            conn.close()
+
+    def meta(self):
+        """chunk_id -> chunk_ids collapsed onto it"""
+        rows = self.query("SELECT chunk_id, duplicates FROM chunk_meta ORDER BY chunk_id")
+        return {cid: [d["chunk_id"] for d in json.loads(dups or "[]")] for cid, dups in rows}
+
+    def fts_ids(self):
+        return sorted(row[0] for row in self.query("SELECT rowid FROM chunks"))
+
+    def manifest(self):
+        with open(ingest.MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return {doc["file"]: doc["chunk_ids"] for doc in json.load(f)["documents"].values()}
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    return Project(tmp_path, monkeypatch)
+
+
+def test_adds_then_removes_documents(project):
+    project.write("a.pdf", document(1))
+    project.write("b.pdf", document(2))
+    project.ingest()
+    assert project.manifest() == {"a.pdf": [1, 2, 3], "b.pdf": [4, 5, 6]}
+    assert project.index_ids() == project.fts_ids() == sorted(project.meta()) == [1, 2, 3, 4, 5, 6]
+
+    project.remove("a.pdf")
+    project.write("c.pdf", document(3, n_words=30))
+    project.ingest()
+    # chunk_ids are never reused
+    assert project.manifest() == {"b.pdf": [4, 5, 6], "c.pdf": [7, 8]}
+    assert project.index_ids() == project.fts_ids() == sorted(project.meta()) == [4, 5, 6, 7, 8]
+
+
+def test_unchanged_or_renamed_folder_is_a_no_op(project, capsys):
+    project.write("a.pdf", document(1))
+    project.ingest()
+    capsys.readouterr()
+    os.rename(project.pdf_dir / "a.pdf", project.pdf_dir / "renamed.pdf")
+    project.ingest()
+    assert "Nothing to ingest" in capsys.readouterr().out
+    assert project.manifest() == {"renamed.pdf": [1, 2, 3]}
+    assert project.index_ids() == [1, 2, 3]
+
+
+def test_rebuild_starts_over(project):
+    project.write("a.pdf", document(1))
+    project.ingest()
+    project.ingest("--rebuild")
+    assert project.manifest() == {"a.pdf": [1, 2, 3]}
+    assert project.index_ids() == project.fts_ids() == sorted(project.meta()) == [1, 2, 3]
+
+
+def test_near_duplicate_pdf_is_collapsed_then_promoted(project):
+    project.write("a.pdf", document(1))
+    project.ingest()
+    project.write("copy.pdf", document(1) + "\n")  # same text, different file hash
+    project.ingest()
+    assert project.manifest()["copy.pdf"] == [4, 5, 6]
+    assert project.meta() == {1: [4], 2: [5], 3: [6]}
+    assert project.index_ids() == project.fts_ids() == [1, 2, 3]
+
+    # the canonical PDF goes away: its duplicates are re-chunked, embedded and indexed
+    project.remove("a.pdf")
+    project.ingest()
+    assert project.meta() == {4: [], 5: [], 6: []}
+    assert project.index_ids() == project.fts_ids() == [4, 5, 6]
+
+    # promoted chunks are signed too, so the original now collapses onto them
+    project.write("a.pdf", document(1))
+    project.ingest()
+    assert project.meta() == {4: [7], 5: [8], 6: [9]}
+    assert project.index_ids() == [4, 5, 6]
+
+
+def test_runs_only_sign_the_chunks_they_add(project, monkeypatch):
+    signed = []
+    signature = ingest.StoredNearDuplicateIndex.signature
+    monkeypatch.setattr(ingest.StoredNearDuplicateIndex, "signature",
+                        lambda self, text: signed.append(text) or signature(self, text))
+    project.write("a.pdf", document(1))
+    project.write("b.pdf", document(2))
+    project.ingest()
+    assert len(signed) == 6
+
+    del signed[:]
+    project.write("c.pdf", document(3, n_words=30))
+    project.ingest()
+    assert len(signed) == 2
+
+    # a corpus from before the dedup tables is signed once, in the next run that adds chunks
+    project.query("DROP TABLE dedup_signatures")
+    project.query("DROP TABLE dedup_buckets")
+    del signed[:]
+    project.write("d.pdf", document(4, n_words=20))
+    project.ingest()
+    assert len(signed) == 8 + 1
+
+
+def test_metadata_json_is_only_written_on_request(project):
+    project.write("a.pdf", document(1))
+    project.ingest()
+    assert not os.path.exists(ingest.METADATA_FILE)
+    project.ingest("--export-metadata")
+    with open(ingest.METADATA_FILE, "r", encoding="utf-8") as f:
+        exported = json.load(f)
+    assert [c["chunk_id"] for c in exported] == [1, 2, 3]
+    assert exported[0]["source_pdf"] == "a.pdf" and exported[0]["page_breaks"] == [[0, 1]]
@@ -0,0 +1,39 @@
+# tests/test_latency_histogram.py
+import random
+
+from run_questions import LatencyHistogram
+
+
+def test_empty_histogram():
+    hist = LatencyHistogram()
+    assert hist.percentile(50) == 0.0
+    assert hist.summary()["n"] == 0
+
+
+def test_percentiles_within_precision():
+    rng = random.Random(0)
+    samples = [rng.lognormvariate(3, 1) for _ in range(20000)]
+    hist = LatencyHistogram(precision=0.01)
+    for ms in samples:
+        hist.record(ms)
+    samples.sort()
+    for p in (50, 90, 99):
+        exact = samples[int(p / 100 * len(samples)) - 1]
+        assert abs(hist.percentile(p) - exact) / exact < 0.02
+
+
+def test_top_percentile_is_capped_at_max():
+    hist = LatencyHistogram()
+    for ms in (1.0, 2.0, 3.0):
+        hist.record(ms)
+    assert hist.percentile(100) == 3.0
+    assert hist.summary()["max"] == 3.0
+    assert hist.summary()["mean"] == 2.0
+
+
+def test_values_below_min_share_the_first_bucket():
+    hist = LatencyHistogram(min_ms=0.01)
+    hist.record(0.0)
+    hist.record(0.001)
+    assert list(hist.counts) == [0]
+    assert sum(count for _, count in hist.buckets()) == 2
@@ -0,0 +1,106 @@
+# tests/test_learned_reranker.py
+import joblib
+import numpy as np
+import pytest
+
+from learned_reranker import (FEATURES, ChunkFeatureCache, feature_matrix, load_reranker, qrels_folds, rerank,
+                              save_reranker, train_learned_reranker)
+
+CHUNKS = {
+    1: {"chunk_number": 1, "total_chunks": 3, "is_first_paragraph": 1, "chunk_len": 9, "text": "Laser scanner safety"},
+    2: {"chunk_number": 3, "total_chunks": 3, "is_first_paragraph": 0, "chunk_len": 99, "text": "Robot guard"},
+    3: {"chunk_number": 1, "total_chunks": 1, "is_first_paragraph": 1, "chunk_len": 0, "text": "the laser"},
+}
+
+
+class FakeStore:
+    def __init__(self):
+        self.calls = []
+
+    def get(self, chunk_ids, columns):
+        self.calls.append(list(chunk_ids))
+        return {i: dict(CHUNKS[i]) for i in chunk_ids}
+
+
+class FixedScores:
+    def __init__(self, scores):
+        self.scores = np.asarray(scores, dtype="float64")
+
+    def predict_proba(self, X):
+        return np.column_stack([1 - self.scores, self.scores])
+
+
+def candidates(ids, vector, keyword):
+    return {"ids": np.array(ids), "vector": np.array(vector, dtype="float64"),
+            "keyword": np.array(keyword, dtype="float64")}
+
+
+def test_feature_matrix_columns():
+    cand = candidates([1, 2, 3], [0.9, 0.5, 0.1], [7.5, 0.0, 2.0])
+    X = feature_matrix("How do I use the laser scanner?", cand, ChunkFeatureCache(FakeStore()))
+    assert X.shape == (3, len(FEATURES))
+    assert X[:, 0].tolist() == [0.9, 0.5, 0.1] and X[:, 1].tolist() == [7.5, 0.0, 2.0]
+    # query terms without stopwords: use, laser, scanner
+    assert X[:, 2].tolist() == pytest.approx([2 / 3, 0, 1 / 3])
+    assert X[:, 3].tolist() == [0.0, 1.0, 0.0]  # position in the document
+    assert X[:, 4].tolist() == [1, 0, 1]
+    assert X[:, 5].tolist() == pytest.approx(np.log1p([9, 99, 0]))
+
+
+def test_chunk_features_are_read_once():
+    store = FakeStore()
+    cache = ChunkFeatureCache(store)
+    cache.get([1, 2])
+    cache.get([2, 3, 1])
+    assert store.calls == [[1, 2], [3]]
+    cache.clear()
+    cache.get([1])
+    assert store.calls[-1] == [1]
+
+
+def test_rerank_returns_top_k_best_first_stable_on_ties():
+    X = np.zeros((5, len(FEATURES)))
+    order, scores = rerank(FixedScores([0.2, 0.9, 0.5, 0.9, 0.1]), X, 3)
+    assert order.tolist() == [1, 3, 2] and scores.tolist() == [0.9, 0.9, 0.5]
+    order, _ = rerank(FixedScores([0.2, 0.9]), X[:2], 5)
+    assert order.tolist() == [1, 0]
+
+
+def test_train_save_and_load(tmp_path):
+    def retrieve(query, n):
+        return candidates([1, 2, 3], [0.9, 0.2, 0.8], [5.0, 0.0, 4.0])
+
+    model = train_learned_reranker(retrieve, ChunkFeatureCache(FakeStore()), {"laser scanner": {1, 3}})
+    path = str(tmp_path / "reranker.joblib")
+    save_reranker(model, "abc", path)
+    artifact = load_reranker(path)
+    assert artifact["index_fingerprint"] == "abc" and tuple(artifact["features"]) == FEATURES
+    X = feature_matrix("laser scanner", retrieve("", 3), ChunkFeatureCache(FakeStore()))
+    order, _ = rerank(artifact["model"], X, 3)
+    assert order[-1] == 1  # the irrelevant chunk ranks last
+
+    joblib.dump({**artifact, "version": 1}, path)
+    with pytest.raises(ValueError):
+        load_reranker(path)
+
+
+def test_training_needs_both_labels():
+    def retrieve(query, n):
+        return candidates([1, 2], [0.9, 0.2], [5.0, 0.0])
+
+    with pytest.raises(ValueError):
+        train_learned_reranker(retrieve, ChunkFeatureCache(FakeStore()), {"robot": {7}})
+
+
+def test_qrels_folds_are_disjoint_balanced_and_stable():
+    qrels = {f"q{i}": {i} for i in range(8)}
+    folds = qrels_folds(qrels, 3)
+    assert [len(f) for f in folds] == [3, 3, 2]
+    merged = {}
+    for fold in folds:
+        assert not set(fold) & set(merged)
+        merged.update(fold)
+    assert merged == qrels
+    assert qrels_folds(dict(reversed(list(qrels.items()))), 3) == folds
+    # more folds than questions: one question per fold
+    assert len(qrels_folds({"a": {1}, "b": {2}}, 5)) == 2
@@ -0,0 +1,51 @@
+# tests/test_metadata_index.py
+import sqlite3
+
+import pytest
+
+from chunk_store import create_chunk_store, insert_chunks
+from metadata_index import MetadataIndex
+
+
+def chunk(cid, pdf, title, pages, number, duplicates=None):
+    return {"chunk_id": cid, "source_pdf": pdf, "title": title, "page_start": pages[0], "page_end": pages[1],
+            "chunk_number": number, "text": f"chunk {cid}", "duplicates": duplicates}
+
+
+@pytest.fixture
+def metadata():
+    conn = sqlite3.connect(":memory:")
+    create_chunk_store(conn)
+    insert_chunks(conn, [
+        chunk(1, "Laser.pdf", "Laser Safety Guide", (1, 1), 1),
+        chunk(2, "Laser.pdf", "Laser Safety Guide", (1, 3), 2),
+        chunk(3, "robots.pdf", "Robot Cells", (5, 6), 1,
+              duplicates=[{"chunk_id": 9, "source_pdf": "copy.pdf", "title": "Copied Deck",
+                           "page_start": 40, "page_end": 40, "chunk_number": 7}]),
+        chunk(4, "robots.pdf", "Robot Cells", (7, 7), 2),
+    ])
+    return MetadataIndex(conn)
+
+
+def test_no_filter_resolves_to_none(metadata):
+    assert metadata.resolve() is None
+
+
+def test_pdf_and_title_filters(metadata):
+    assert metadata.resolve(source_pdf=["laser.PDF"]).tolist() == [1, 2]
+    assert metadata.resolve(source_pdf=["missing.pdf"]).tolist() == []
+    assert metadata.resolve(title="robot").tolist() == [3, 4]
+    assert metadata.resolve(source_pdf=["laser.pdf"], title="robot").tolist() == []
+
+
+def test_page_and_position_ranges(metadata):
+    # page_min/page_max keep chunks that overlap the range
+    assert metadata.resolve(page_min=3, page_max=5).tolist() == [2, 3]
+    assert metadata.resolve(chunk_max=1).tolist() == [1, 3]
+    assert metadata.resolve(source_pdf=["robots.pdf"], page_min=7).tolist() == [4]
+
+
+def test_collapsed_duplicates_match_through_their_canonical_chunk(metadata):
+    assert metadata.resolve(source_pdf=["copy.pdf"]).tolist() == [3]
+    assert metadata.resolve(page_min=40).tolist() == [3]
+    assert metadata.resolve(chunk_min=7).tolist() == [3]
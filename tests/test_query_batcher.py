@@ -0,0 +1,55 @@
+# tests/test_query_batcher.py
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from query_batcher import QueryBatcher
+
+
+def fake_encode(calls):
+    def encode(texts):
+        calls.append(list(texts))
+        return np.array([[float(len(t)), float(i)] for i, t in enumerate(texts)])
+    return encode
+
+
+def test_concurrent_queries_share_one_encode():
+    calls = []
+    batcher = QueryBatcher(fake_encode(calls), max_batch_size=8, max_wait_ms=200)
+    queries = ["a", "bb", "ccc", "dddd"]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        vecs = list(pool.map(batcher.encode, queries))
+    assert len(calls) == 1 and sorted(calls[0]) == sorted(queries)
+    # every caller gets its own row back
+    for q, vec in zip(queries, vecs):
+        assert vec[0] == len(q)
+        assert calls[0][int(vec[1])] == q
+    stats = batcher.stats()
+    assert stats["batches"] == 1 and stats["queries"] == 4 and stats["batch_size_histogram"] == {4: 1}
+
+
+def test_batches_are_capped_at_max_batch_size():
+    calls = []
+    batcher = QueryBatcher(fake_encode(calls), max_batch_size=2, max_wait_ms=100)
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        list(pool.map(batcher.encode, ["q1", "q2", "q3", "q4", "q5"]))
+    assert sum(len(c) for c in calls) == 5
+    assert max(len(c) for c in calls) == 2
+
+
+def test_encode_errors_reach_every_caller_and_batcher_recovers():
+    fail = threading.Event()
+    fail.set()
+
+    def encode(texts):
+        if fail.is_set():
+            raise RuntimeError("model failed")
+        return np.ones((len(texts), 2))
+
+    batcher = QueryBatcher(encode, max_batch_size=4, max_wait_ms=1)
+    with pytest.raises(RuntimeError, match="model failed"):
+        batcher.encode("q")
+    fail.clear()
+    assert batcher.encode("q").tolist() == [1.0, 1.0]
@@ -0,0 +1,47 @@
+# tests/test_sentence_index.py
+import numpy as np
+
+from sentence_index import SentenceIndex, page_of, split_sentences
+
+
+def sentences(text, **kwargs):
+    return [text[s:e] for s, e in split_sentences(text, **kwargs)]
+
+
+def test_splits_on_sentence_ends_and_bullets():
+    text = "Wear eye protection near the laser. Keep the guard closed at all times!  • Stop the robot before entering the cell"
+    assert sentences(text) == ["Wear eye protection near the laser.", "Keep the guard closed at all times!",
+                               "Stop the robot before entering the cell"]
+
+
+def test_keeps_abbreviations_and_drops_fragments():
+    # no split before a lowercase word; fragments under min_words are dropped
+    text = "Use approx. three metres of clearance. See p. 4. Fig. 2"
+    assert sentences(text) == ["Use approx. three metres of clearance."]
+
+
+def test_cuts_run_ons_at_word_boundaries():
+    text = " ".join(["word"] * 50)
+    parts = sentences(text, max_chars=60)
+    assert all(len(p) <= 60 for p in parts)
+    assert " ".join(parts) == text
+
+
+def test_page_of_follows_page_breaks():
+    breaks = [[0, 3], [40, 4], [90, 5]]
+    assert [page_of(o, breaks, 3) for o in (0, 39, 40, 200)] == [3, 3, 4, 5]
+    assert page_of(10, None, 7) == 7
+
+
+def test_best_scores_only_the_requested_chunks(tmp_path):
+    vectors = np.array([[1, 0], [0, 1], [0.8, 0.6], [1, 0]], dtype="float16")
+    # (chunk_id, char_start, char_end, page), sorted by chunk_id
+    meta = np.array([[1, 0, 10, 1], [1, 11, 20, 1], [2, 0, 15, 3], [5, 0, 9, 8]], dtype="int64")
+    np.save(tmp_path / "v.npy", vectors)
+    np.save(tmp_path / "m.npy", meta)
+    index = SentenceIndex(str(tmp_path / "v.npy"), str(tmp_path / "m.npy"))
+
+    top = index.best(np.array([[2.0, 0.0]]), [1, 2], top_n=2)
+    assert [(t["chunk_id"], t["char_start"], t["page"]) for t in top] == [(1, 0, 1), (2, 0, 3)]
+    assert top[0]["score"] == 1.0 and abs(top[1]["score"] - 0.8) < 1e-3
+    assert index.best(np.array([[1.0, 0.0]]), [3, 4]) == []
@@ -0,0 +1,122 @@
+# tests/test_shards.py
+import json
+import sqlite3
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+from shards import KEYWORD_OVERFETCH, ShardCoordinator, track_missing_shards
+from sqlite_pool import KEYWORD_FILTERED_SQL, KEYWORD_SQL, fts_match_expression
+
+
+class FakeShard:
+    """Answers from canned results; "slow" never answers and "broken" raises."""
+
+    def __init__(self, name, vectors=None, keywords=None, behaviour="ok"):
+        self.name = name
+        self.vectors = vectors
+        self.keywords = keywords
+        self.behaviour = behaviour
+        self.calls = []
+
+    def submit(self, method, *args):
+        self.calls.append((method,) + args)
+        future = Future()
+        if self.behaviour == "broken":
+            future.set_exception(RuntimeError(f"{self.name} is down"))
+        elif self.behaviour == "ok":
+            future.set_result(self.vectors if method == "search_vectors" else self.keywords)
+        return future
+
+    def close(self):
+        pass
+
+
+def vectors(dist, labels):
+    return np.array([dist], dtype="float32"), np.array([labels], dtype="int64")
+
+
+def coordinator(shards, metric="ip", timeout_ms=50):
+    return ShardCoordinator(shards, {"index_type": "flat", "metric": metric, "labels": "chunk_id"}, timeout_ms)
+
+
+def test_merges_similarities_best_first():
+    shards = [FakeShard("a", vectors([0.9, 0.5, 0.1], [1, 2, 3])),
+              FakeShard("b", vectors([0.8, 0.7, -1.0], [10, 11, -1]))]
+    D, I = coordinator(shards).search_vectors(np.zeros((1, 4), dtype="float32"), 4)
+    assert I[0].tolist() == [1, 10, 11, 2]
+    assert np.allclose(D[0], [0.9, 0.8, 0.7, 0.5])
+
+
+def test_merges_l2_distances_smallest_first_and_pads():
+    shards = [FakeShard("a", vectors([0.2], [1])), FakeShard("b", vectors([0.1], [2]))]
+    D, I = coordinator(shards, metric="l2").search_vectors(np.zeros((1, 4), dtype="float32"), 3)
+    assert I[0].tolist() == [2, 1, -1]
+    assert D[0][2] == np.inf
+
+
+def test_keyword_candidates_pool_every_shards_hits():
+    # raw bm25 is not comparable across shards, so nothing is cut here: the caller rescores
+    shards = [FakeShard("a", keywords=[(1, -2.0), (2, -1.0)]),
+              FakeShard("b", keywords=[(10, -20.0), (11, -5.0)])]
+    assert coordinator(shards).keyword_candidates("match", 3, {"title": "x"}) == [1, 2, 10, 11]
+    assert shards[0].calls == [("keyword_search", "match", KEYWORD_OVERFETCH * 3, {"title": "x"})]
+
+
+def fts_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE VIRTUAL TABLE chunks USING FTS5(pdf, text, rank_val UNINDEXED)")
+    conn.executemany("INSERT INTO chunks (rowid, pdf, text, rank_val) VALUES (?, ?, ?, ?)",
+                     [(cid, f"c{cid}.pdf", text, cid) for cid, text in rows])
+    conn.commit()
+    return conn
+
+
+def test_rescoring_pooled_candidates_gives_single_index_bm25(tmp_path):
+    rng = np.random.RandomState(0)
+    vocab = ["laser", "scanner", "robot", "guard", "stop", "hazard"] + [f"w{i}" for i in range(40)]
+    rows = [(cid, " ".join(rng.choice(vocab, 30))) for cid in range(1, 61)]
+    full = fts_db(str(tmp_path / "full.db"), rows)
+    # a skewed split, so per-shard term statistics differ from the corpus-wide ones
+    shards = [fts_db(str(tmp_path / "s0.db"), rows[:10]), fts_db(str(tmp_path / "s1.db"), rows[10:])]
+    match, k = fts_match_expression("laser scanner guard"), 8
+
+    single = full.execute(KEYWORD_SQL, (match, k)).fetchall()
+    raw = sorted((r for s in shards for r in s.execute(KEYWORD_SQL, (match, k))), key=lambda r: r[1])[:k]
+    assert [r[0] for r in raw] != [r[0] for r in single]  # shard scores alone rank differently
+
+    candidates = sorted({r[0] for s in shards for r in s.execute(KEYWORD_SQL, (match, KEYWORD_OVERFETCH * k))})
+    rescored = full.execute(KEYWORD_FILTERED_SQL, (match, json.dumps(candidates), k)).fetchall()
+    assert rescored == single
+
+
+def test_sharded_keyword_search_rescores_against_the_full_db(ask_api, monkeypatch):
+    query = "laser scanner safety"
+    single = ask_api.keyword_search(query, 5)
+    if not single:
+        pytest.skip("the built corpus has none of these terms")
+    # a pool wider than the top 5, listed in chunk_id order as the coordinator returns it
+    pool = sorted(r["chunk_id"] for r in ask_api.keyword_search(query, 20))
+
+    class Coordinator:
+        def keyword_candidates(self, match, k, filters):
+            return pool
+
+    monkeypatch.setattr(ask_api, "get_shards", lambda: Coordinator())
+    monkeypatch.setattr(ask_api, "SHARDED", True)
+    assert ask_api.keyword_search(query, 5) == single
+
+
+def test_slow_and_failed_shards_give_partial_results():
+    shards = [FakeShard("a", vectors([0.9], [1])), FakeShard("slow", behaviour="slow"),
+              FakeShard("broken", behaviour="broken")]
+    coord = coordinator(shards, timeout_ms=20)
+    missing = track_missing_shards()
+    D, I = coord.search_vectors(np.zeros((1, 4), dtype="float32"), 2)
+    assert I[0].tolist() == [1, -1]
+    assert missing == {"slow", "broken"}
+    stats = coord.stats()["shards"]
+    assert stats["slow"]["timeouts"] == 1 and stats["broken"]["errors"] == 1
+    assert stats["broken"]["last_error"] == "broken is down"
+    assert stats["a"]["calls"] == 1 and stats["a"]["timeouts"] == stats["a"]["errors"] == 0
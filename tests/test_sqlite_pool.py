@@ -0,0 +1,45 @@
+# tests/test_sqlite_pool.py
+import sqlite3
+import threading
+
+from sqlite_pool import KEYWORD_SQL, ReadOnlyConnectionPool, fts_match_expression
+
+
+def make_db(path, texts):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE VIRTUAL TABLE chunks USING FTS5(pdf, text, rank_val UNINDEXED)")
+    conn.executemany("INSERT INTO chunks (rowid, pdf, text, rank_val) VALUES (?, ?, ?, ?)",
+                     [(i, f"doc_chunk{i}.pdf", text, i) for i, text in enumerate(texts, start=1)])
+    conn.commit()
+    conn.close()
+
+
+def test_match_expression_ors_quoted_non_stopwords():
+    assert fts_match_expression("What are the PPE safety requirements?") == '"ppe" OR "safety" OR "requirements"'
+    assert fts_match_expression('laser "scanner" -- laser; DROP') == '"laser" OR "scanner" OR "drop"'
+    assert fts_match_expression("What is it?") == ""
+
+
+def test_any_term_matches_and_bm25_ranks(tmp_path):
+    db = str(tmp_path / "chunks.db")
+    make_db(db, ["safety requirements for PPE are strict", "general safety notes", "laser scanner setup"])
+    pool = ReadOnlyConnectionPool(db)
+    rows = pool.connection().execute(KEYWORD_SQL, (fts_match_expression("What are PPE safety requirements?"), 5)).fetchall()
+    # not every word has to appear; the chunk with more (and rarer) terms ranks first
+    assert [row[0] for row in rows] == [1, 2]
+    assert rows[0][1] < rows[1][1] < 0
+
+
+def test_one_connection_per_thread_until_reset(tmp_path):
+    db = str(tmp_path / "chunks.db")
+    make_db(db, ["text"])
+    pool = ReadOnlyConnectionPool(db)
+    first = pool.connection()
+    assert pool.connection() is first
+    other = []
+    t = threading.Thread(target=lambda: other.append(pool.connection()))
+    t.start()
+    t.join()
+    assert other[0] is not first
+    pool.reset()
+    assert pool.connection() is not first